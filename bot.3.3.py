@@ -14,7 +14,7 @@ from logging.handlers import RotatingFileHandler # 로그 파일 관리를 위
 
 # 로컬 모듈 임포트
 from prompt import SYSTEM_PROMPT
-from weather import forecast_today, city_map
+from weather import forecast_today_async, city_map, find_weather_city
 
 load_dotenv()
 
@@ -108,23 +108,19 @@ def get_or_create_chat_session(user_id: str):
     return chat_sessions[user_id]
 
 async def generate_response(user_id: str, user_message: str, message_obj: discord.Message = None):
-    supported_cities_kr = list(city_map.keys())
-    if supported_cities_kr:
-        cities_pattern_group = "|".join(re.escape(city) for city in supported_cities_kr)
-        weather_pattern = re.compile(rf"(?i)(?:\? *)?\b({cities_pattern_group})\b\s*(?:은|는|이|가|의)?\s*날씨")
-        match = weather_pattern.search(user_message)
-
-        if match:
-            found_city_kr = match.group(1)
+    if city_map:
+        found_city_kr = find_weather_city(user_message) # 도시 목록이 바뀔 때만 다시 만들어지는 매처
+
+        if found_city_kr:
             logger.info(f"날씨 요청 감지: '{found_city_kr}' (사용자: {user_id}, 원본 메시지: '{user_message}')")
-            forecast_result = forecast_today(found_city_kr)
+            forecast_result = await forecast_today_async(found_city_kr)
             return f"{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
 
         elif user_message.strip().lower().startswith("?날씨") and not user_message.startswith(bot.command_prefix):
             default_city = "서울"
             if default_city in city_map:
                 logger.info(f"일반 날씨 요청 감지 (?날씨). 기본 도시 '{default_city}'로 조회. (사용자: {user_id}, 원본: '{user_message}')")
-                forecast_result = forecast_today(default_city)
+                forecast_result = await forecast_today_async(default_city)
                 return f"어떤 도시인지 정확히 안 알려줘서 일단 {default_city} 날씨를 가져왔어, 선생.\n{forecast_result}\n다른 도시가 궁금하면 '도시이름 날씨' 또는 `?도시이름 날씨`라고 물어봐."
             else:
                 logger.warning(f"경고: 기본 도시 '{default_city}'가 city_map에 없습니다.")
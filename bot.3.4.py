@@ -9,13 +9,28 @@ import google.generativeai as genai
 import asyncio
 import re # 정규 표현식 모듈 추가
 import random
+import time
 import logging # 로깅 모듈 임포트
 from logging.handlers import RotatingFileHandler # 로그 파일 관리를 위해 임포트
 
 # 로컬 모듈 임포트
-from prompt import SYSTEM_PROMPT
-from weather import forecast_today, city_map
-from reaction import send_reaction_gif # reaction.py에서 함수 임포트
+from prompt_build import load_system_prompt
+from weather import forecast_async, detect_forecast_intent, city_map, find_weather_city, resolve_weather_city, geocode_city, should_geocode
+from weather import start_weather_client, close_weather_client
+from weather import weather_prefetcher, weather_client, forecast_cache, forecast_flights, PREFETCH_ENABLED
+from reaction import send_reaction_gif, reaction_index, send_media # reaction.py에서 함수와 반응 GIF 색인 임포트
+from media_cache import media_cache
+from media_registry import media_registry
+from media_transcode import media_transcoder, MediaTooLarge, upload_budget
+from image_catalog import ImageCatalog
+from gemini_dispatch import UserDispatcher
+from session_store import ChatSessionStore
+from history_store import HistoryStore
+from history_window import HistoryWindow
+from prompt_cache import PromptCache
+from stream_reply import StreamingReply, reply_metrics, chunk_text, STREAM_REPLIES
+from rate_limit import RateLimiter, Limit
+from gemini_scheduler import GeminiScheduler, SchedulerBusy, PRIORITY_DM, PRIORITY_MENTION, PRIORITY_PREFIX, PRIORITY_BACKGROUND
 
 load_dotenv()
 
@@ -46,6 +61,8 @@ console_handler.setFormatter(log_formatter)
 logger.addHandler(console_handler)
 # --- 로거 설정 끝 ---
 
+SYSTEM_PROMPT = load_system_prompt() # prompt_build.py로 중복을 없앤 프롬프트 (prompt.py와 체크섬이 안 맞으면 원본)
+
 
 if not DISCORD_TOKEN or not GEMINI_API_KEY:
     logger.critical("DISCORD_TOKEN과 GEMINI_API_KEY를 .env 파일에 반드시 설정하세요!")
@@ -85,13 +102,20 @@ safety_settings = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
 
+GEMINI_MODEL_NAME = "gemini-1.5-flash-002" # 프롬프트 캐시를 쓰려면 버전이 고정된 이름이어야 함 (-latest 별칭은 캐시 불가)
+
 try:
     gemini_model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash-latest",
+        model_name=GEMINI_MODEL_NAME,
         system_instruction=SYSTEM_PROMPT,
         generation_config=generation_config,
         safety_settings=safety_settings
     )
+    summary_model = genai.GenerativeModel( # 오래된 대화 요약용 (페르소나 프롬프트 없이 가볍게)
+        model_name=GEMINI_MODEL_NAME,
+        generation_config=genai.types.GenerationConfig(temperature=0.2, max_output_tokens=600),
+        safety_settings=safety_settings
+    )
     logger.info("Gemini 모델 로드 성공.")
 except Exception as e:
     logger.error(f"Gemini 모델 로드 실패: {e}")
@@ -102,50 +126,136 @@ except Exception as e:
 IMAGE_DIR_NAME = "img" # 'img' 폴더
 REACTION_GIF_DIR = "reaction_gifs" # 반응 GIF 폴더, reaction.py와 일치
 ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"}
-chat_sessions = {}
-
-def get_or_create_chat_session(user_id: str):
-    if user_id not in chat_sessions:
-        chat_sessions[user_id] = gemini_model.start_chat(history=[])
-        logger.info(f"새로운 채팅 세션을 시작합니다: {user_id}")
-    return chat_sessions[user_id]
-
-async def generate_response(user_id: str, user_message: str, message_obj: discord.Message = None):
-    """날씨 요청을 우선 처리하고, 그 외에는 Gemini API를 사용하여 응답을 생성합니다."""
-    supported_cities_kr = list(city_map.keys())
-    if supported_cities_kr: # city_map이 비어있지 않은 경우에만 실행
-        cities_pattern_group = "|".join(re.escape(city) for city in supported_cities_kr)
-        weather_pattern = re.compile(rf"(?i)(?:\? *)?\b({cities_pattern_group})\b\s*(?:은|는|이|가|의)?\s*날씨")
-        match = weather_pattern.search(user_message)
-
-        if match:
-            found_city_kr = match.group(1)
+image_catalog = ImageCatalog(os.path.join(os.path.dirname(os.path.abspath(__file__)), IMAGE_DIR_NAME), ALLOWED_IMAGE_EXTENSIONS,
+                             size_hint=media_transcoder.ready_size, hint_above=upload_budget()) # 너무 큰 그림은 줄인 변형본 크기로 따짐
+gemini_dispatcher = UserDispatcher() # 사용자별로 Gemini 요청을 한 번에 하나씩 보냄
+gemini_scheduler = GeminiScheduler() # 봇 전체의 동시 Gemini 호출 수 제한 + 우선순위 대기열
+rate_limiter = RateLimiter() # 사용자/서버/전체 단위 AI 대화 속도 제한 (막히면 API 호출 없이 답함)
+THROTTLE_REPLIES = {
+    'user': "으헤~ 선생, 그렇게 빨리 연달아 말 걸면 아저씨 지쳐... {wait}초만 쉬었다가 다시 말해줘.",
+    'guild': "으음... 이 서버 선생들이 한꺼번에 불러서 숨 좀 돌려야겠어. {wait}초 뒤에 다시 불러줘~",
+    'global': "우웅... 지금 여기저기서 너무 많이 불러서 정신이 없네. {wait}초만 기다려줄래, 선생?",
+}
+# 개수/추정 메모리/유휴 시간으로 제한되는 세션 저장소. 대기열에 요청이 남은 사용자의 세션은 내보내지 않음
+chat_sessions = ChatSessionStore(is_busy=lambda user_id: gemini_dispatcher.queue_depth(user_id) > 0)
+
+history_store = HistoryStore() # 대화 기록을 SQLite에 남겨 재시작 후에도 이어서 대화
+
+async def summarize_history(transcript: str) -> str:
+    # 요약은 급하지 않으므로 가장 낮은 우선순위. 밀려나면 다음 응답 뒤에 다시 시도됨
+    response = await gemini_scheduler.run(lambda: summary_model.generate_content_async(transcript), PRIORITY_BACKGROUND)
+    return response.text
+
+history_window = HistoryWindow(summarize_history) # 토큰 예산을 넘긴 오래된 대화는 요약으로 접음
+
+def rebuild_gemini_model(model_name: str = GEMINI_MODEL_NAME):
+    """프롬프트 캐시 상태에 맞춰 gemini_model을 다시 만듭니다. 이전 모델에 묶인 세션은 정리 (기록은 history_store에서 되살아남)"""
+    global gemini_model
+    gemini_model = prompt_cache.model(model_name, generation_config=generation_config, safety_settings=safety_settings)
+    chat_sessions.clear()
+
+prompt_cache = PromptCache(SYSTEM_PROMPT, on_invalidate=rebuild_gemini_model) # SYSTEM_PROMPT를 서버 측 캐시로 한 번만 올림
+
+async def get_or_create_chat_session(user_id: str):
+    if user_id in chat_sessions:
+        return chat_sessions.get_or_create(user_id, None) # 최근 사용으로 표시만 함
+    history = await history_store.load(user_id) # 메모리에 없을 때만 저장된 기록을 읽어 되살림
+    def start_new_session():
+        if history:
+            logger.info(f"저장된 대화 기록 {len(history)}턴으로 채팅 세션을 되살립니다: {user_id}")
+        else:
+            logger.info(f"새로운 채팅 세션을 시작합니다: {user_id}")
+        return gemini_model.start_chat(history=history)
+    return chat_sessions.get_or_create(user_id, start_new_session)
+
+async def generate_response(user_id: str, user_message: str, message_obj: discord.Message = None, streamer: StreamingReply = None,
+                            priority: int = PRIORITY_PREFIX):
+    """
+    날씨 요청을 우선 처리하고, 그 외에는 Gemini API를 사용하여 응답을 생성합니다.
+    streamer가 있으면 Gemini 응답을 받는 대로 디스코드에 올립니다. (이 경우 streamer.finished가 True)
+    priority는 Gemini 스케줄러 대기열에서의 순서입니다. (DM > 멘션 > '?')
+    """
+    if city_map: # city_map이 비어있지 않은 경우에만 실행
+        intent, weather_message = detect_forecast_intent(user_message) # '내일', '모레', '주말', '주간' 날씨 구분
+        found_city_kr = find_weather_city(weather_message) # 도시 목록이 바뀔 때만 다시 만들어지는 매처
+
+        if found_city_kr:
             logger.info(f"날씨 요청 감지: '{found_city_kr}' (사용자: {user_id}, 원본 메시지: '{user_message}')")
-            forecast_result = forecast_today(found_city_kr)
+            forecast_result = await forecast_async(found_city_kr, intent)
             return f"{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
 
-        elif user_message.strip().lower().startswith("?날씨") and not user_message.startswith(bot.command_prefix):
+        fuzzy_query, fuzzy_cities = resolve_weather_city(weather_message)
+        if len(fuzzy_cities) == 1:
+            found_city_kr = fuzzy_cities[0]
+            logger.info(f"날씨 요청 감지 (유사 이름 '{fuzzy_query}' -> '{found_city_kr}', 사용자: {user_id})")
+            forecast_result = await forecast_async(found_city_kr, intent)
+            return f"'{fuzzy_query}'... {found_city_kr} 말하는 거지, 선생?\n{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
+        elif len(fuzzy_cities) > 1:
+            logger.info(f"날씨 요청 도시가 모호함: '{fuzzy_query}' -> {fuzzy_cities} (사용자: {user_id})")
+            options = ", ".join(f"'{city} 날씨'" for city in fuzzy_cities[:5])
+            return f"으음... '{fuzzy_query}'가 어디인지 헷갈리네. 혹시 {options} 중에 하나야, 선생?"
+        elif fuzzy_query and should_geocode(weather_message, fuzzy_query): # 직접 묻는 요청만 (잡담 속 '날씨'는 Gemini로)
+            place = await geocode_city(fuzzy_query) # city_map에 없는 도시 (한 번 찾으면 로컬 캐시에서 바로)
+            if place is not None:
+                logger.info(f"날씨 요청 감지 (지오코딩 '{fuzzy_query}' -> {place.name}, 사용자: {user_id})")
+                forecast_result = await forecast_async(fuzzy_query, intent)
+                return f"{forecast_result}\n{place.name} 날씨 정보였어, 선생."
+
+        if weather_message.replace(" ", "").lower().startswith("?날씨") and not user_message.startswith(bot.command_prefix):
             default_city = "서울"
             if default_city in city_map:
                 logger.info(f"일반 날씨 요청 감지 (?날씨). 기본 도시 '{default_city}'로 조회. (사용자: {user_id}, 원본: '{user_message}')")
-                forecast_result = forecast_today(default_city)
+                forecast_result = await forecast_async(default_city, intent)
                 return f"어떤 도시인지 정확히 안 알려줘서 일단 {default_city} 날씨를 가져왔어, 선생.\n{forecast_result}\n다른 도시가 궁금하면 '도시이름 날씨' 또는 `?도시이름 날씨`라고 물어봐."
             else:
                 logger.warning(f"경고: 기본 도시 '{default_city}'가 city_map에 없습니다.")
                 return "날씨를 알려주고 싶은데, 어떤 도시인지 말해줄래, 선생? 예를 들면 '서울 날씨' 이렇게."
 
-    chat_session = get_or_create_chat_session(user_id)
-    try:
-        logger.info(f"Gemini에게 전달 (ID: {user_id}): {user_message[:100]}{'...' if len(user_message) > 100 else ''}") # 메시지 일부만 로깅
-        gemini_response = await chat_session.send_message_async(user_message)
+    async def send_to_gemini(text: str) -> str:
+        chat_session = await get_or_create_chat_session(user_id)
+        # 다 만든 요약을 넣고 컨텍스트 한도를 넘기 전에 미리 잘라냄 (dispatcher 덕분에 이 사용자의 다른 요청은 진행 중이 아님)
+        history_window.fit(user_id, chat_session, text)
+        logger.info(f"Gemini에게 전달 (ID: {user_id}): {text[:100]}{'...' if len(text) > 100 else ''}") # 메시지 일부만 로깅
+
+        async def call_gemini():
+            if streamer is None:
+                started = time.monotonic()
+                response = await chat_session.send_message_async(text)
+                elapsed = time.monotonic() - started
+                reply_metrics.record(elapsed, elapsed)
+                return response
+            streamer.start_timer()
+            response = await chat_session.send_message_async(text, stream=True)
+            try:
+                async for chunk in response:
+                    await streamer.push(chunk_text(chunk))
+            except Exception:
+                chat_session.rewind() # 중간에 끊긴 응답이 세션에 남으면 다음 요청부터 계속 실패함
+                raise
+            await streamer.finish()
+            return response
+
+        # 스트리밍이면 마지막 조각까지 받는 동안 작업자 하나를 차지함
+        gemini_response = await gemini_scheduler.run(call_gemini, priority)
+        chat_sessions.touch(user_id) # 늘어난 대화 기록 크기 반영
+        history_window.after_reply(user_id, chat_session, gemini_response) # 예산을 넘었으면 백그라운드 요약 시작
+        prompt_cache.record_usage(gemini_response) # 캐시 덕분에 아낀 입력 토큰 집계
+        history_store.append_exchange(user_id, text, gemini_response.text)
         return gemini_response.text
+
+    try:
+        # 같은 세션에 동시에 보내지 않도록 사용자별 대기열을 거침. 합쳐진 후속 메시지는 None (답장은 묶음의 첫 메시지에만)
+        return await gemini_dispatcher.submit(user_id, user_message, send_to_gemini)
+    except SchedulerBusy as e:
+        logger.warning(f"Gemini 스케줄러가 바빠 요청을 보내지 않았습니다 (사용자 ID: {user_id}, 이유: {e.reason})")
+        return "으헤~ 지금 선생들이 한꺼번에 말을 걸어서 정신이 하나도 없어... 조금만 있다가 다시 불러줘."
     except Exception as e:
         logger.error(f"Gemini API 호출 중 오류 발생 (사용자 ID: {user_id}): {e}")
         error_str = str(e).lower()
         if "context length" in error_str or "token" in error_str or "size of the request" in error_str:
             logger.warning(f"컨텍스트/요청 크기 문제로 {user_id}의 세션을 초기화합니다.")
-            if user_id in chat_sessions:
-                del chat_sessions[user_id]
+            chat_sessions.discard(user_id)
+            await history_store.clear(user_id) # 넘친 기록을 다시 불러오지 않도록
             return "으음... 방금 무슨 이야기 하고 있었지? 다시 말해줄래, 선생? 머리가 잠깐 하얘졌어~"
         elif "block" in error_str:
             return "으음... 선생, 그건 좀 대답하기 곤란한 내용인 것 같아. 다른 이야기 하자~"
@@ -155,59 +265,32 @@ async def generate_response(user_id: str, user_message: str, message_obj: discor
 # bot.py의 register_reaction_commands 함수 부분
 
 async def register_reaction_commands(bot_instance: commands.Bot):
-    """reaction_gifs 폴더를 스캔하여 GIF 파일의 '기본 이름'으로 명령어를 동적 생성 및 등록"""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    gif_folder_path = os.path.join(script_dir, REACTION_GIF_DIR)
-    
-    # 기본 반응 이름들을 저장할 Set (중복 방지)
-    # 예: SLEEP_1.gif, SLEEP_2.gif -> "SLEEP"만 저장
-    base_reaction_names = set()
+    """반응 GIF 색인(reaction_index)의 '기본 이름'으로 명령어를 동적 생성 및 등록"""
+    # 예: SLEEP_1.gif, SLEEP_2.gif -> "SLEEP" 하나 (파일명의 '_' 앞부분, reaction.reaction_base_name)
     created_commands_count = 0
 
-    if not os.path.exists(gif_folder_path) or not os.path.isdir(gif_folder_path):
-        logger.warning(f"반응 GIF 폴더 '{gif_folder_path}'를 찾을 수 없습니다. 반응 명령어가 생성되지 않습니다.")
+    if not await reaction_index.refresh(force=True):
+        logger.warning(f"반응 GIF 폴더 '{reaction_index.folder}'를 찾을 수 없습니다. 반응 명령어가 생성되지 않습니다.")
         return
 
-    for filename in os.listdir(gif_folder_path):
-        if filename.lower().endswith(".gif"):
-            # 파일명에서 '기본 반응 이름' 추출. 예: "SLEEP_1.gif" -> "SLEEP", "PAT.gif" -> "PAT"
-            # 보통 '_' 이전 부분을 기본 이름으로 사용하거나, 파일명 전체에서 숫자나 특정 구분자 제거
-            base_name_parts = os.path.splitext(filename)[0].split('_')
-            # 첫 번째 부분을 기본 이름으로 사용 (대문자로 통일)
-            # 만약 파일명이 HUG.gif 라면 base_name_parts[0]는 HUG
-            # 만약 파일명이 SLEEP_CAT.gif 라면 base_name_parts[0]는 SLEEP
-            # 이 로직은 파일명 규칙에 따라 조정될 수 있습니다.
-            # 여기서는 가장 간단하게 '_' 앞부분을 사용하거나, '_'가 없으면 전체 이름을 사용합니다.
-            potential_base_name = base_name_parts[0].upper()
-            
-            # 해당 기본 이름으로 시작하는 GIF 파일이 실제로 존재하는지 한 번 더 확인 (폴더 내 다른 파일과 비교)
-            # 이 부분은 send_reaction_gif 함수에서 처리하므로, 여기서는 base_reaction_names에 추가만 해도 됨.
-            # send_reaction_gif는 potential_base_name으로 시작하는 모든 .gif를 찾을 것임.
-            
-            # 생성될 명령어 이름 (소문자)
-            command_name_lower = potential_base_name.lower()
-            
-            # 이미 해당 기본 이름으로 명령어가 생성되었거나, 기존 명령어와 충돌하는지 확인
-            if command_name_lower in base_reaction_names or bot_instance.get_command(command_name_lower):
-                if command_name_lower not in base_reaction_names: # 기존 명령어와 충돌하는 경우
-                    logger.warning(f"반응 명령어 '!{command_name_lower}'는 이미 존재하거나 예약된 이름이어서 건너뜁니다. (파일 그룹 시작: {filename})")
-                # 이미 처리된 base_name이므로 건너뜀 (예: SLEEP_1.gif 처리 후 SLEEP_2.gif를 만났을 때 !sleep은 이미 생성됨)
-                continue 
-
-            # 동적 명령어 콜백 함수 생성
-            # reaction_name_for_send_gif는 클로저를 통해 각 명령어 생성 시점의 potential_base_name (대문자) 값을 가짐
-            async def dynamic_reaction_command(ctx, target_user: discord.Member, *, reaction_name_for_send_gif=potential_base_name):
-                await send_reaction_gif(ctx, target_user, reaction_name_for_send_gif)
-
-            dynamic_reaction_command.__doc__ = f"으헤~ {potential_base_name} 반응을 보여줄게, 선생! (!{command_name_lower} @멘션)"
-            
-            cmd = commands.Command(dynamic_reaction_command, name=command_name_lower, help=dynamic_reaction_command.__doc__)
-            bot_instance.add_command(cmd)
-            
-            base_reaction_names.add(command_name_lower) # 처리된 기본 이름(소문자) 추가
-            created_commands_count += 1
-            logger.info(f"동적 반응 명령어 '!{command_name_lower}'가 생성 및 등록되었습니다. (기준 GIF 그룹 시작: {filename})")
-    
+    for potential_base_name in reaction_index.names():
+        command_name_lower = potential_base_name.lower()
+        if bot_instance.get_command(command_name_lower): # 기존 명령어와 충돌하는 경우
+            logger.warning(f"반응 명령어 '!{command_name_lower}'는 이미 존재하거나 예약된 이름이어서 건너뜁니다.")
+            continue
+
+        # 동적 명령어 콜백 함수 생성
+        # reaction_name_for_send_gif는 각 명령어 생성 시점의 potential_base_name (대문자) 값을 가짐
+        async def dynamic_reaction_command(ctx, target_user: discord.Member, *, reaction_name_for_send_gif=potential_base_name):
+            await send_reaction_gif(ctx, target_user, reaction_name_for_send_gif)
+
+        dynamic_reaction_command.__doc__ = f"으헤~ {potential_base_name} 반응을 보여줄게, 선생! (!{command_name_lower} @멘션)"
+
+        cmd = commands.Command(dynamic_reaction_command, name=command_name_lower, help=dynamic_reaction_command.__doc__)
+        bot_instance.add_command(cmd)
+        created_commands_count += 1
+        logger.info(f"동적 반응 명령어 '!{command_name_lower}'가 생성 및 등록되었습니다. (GIF {len(reaction_index.files(potential_base_name))}개)")
+
     if created_commands_count > 0:
         logger.info(f"총 {created_commands_count}개의 동적 반응 명령어 그룹이 등록되었습니다.")
     else:
@@ -217,11 +300,35 @@ async def register_reaction_commands(bot_instance: commands.Bot):
 # --- 봇 준비 완료 시 실행될 함수 ---
 async def setup_hook():
     logger.info("setup_hook: 봇 준비 시작...")
+    await start_weather_client() # 공유 날씨 HTTP 세션 생성
+    if PREFETCH_ENABLED:
+        weather_prefetcher.start() # city_map 도시 날씨를 미리 받아둠
+    chat_sessions.start_sweeper() # 오래 말이 없던 채팅 세션 주기적으로 정리
+    await history_store.start() # 대화 기록 DB 열기 (저장된 사용자 수와 무관)
+    await prompt_cache.prepare([GEMINI_MODEL_NAME]) # 캐시를 못 쓰는 모델이면 일반 모델 그대로
+    rebuild_gemini_model()
     await register_reaction_commands(bot) # 봇 인스턴스 전달
+    image_catalog.start() # !사진 그림 목록을 백그라운드에서 불러오고 폴더 변경을 주기적으로 확인
+    media_transcoder.prewarm([os.path.join(os.path.dirname(os.path.abspath(__file__)), IMAGE_DIR_NAME), reaction_index.folder]) # 업로드 한도를 넘는 그림은 미리 줄여둠
     logger.info("setup_hook: 봇 준비 완료 및 명령어 등록 시도 완료.")
 
 bot.setup_hook = setup_hook # setup_hook 함수를 봇에 연결
 
+_original_bot_close = bot.close
+
+async def close_bot():
+    """봇 종료 시 공유 자원을 정리합니다."""
+    await gemini_scheduler.close() # 대기 중인 Gemini 요청은 바쁘다는 답으로 정리
+    await chat_sessions.stop_sweeper()
+    await history_store.close() # 남은 대화 기록까지 기록
+    await prompt_cache.close() # 서버에 남은 프롬프트 캐시 삭제
+    await close_weather_client()
+    await image_catalog.stop()
+    await media_transcoder.close() # 변환 프로세스 정리
+    await _original_bot_close()
+
+bot.close = close_bot # 종료 시 날씨 세션도 함께 닫음
+
 
 @bot.event
 async def on_ready():
@@ -232,8 +339,9 @@ async def on_ready():
 @bot.command(name='초기화')
 async def reset_chat_session(ctx: commands.Context):
     user_id = str(ctx.author.id)
-    if user_id in chat_sessions:
-        del chat_sessions[user_id]
+    had_session = chat_sessions.discard(user_id)
+    had_history = await history_store.clear(user_id)
+    if had_session or had_history:
         logger.info(f"사용자 {ctx.author} (ID: {user_id})에 의해 채팅 세션이 초기화되었습니다.")
         await ctx.reply("기존 대화 내용을 잊어버렸어, 선생! 새로운 마음으로 다시 시작하자~ 후후.", mention_author=False)
     else:
@@ -242,34 +350,33 @@ async def reset_chat_session(ctx: commands.Context):
 @bot.command(name='사진')
 async def show_random_image(ctx: commands.Context):
     logger.info(f"!사진 명령어 감지 (사용자: {ctx.author})")
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    image_folder_path = os.path.join(script_dir, IMAGE_DIR_NAME)
-
-    if not os.path.exists(image_folder_path) or not os.path.isdir(image_folder_path):
-        logger.warning(f"이미지 폴더 '{image_folder_path}'를 찾을 수 없습니다. (!사진)")
-        await ctx.reply(f"으음... '{IMAGE_DIR_NAME}' 폴더를 찾을 수 없어, 선생. 이미지를 넣어뒀는지 확인해줄래?", mention_author=False)
+    if not image_catalog.ready:
+        await ctx.reply("으헤~ 아직 그림 목록을 정리하는 중이야, 선생. 조금만 있다가 다시 불러줘.", mention_author=False)
         return
-    try:
-        valid_images = [
-            f for f in os.listdir(image_folder_path)
-            if os.path.isfile(os.path.join(image_folder_path, f)) and \
-            os.path.splitext(f)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
-        ]
-    except Exception as e:
-        logger.error(f"'{image_folder_path}' 폴더에서 이미지 목록을 가져오는 중 오류 발생: {e}")
-        await ctx.reply(f"이미지 폴더를 읽는 중에 문제가 생겼어, 선생.", mention_author=False)
+    if not image_catalog.exists:
+        logger.warning(f"이미지 폴더 '{image_catalog.folder}'를 찾을 수 없습니다. (!사진)")
+        await ctx.reply(f"으음... '{IMAGE_DIR_NAME}' 폴더를 찾을 수 없어, 선생. 이미지를 넣어뒀는지 확인해줄래?", mention_author=False)
         return
-    if not valid_images:
-        logger.info(f"이미지 폴더 '{image_folder_path}'에 유효한 이미지가 없습니다. (!사진)")
+    picked = image_catalog.pick(upload_budget(ctx.guild.filesize_limit if ctx.guild else None)) # 이 서버에 보낼 수 있는 그림 중에서만
+    if picked is None:
+        logger.info(f"이미지 폴더 '{image_catalog.folder}'에 보낼 수 있는 이미지가 없습니다. (!사진, 전체 {image_catalog.stats()['files']}개)")
         await ctx.reply(f"'{IMAGE_DIR_NAME}' 폴더에 보여줄 수 있는 이미지가 하나도 없어, 선생. 이미지를 좀 채워줘~", mention_author=False)
         return
-    selected_image_name = random.choice(valid_images)
-    selected_image_path = os.path.join(image_folder_path, selected_image_name)
+    selected_image_path, _ = picked
+    selected_image_name = os.path.basename(selected_image_path)
     try:
-        await ctx.reply(f"으헤~ 내가 가진 그림 중에 하나 골라봤어, 선생!", file=discord.File(selected_image_path), mention_author=False)
+        await send_media(ctx.reply, selected_image_path, selected_image_name, guild=ctx.guild,
+                         content=f"으헤~ 내가 가진 그림 중에 하나 골라봤어, 선생!", mention_author=False)
         logger.info(f"로컬 이미지 전송: {selected_image_path} (요청자: {ctx.author})")
+    except MediaTooLarge as e:
+        logger.warning(f"이미지 '{selected_image_path}'가 업로드 한도보다 큽니다 ({e.size / 1024 / 1024:.2f}MB, 변환 중: {e.pending}).")
+        if e.pending:
+            await ctx.reply(f"으... 이 그림은 너무 커서 지금 줄이고 있어, 선생. 조금 있다가 다시 불러줘~", mention_author=False)
+        else:
+            await ctx.reply(f"으... 이 그림은 너무 커서 보여줄 수가 없어, 선생. ({e.limit / 1024 / 1024:.1f}MB 초과)", mention_author=False)
     except FileNotFoundError:
         logger.error(f"이미지 파일 '{selected_image_path}'를 찾을 수 없습니다. (전송 시도 중)")
+        image_catalog.discard(selected_image_path) # 목록이 폴더와 어긋남
         await ctx.reply(f"이미지를 찾았는데... 파일이 갑자기 사라졌나봐, 미안해 선생.", mention_author=False)
     except discord.errors.HTTPException as e:
         if e.status == 413 or (e.text and "Request entity too large" in e.text):
@@ -295,7 +402,7 @@ async def show_help(ctx: commands.Context):
         embed.set_thumbnail(url=avatar_url)
 
     embed.add_field(name="💬 저와 대화하기", value=f"채널에서 저를 **멘션**(`@{bot.user.name}`)하거나 **DM**으로 메시지를 보내면 대답해드려요!\n예: `@{bot.user.name} 오늘 기분 어때?`\n또는 `?`로 시작하는 질문도 알아들을 수 있어! (예: `?오늘 날씨 어때`)", inline=False)
-    embed.add_field(name="☀️ 날씨 물어보기", value="`도시이름 날씨` 또는 `?도시이름 날씨`라고 물어보세요. (예: `서울 날씨`, `?부산 날씨`)\n그냥 `?날씨`라고 물어보면 제가 임의로 서울 날씨를 알려드려요.\n(단, 제가 아는 도시여야 해요!)", inline=False)
+    embed.add_field(name="☀️ 날씨 물어보기", value="`도시이름 날씨` 또는 `?도시이름 날씨`라고 물어보세요. (예: `서울 날씨`, `?부산 날씨`)\n`내일`이나 `주간`을 붙이면 내일/주간 예보도 알려줘요. (예: `서울 내일 날씨`, `제주 주간 날씨`)\n그냥 `?날씨`라고 물어보면 제가 임의로 서울 날씨를 알려드려요.\n(단, 제가 아는 도시여야 해요!)", inline=False)
     embed.add_field(name="🖼️ 랜덤 그림 보기", value="`!사진` 이라고 입력하면 제가 가진 그림 중 하나를 랜덤으로 보여줄게요!", inline=False)
     embed.add_field(name="🎲 주사위 굴리기", value="`!주사위 [NdM 또는 N]` 형식으로 주사위를 굴릴 수 있어!\n예: `!주사위` (6면체 1개), `!주사위 20` (20면체 1개), `!주사위 2d6` (6면체 2개 합산)", inline=False)
     embed.add_field(name="✂️ 가위바위보", value="`!가위바위보` (또는 `!rps`) 라고 입력하면 나와 가위바위보를 할 수 있어, 선생!\nGIF와 함께 가위, 바위, 보 버튼이 나타나면 하나를 선택해줘!", inline=False)
@@ -303,14 +410,10 @@ async def show_help(ctx: commands.Context):
     
     # 동적으로 생성된 반응 명령어 도움말 추가
     reaction_commands_desc = []
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    gif_folder_path = os.path.join(script_dir, REACTION_GIF_DIR)
-    if os.path.exists(gif_folder_path) and os.path.isdir(gif_folder_path):
-        for filename in os.listdir(gif_folder_path):
-            if filename.lower().endswith(".gif"):
-                cmd_name = os.path.splitext(filename)[0].lower()
-                if bot.get_command(cmd_name): # 실제로 등록된 명령어만 표시
-                     reaction_commands_desc.append(f"`!{cmd_name} @멘션`")
+    for reaction_name in reaction_index.names(): # 폴더를 다시 읽지 않고 색인에서
+        cmd_name = reaction_name.lower()
+        if bot.get_command(cmd_name): # 실제로 등록된 명령어만 표시
+            reaction_commands_desc.append(f"`!{cmd_name} @멘션`")
     
     if reaction_commands_desc:
         embed.add_field(name="💞 반응 GIF 보내기", value="다른 선생에게 재미있는 반응을 보여줄 수 있어!\n" + ", ".join(reaction_commands_desc), inline=False)
@@ -320,6 +423,10 @@ async def show_help(ctx: commands.Context):
     embed.add_field(name="🔄 대화 초기화", value="`!초기화` 라고 입력하면 저와의 이전 대화 내용을 잊어버리고 새로 시작할 수 있어요.", inline=False)
     if ADMIN_USER_ID and ctx.author.id == ADMIN_USER_ID: # 관리자에게만 로그 명령어 도움말 표시
         embed.add_field(name="📜 로그 보기 (관리자용)", value="`!로그 [줄 수]` 라고 입력하면 최근 로그를 보여줄게, 선생. 기본 20줄이야.", inline=False)
+        embed.add_field(name="🧠 대화 처리 상태 (관리자용)", value="`!대화상태` 라고 입력하면 사용자별 대기열과 채팅 세션 메모리 상황을 보여줄게.", inline=False)
+        embed.add_field(name="🚦 속도 제한 (관리자용)", value="`!속도제한` 으로 현재 상태를, `!속도제한 [사용자 분당] [서버 분당]` 으로 이 서버의 제한을 바꿀 수 있어.", inline=False)
+        embed.add_field(name="🗂️ 미디어 캐시 상태 (관리자용)", value="`!미디어상태` 라고 입력하면 메모리에 올려둔 그림 파일과 적중률, 첨부 URL 재사용 현황을 보여줄게.", inline=False)
+        embed.add_field(name="🌦️ 날씨 캐시 상태 (관리자용)", value="`!날씨상태` 라고 입력하면 도시별 마지막 갱신 시각과 캐시 통계를 보여줄게.", inline=False)
     embed.add_field(name="🙋 도움말 보기", value="`!도움` 이라고 입력하면 이 도움말을 다시 볼 수 있어요.", inline=False)
     embed.set_footer(text="궁금한 게 있다면 언제든 아저씨에게 물어보라구~.")
     await ctx.reply(embed=embed, mention_author=False)
@@ -397,7 +504,11 @@ class RPSView(View):
                 if isinstance(item, Button): item.disabled = True
             try:
                 logger.info(f"RPS 게임 타임아웃 (사용자 ID: {self.author_id}, 메시지 ID: {self.result_message.id})")
-                await self.result_message.edit(content=content, view=self, attachments=[]) # 타임아웃 시 GIF 제거
+                if media_registry.is_source(self.result_message.id):
+                    # 다른 게임이 이 첨부 URL을 재사용 중이라 첨부는 남겨둠 (지우면 URL도 죽음)
+                    await self.result_message.edit(content=content, view=self)
+                else:
+                    await self.result_message.edit(content=content, view=self, attachments=[], embeds=[]) # 타임아웃 시 GIF 제거
             except discord.NotFound: pass # 메시지가 이미 삭제된 경우
             except Exception as e: logger.error(f"RPS 타임아웃 메시지 수정 중 오류: {e}", exc_info=True)
         self.stop()
@@ -411,25 +522,20 @@ async def rock_paper_scissors(ctx: commands.Context):
 
     view = RPSView(author_id=ctx.author.id)
     initial_message_content = "으헤~ 나와 가위바위보 한 판 어때, 선생? 아래 버튼에서 골라봐!"
-    rps_gif_file = None
+    sent_message = None
 
-    if os.path.exists(gif_path):
-        try:
-            if os.path.getsize(gif_path) < 7.8 * 1024 * 1024: # 약 7.8MB
-                 rps_gif_file = discord.File(gif_path, filename=gif_file_name)
-            else:
-                logger.warning(f"가위바위보 GIF 파일 ({gif_path})이 너무 큽니다.")
-                initial_message_content += f"\n(앗, 내 멋진 모습이 담긴 GIF가 너무 커서 못 보여주겠네... 상상해줘, 선생!)"
-        except Exception as e:
-            logger.error(f"가위바위보 GIF 파일 처리 중 오류: {e}", exc_info=True)
-            initial_message_content += f"\n(가위바위보 GIF를 준비하다가 작은 문제가 생겼어, 선생...)"
-    else:
-        logger.warning(f"가위바위보 GIF 파일 ({gif_path})을 찾을 수 없습니다.")
-        initial_message_content += f"\n(앗, 가위바위보 하는 내 모습이 담긴 그림을 못 찾았네... 상상해줘, 선생!)"
     try:
-        if rps_gif_file:
-            sent_message = await ctx.reply(initial_message_content, file=rps_gif_file, view=view, mention_author=False)
+        if os.path.exists(gif_path):
+            try: # 전에 올린 GIF가 있으면 다시 올리지 않고 URL로, 너무 크면 줄인 변형본으로 보냄
+                sent_message = await send_media(ctx.reply, gif_path, gif_file_name, guild=ctx.guild,
+                                                content=initial_message_content, view=view, mention_author=False)
+            except MediaTooLarge as e:
+                logger.warning(f"가위바위보 GIF 파일 ({gif_path})이 너무 큽니다. (변환 중: {e.pending})")
+                initial_message_content += f"\n(앗, 내 멋진 모습이 담긴 GIF가 너무 커서 못 보여주겠네... 상상해줘, 선생!)"
         else:
+            logger.warning(f"가위바위보 GIF 파일 ({gif_path})을 찾을 수 없습니다.")
+            initial_message_content += f"\n(앗, 가위바위보 하는 내 모습이 담긴 그림을 못 찾았네... 상상해줘, 선생!)"
+        if sent_message is None:
             sent_message = await ctx.reply(initial_message_content, view=view, mention_author=False)
         view.result_message = sent_message # View가 메시지를 수정할 수 있도록 참조 저장
     except discord.errors.HTTPException as e:
@@ -605,8 +711,148 @@ async def show_logs_error(ctx, error):
         logger.error(f"!로그 명령어에서 예기치 않은 오류: {error}", exc_info=True)
         await ctx.reply("로그를 보여주려다 알 수 없는 문제가 생겼어, 선생...", mention_author=False)
 
+# --- 대화 처리 상태 명령어 (관리자용) ---
+@bot.command(name='대화상태')
+async def show_chat_status(ctx: commands.Context):
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID:
+        logger.warning(f"비관리자 대화상태 명령어 시도 (사용자: {ctx.author}, ID: {ctx.author.id})")
+        await ctx.reply("으음... 선생은 이 명령어를 사용할 권한이 없어.", mention_author=False)
+        return
+
+    dispatch = gemini_dispatcher.stats()
+    busiest = sorted(dispatch['per_user'].items(), key=lambda item: item[1]['depth'], reverse=True)[:10]
+    lines = [f"{user_id}: 대기 {info['depth']} (최대 {info['max_depth']})" for user_id, info in busiest] or ["(대기 중인 사용자 없음)"]
+    summary = (f"대기열: 활성 사용자 {dispatch['active_users']}명, 보낸 요청 {dispatch['total_sent']}건, "
+               f"합쳐진 메시지 {dispatch['total_coalesced']}건 (합치기 {'켜짐' if gemini_dispatcher.coalesce else '꺼짐'})")
+    scheduler = gemini_scheduler.stats()
+    queued = ", ".join(f"{name} {count}" for name, count in scheduler['queued_by_priority'].items()) or "없음"
+    summary += (f"\n스케줄러: 실행 중 {scheduler['running']}/{scheduler['workers']}, 대기 {scheduler['queued']}/{scheduler['max_queue']} ({queued}, 최대 {scheduler['max_depth']}), "
+                f"대기 시간 평균 {scheduler['wait_avg']:.2f}s/p95 {scheduler['wait_p95']:.2f}s, 예상 대기 {scheduler['estimated_wait']:.1f}s, "
+                f"완료 {scheduler['completed']}/실패 {scheduler['failed']}, "
+                f"거절 (가득 참 {scheduler['shed_full']}, 기한 초과 {scheduler['shed_deadline']}, 예상 초과 {scheduler['shed_predicted']})")
+    sessions = chat_sessions.stats()
+    summary += (f"\n세션: {sessions['sessions']}/{sessions['max_count']}개, 대화 기록 {sessions['turns']}턴, "
+                f"추정 메모리 {sessions['bytes'] / 1024 / 1024:.1f}/{sessions['max_bytes'] / 1024 / 1024:.0f}MB "
+                f"(한도 초과 정리 {sessions['evicted_lru']}, 유휴 정리 {sessions['evicted_ttl']})")
+    window = history_window.stats()
+    summary += (f"\n대화 창: 예산 {window['budget']}/상한 {window['limit']}토큰, 요약 {window['summaries_made']}회 "
+                f"(실패 {window['summary_failures']}), 접은 턴 {window['turns_folded']}, 잘라낸 턴 {window['turns_dropped']}, "
+                f"평균 입력 토큰 {window['avg_prompt_tokens']:.0f}")
+    cache = prompt_cache.stats()
+    summary += (f"\n프롬프트 캐시: {', '.join(cache['cached_models']) or '사용 안 함'}, "
+                f"캐시 적용 {cache['cached_requests']}/{cache['requests']}건, 아낀 입력 토큰 {cache['tokens_saved']} (요청당 {cache['avg_saved']:.0f})")
+    replies = reply_metrics.stats()
+    summary += (f"\n응답 시간: {replies['replies']}건 (스트리밍 {replies['streamed']}), "
+                f"첫 조각 평균 {replies['ttfb_avg']:.2f}s/p95 {replies['ttfb_p95']:.2f}s, "
+                f"첫 메시지 평균 {replies['first_post_avg']:.2f}s, 전체 생성 평균 {replies['total_avg']:.2f}s/p95 {replies['total_p95']:.2f}s, "
+                f"편집 {replies['edits']}회, 나눔 {replies['splits']}회")
+    history = history_store.stats()
+    summary += (f"\n기록 저장소: 쓰기 대기 {history['pending']}건, 저장 {history['rows_written']}건/{history['batches_written']}회, "
+                f"되살린 세션 {history['sessions_loaded']}개")
+    logger.info(f"관리자 {ctx.author}가 !대화상태를 요청했습니다.")
+    await ctx.reply(f"🧠 대화 처리 상태야, 선생:\n{summary}\n```\n" + "\n".join(lines) + "\n```", mention_author=False)
+
+
+# --- 속도 제한 명령어 (관리자용) ---
+@bot.command(name='속도제한')
+async def rate_limit_command(ctx: commands.Context, user_per_minute: float = None, guild_per_minute: float = None):
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID:
+        logger.warning(f"비관리자 속도제한 명령어 시도 (사용자: {ctx.author}, ID: {ctx.author.id})")
+        await ctx.reply("으음... 선생은 이 명령어를 사용할 권한이 없어.", mention_author=False)
+        return
+
+    guild_id = ctx.guild.id if ctx.guild else None
+    if user_per_minute is not None:
+        if guild_id is None:
+            await ctx.reply("서버별 제한은 서버 채널에서만 바꿀 수 있어, 선생.", mention_author=False)
+            return
+        if user_per_minute <= 0 or (guild_per_minute is not None and guild_per_minute <= 0):
+            await ctx.reply("으음... 분당 횟수는 0보다 커야 해, 선생.", mention_author=False)
+            return
+        current_user, current_guild = rate_limiter.limits_for(guild_id)
+        rate_limiter.set_guild_limits(
+            guild_id,
+            user=Limit(user_per_minute, current_user.burst),
+            guild=Limit(guild_per_minute, current_guild.burst) if guild_per_minute is not None else None,
+        )
+        logger.info(f"관리자 {ctx.author}가 서버 {guild_id}의 속도 제한을 바꿨습니다: 사용자 {user_per_minute}/분, 서버 {guild_per_minute}/분")
+
+    user_limit, guild_limit = rate_limiter.limits_for(guild_id)
+    stats = rate_limiter.stats()
+    throttled = stats['throttled']
+    summary = (f"속도 제한: {'켜짐' if stats['enabled'] else '꺼짐'}\n"
+               f"이 서버: 사용자 분당 {user_limit.per_minute:g}회 (연속 {user_limit.burst}), 서버 분당 {guild_limit.per_minute:g}회 (연속 {guild_limit.burst})\n"
+               f"전체: 분당 {rate_limiter.global_limit.per_minute:g}회 (연속 {rate_limiter.global_limit.burst}), 남은 토큰 {stats['global_tokens']:.1f}\n"
+               f"허용 {stats['allowed']}건, 막힘 (사용자 {throttled['user']}, 서버 {throttled['guild']}, 전체 {throttled['global']})\n"
+               f"추적 중: 사용자 {stats['tracked_users']}명, 서버 {stats['tracked_guilds']}개, 서버별 설정 {stats['guild_overrides']}개")
+    await ctx.reply(f"🚦 {summary}", mention_author=False)
+
+
+# --- 미디어 캐시 상태 명령어 (관리자용) ---
+@bot.command(name='미디어상태')
+async def show_media_status(ctx: commands.Context):
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID:
+        logger.warning(f"비관리자 미디어상태 명령어 시도 (사용자: {ctx.author}, ID: {ctx.author.id})")
+        await ctx.reply("으음... 선생은 이 명령어를 사용할 권한이 없어.", mention_author=False)
+        return
+
+    stats = media_cache.stats()
+    index = reaction_index.stats()
+    registry = media_registry.stats()
+    transcode = media_transcoder.stats()
+    catalog = image_catalog.stats(upload_budget(ctx.guild.filesize_limit if ctx.guild else None))
+    summary = (f"메모리 캐시: {stats['entries']}개 파일, {stats['resident_bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f}MB "
+               f"(파일당 {stats['max_file_bytes'] / 1024 / 1024:.0f}MB까지)\n"
+               f"적중 {stats['hits']} / 디스크 읽기 {stats['misses']} (적중률 {stats['hit_rate']:.0%}), "
+               f"캐시하지 않은 큰 파일 읽기 {stats['uncached_reads']}, 밀려남 {stats['evictions']}, 읽은 양 {stats['bytes_read'] / 1024 / 1024:.1f}MB\n"
+               f"반응 GIF 색인: 반응 {index['reactions']}종류, 파일 {index['files']}개 (폴더 훑기 {index['scans']}회)\n"
+               f"첨부 URL 재사용: {'켜짐' if registry['enabled'] else '꺼짐'}, 기록 {registry['entries']}개, 재사용 {registry['reused']}회 / 업로드 {registry['uploads']}회 "
+               f"(아낀 업로드 {registry['bytes_saved'] / 1024 / 1024:.1f}MB, 만료 {registry['expired']}, 내용 변경 {registry['changed']})\n"
+               f"큰 그림 변환: {'켜짐' if transcode['enabled'] else '꺼짐 (Pillow 없음)' if not transcode['pillow'] else '꺼짐'}, "
+               f"변형본 {transcode['variants']}개, 변환 중 {transcode['pending']}, 변형본으로 보냄 {transcode['served']}회, 실패 {transcode['failed']}\n"
+               f"!사진 그림 목록: {catalog['files']}개 중 이 서버에 보낼 수 있는 것 {catalog['sendable']}개 "
+               f"(폴더 훑기 {catalog['scans']}회, 마지막 {catalog['last_scan_ms']:.0f}ms{'' if catalog['ready'] else ', 준비 중'})")
+    lines = [f"{name}: {hits}회" for name, hits in stats['hottest']] or ["(아직 없음)"]
+    logger.info(f"관리자 {ctx.author}가 !미디어상태를 요청했습니다.")
+    await ctx.reply(f"🗂️ 미디어 캐시 상태야, 선생:\n{summary}\n```\n" + "\n".join(lines) + "\n```", mention_author=False)
+
+
+# --- 날씨 캐시 상태 명령어 (관리자용) ---
+@bot.command(name='날씨상태')
+async def show_weather_status(ctx: commands.Context):
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID:
+        logger.warning(f"비관리자 날씨상태 명령어 시도 (사용자: {ctx.author}, ID: {ctx.author.id})")
+        await ctx.reply("으음... 선생은 이 명령어를 사용할 권한이 없어.", mention_author=False)
+        return
+
+    now = time.time()
+    lines = []
+    for city_kr, city_en, refreshed, last_error in weather_prefetcher.status():
+        age_text = f"{(now - refreshed) / 60:.0f}분 전" if refreshed else "아직 없음"
+        error_text = f" ⚠️ {last_error}" if last_error else ""
+        lines.append(f"{city_kr}({city_en}): {age_text}{error_text}")
+
+    stats = forecast_cache.stats()
+    flights = forecast_flights.stats()
+    breaker = weather_client.breaker.stats()
+    summary = (f"미리 받기: {'동작 중' if weather_prefetcher.running else '꺼짐'}\n"
+               f"캐시: {stats['entries']}건, 적중 {stats['hits']} / 오래된 값 {stats['stale_hits']} / 실패 {stats['misses']} (적중률 {stats['hit_rate']:.0%}, 버린 위치 {stats['evictions']})\n"
+               f"요청 합치기: 실제 호출 {flights['leaders']}, 합쳐진 호출 {flights['coalesced']}\n"
+               f"차단기: {breaker['state']} (연속 실패 {breaker['consecutive_failures']}, 바로 거절 {breaker['rejected']})")
+    logger.info(f"관리자 {ctx.author}가 !날씨상태를 요청했습니다.")
+    await ctx.reply(f"🌦️ 날씨 캐시 상태야, 선생:\n{summary}\n```\n" + "\n".join(lines) + "\n```", mention_author=False)
+
 
 # --- 메시지 처리 이벤트 ---
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    await media_registry.forget_message(payload.message_id) # 지워진 메시지의 첨부 URL은 더 못 씀
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    for message_id in payload.message_ids:
+        await media_registry.forget_message(message_id)
+
 @bot.event
 async def on_message(message: discord.Message):
     if message.author == bot.user: # 봇 자신의 메시지는 무시
@@ -654,8 +900,24 @@ async def on_message(message: discord.Message):
                 # await message.reply("으헤~ 그림이네! 멋진걸, 선생?", mention_author=False) # 예시 응답
                 return # 일단은 무시
 
-            bot_reply_text = await generate_response(user_id, processed_content, message_obj=message)
-            if bot_reply_text:
+            decision = rate_limiter.check(message.author.id, message.guild.id if message.guild else None)
+            if not decision.allowed:
+                logger.info(f"속도 제한으로 요청을 막았습니다 (사용자: {message.author}, 범위: {decision.scope}, {decision.retry_after:.0f}초 후 가능)")
+                if decision.notify: # 막혀 있는 동안 안내는 한 번만
+                    wait = max(1, round(decision.retry_after))
+                    await message.reply(THROTTLE_REPLIES[decision.scope].format(wait=wait), mention_author=False)
+                return
+
+            streamer = StreamingReply(message) if STREAM_REPLIES else None # 첫 조각부터 바로 보여주고 이어서 편집
+            priority = PRIORITY_DM if is_dm else PRIORITY_MENTION if is_mentioned else PRIORITY_PREFIX
+            bot_reply_text = await generate_response(user_id, processed_content, message_obj=message, streamer=streamer, priority=priority)
+            if streamer is not None and streamer.sent:
+                if not streamer.finished and bot_reply_text: # 스트리밍 도중 오류: 보인 내용 뒤에 안내를 붙임
+                    try:
+                        await streamer.fail(bot_reply_text)
+                    except discord.errors.HTTPException as e:
+                        logger.error(f"스트리밍 답장 오류 안내 실패: {e}")
+            elif bot_reply_text:
                 try:
                     await message.reply(bot_reply_text, mention_author=False)
                 except discord.errors.HTTPException as e:
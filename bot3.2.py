@@ -14,7 +14,7 @@ import random
 
 # 로컬 모듈 임포트
 from prompt import SYSTEM_PROMPT
-from weather import forecast_today, city_map
+from weather import forecast_today_async, city_map, find_weather_city
 
 
 load_dotenv()
@@ -77,23 +77,19 @@ def get_or_create_chat_session(user_id: str):
 async def generate_response(user_id: str, user_message: str, message_obj: discord.Message = None):
     """날씨 요청을 우선 처리하고, 그 외에는 Gemini API를 사용하여 응답을 생성합니다."""
 
-    supported_cities_kr = list(city_map.keys())
-    if supported_cities_kr: # city_map이 비어있지 않은 경우에만 실행
-        cities_pattern_group = "|".join(re.escape(city) for city in supported_cities_kr)
-        weather_pattern = re.compile(rf"(?i)(?:\? *)?\b({cities_pattern_group})\b\s*(?:은|는|이|가|의)?\s*날씨")
-        match = weather_pattern.search(user_message)
+    if city_map: # city_map이 비어있지 않은 경우에만 실행
+        found_city_kr = find_weather_city(user_message) # 도시 목록이 바뀔 때만 다시 만들어지는 매처
 
-        if match:
-            found_city_kr = match.group(1)
+        if found_city_kr:
             print(f"날씨 요청 감지: '{found_city_kr}' (원본 메시지: '{user_message}')")
-            forecast_result = forecast_today(found_city_kr)
+            forecast_result = await forecast_today_async(found_city_kr)
             return f"{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
 
         elif user_message.strip().lower().startswith("?날씨") and not user_message.startswith(bot.command_prefix):
             default_city = "서울"
             if default_city in city_map:
                 print(f"일반 날씨 요청 감지 (?날씨). 기본 도시 '{default_city}'로 조회합니다. (원본: '{user_message}')")
-                forecast_result = forecast_today(default_city)
+                forecast_result = await forecast_today_async(default_city)
                 return f"어떤 도시인지 정확히 안 알려줘서 일단 {default_city} 날씨를 가져왔어, 선생.\n{forecast_result}\n다른 도시가 궁금하면 '도시이름 날씨' 또는 `?도시이름 날씨`라고 물어봐."
             else:
                 print(f"경고: 기본 도시 '{default_city}'가 city_map에 없습니다.")
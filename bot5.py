@@ -10,8 +10,12 @@ import re # 정규 표현식 모듈 추가
 import traceback # 오류 추적 모듈 추가
 
 # 로컬 모듈 임포트
-from prompt import SYSTEM_PROMPT
-from weather import forecast_today, city_map # forecast_today와 city_map 임포트
+from prompt_build import load_system_prompt
+from weather import forecast_async, detect_forecast_intent, city_map, find_weather_city, resolve_weather_city, geocode_city, should_geocode
+from weather import start_weather_client, close_weather_client
+from weather import weather_prefetcher, PREFETCH_ENABLED
+from prompt_cache import PromptCache
+from model_router import ModelRouter, AllModelsFailed, is_quota_error
 
 load_dotenv()
 
@@ -58,17 +62,94 @@ safety_settings_global = [
     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
-SYSTEM_PROMPT_GLOBAL = SYSTEM_PROMPT
+SYSTEM_PROMPT_GLOBAL = load_system_prompt() # prompt_build.py로 중복을 없앤 프롬프트 (prompt.py와 체크섬이 안 맞으면 원본)
+print(f"시스템 프롬프트: {len(SYSTEM_PROMPT_GLOBAL.encode('utf-8'))}바이트")
 
 # 사용자별 대화 세션 저장용 (메모리 기반)
 chat_sessions = {}
 
+
+def is_retryable_error(error: Exception) -> bool:
+    """다른 모델로 다시 보내 볼 만한 오류인지. 안전 필터, 컨텍스트 초과, API 키 오류는 모델을 바꿔도 같습니다."""
+    if is_quota_error(error):
+        return True
+    text = str(error).lower()
+    is_context_length_issue = "context length" in text or "token" in text or "size of the request" in text
+    is_safety_issue = "block" in text or "safety" in text
+    is_api_key_issue = "api key not valid" in text
+    return not (is_context_length_issue or is_safety_issue or is_api_key_issue)
+
+# 모델별 응답 시간(EWMA, p95)과 오류율을 보고 요청마다 가장 건강한 모델로 보냄
+model_router = ModelRouter(MODEL_NAMES, retryable=is_retryable_error)
+
+# 모든 모델을 시작할 때 한 번만 만들어 두고, 전환할 때는 여기서 꺼내 씀 (전환 시 모델 생성 비용 없음)
+model_pool = {}
+
+
+def build_model(model_name: str):
+    """캐시가 있으면 캐시 참조 모델, 없으면 system_instruction을 직접 넣은 모델"""
+    return prompt_cache.model(
+        model_name,
+        generation_config=generation_config_global,
+        safety_settings=safety_settings_global
+    )
+
+
+def warm_model_pool():
+    for model_name in MODEL_NAMES:
+        try:
+            model_pool[model_name] = build_model(model_name)
+        except Exception as e:
+            print(f"모델 풀: '{model_name}' 모델을 미리 만들지 못했습니다 (전환할 때 다시 시도): {e}")
+    print(f"모델 풀 준비 완료: {len(model_pool)}/{len(MODEL_NAMES)}개")
+
+
+def pooled_model(model_name: str):
+    model = model_pool.get(model_name)
+    if model is None: # 시작할 때 만들지 못한 모델만 지금 만듦
+        model = model_pool[model_name] = build_model(model_name)
+    return model
+
+
+def on_prompt_cache_invalidated(model_name: str):
+    """프롬프트 캐시가 새로 만들어지면 풀의 모델도 새 캐시를 참조하도록 다시 만듭니다. (세션은 다음 요청 때 옮겨감)"""
+    global gemini_model
+    print(f"'{model_name}' 모델의 프롬프트 캐시가 바뀌어 모델을 다시 만듭니다.")
+    model_pool[model_name] = build_model(model_name)
+    if gemini_model is not None and MODEL_NAMES[current_model_index] == model_name:
+        gemini_model = model_pool[model_name]
+
+# SYSTEM_PROMPT를 모델별 서버 측 캐시로 한 번만 올려 둠 (캐시를 못 쓰는 모델은 일반 모델로)
+prompt_cache = PromptCache(SYSTEM_PROMPT_GLOBAL, on_invalidate=on_prompt_cache_invalidated)
+
+
+async def setup_hook():
+    await start_weather_client() # 공유 날씨 HTTP 세션 생성
+    await prompt_cache.prepare(MODEL_NAMES) # on_ready에서 모델을 불러오기 전에 캐시 준비
+    print(f"프롬프트 캐시 사용 모델: {prompt_cache.stats()['cached_models'] or '없음'}")
+    warm_model_pool() # 캐시가 준비된 뒤에 모든 모델을 미리 만들어 둠
+    if PREFETCH_ENABLED:
+        weather_prefetcher.start() # city_map 도시 날씨를 미리 받아둠
+
+bot.setup_hook = setup_hook
+
+_original_bot_close = bot.close
+
+async def close_bot():
+    """봇 종료 시 공유 자원을 정리합니다."""
+    await prompt_cache.close()
+    await close_weather_client()
+    await _original_bot_close()
+
+bot.close = close_bot
+
 def initialize_model(model_idx_to_load: int):
     """
-    지정된 인덱스의 모델을 로드하고 전역 변수를 업데이트합니다.
+    지정된 인덱스의 모델을 모델 풀에서 꺼내 전역 변수를 업데이트합니다.
+    기존 채팅 세션은 지우지 않고, 다음 요청 때 대화 기록을 가지고 새 모델로 옮겨갑니다.
     성공 시 True, 실패 시 False를 반환합니다.
     """
-    global gemini_model, current_model_index, chat_sessions
+    global gemini_model, current_model_index
 
     if not (0 <= model_idx_to_load < len(MODEL_NAMES)):
         print(f"오류: 모델 인덱스 {model_idx_to_load}가 MODEL_NAMES 리스트 범위를 벗어났습니다.")
@@ -77,19 +158,8 @@ def initialize_model(model_idx_to_load: int):
     model_name_to_try = MODEL_NAMES[model_idx_to_load]
     print(f"모델 초기화/변경 시도: {model_name_to_try} (인덱스: {model_idx_to_load})")
     try:
-        new_model = genai.GenerativeModel(
-            model_name=model_name_to_try,
-            system_instruction=SYSTEM_PROMPT_GLOBAL,
-            generation_config=generation_config_global,
-            safety_settings=safety_settings_global
-        )
-        gemini_model = new_model
+        gemini_model = pooled_model(model_name_to_try)
         current_model_index = model_idx_to_load
-
-        if chat_sessions:
-            print(f"모델이 '{model_name_to_try}'(으)로 변경되었습니다. 모든 기존 채팅 세션을 초기화합니다.")
-            chat_sessions.clear()
-
         print(f"성공적으로 모델을 '{model_name_to_try}'(으)로 로드했습니다.")
         return True
     except Exception as e:
@@ -105,40 +175,60 @@ def get_or_create_chat_session(user_id: str):
         print("오류: get_or_create_chat_session 호출 시 gemini_model이 None입니다. 모델 초기화가 필요합니다.")
         return None
 
-    if user_id not in chat_sessions:
-        try:
+    chat_session = chat_sessions.get(user_id)
+    try:
+        if chat_session is None:
             chat_sessions[user_id] = gemini_model.start_chat(history=[])
             print(f"'{MODEL_NAMES[current_model_index]}' 모델로 새로운 채팅 세션을 시작합니다: {user_id}")
-        except Exception as e:
-            print(f"채팅 세션 시작 중 오류 ({user_id}): {e}")
-            return None
+        elif chat_session.model is not gemini_model:
+            # 모델이 바뀌었으면 대화 기록을 그대로 가지고 새 모델에 다시 묶음 (네트워크 호출 없음)
+            chat_sessions[user_id] = gemini_model.start_chat(history=chat_session.history)
+            print(f"'{MODEL_NAMES[current_model_index]}' 모델로 채팅 세션을 옮겼습니다 ({len(chat_session.history)}턴 유지): {user_id}")
+    except Exception as e:
+        print(f"채팅 세션 시작 중 오류 ({user_id}): {e}")
+        return None
     return chat_sessions[user_id]
 
-async def generate_response(user_id: str, user_message: str, retry_count=0, original_error_model_index_for_retry=None):
+async def generate_response(user_id: str, user_message: str, retry_count=0):
     """
     날씨 요청을 우선 처리하고, 그 외에는 Gemini API를 사용하여 응답을 생성합니다.
-    API 할당량/모델 상태 문제 또는 기타 오류 발생 시 모델을 변경하고 재시도합니다.
+    Gemini 요청은 model_router가 고른 모델로 보내고, 실패하거나 평소보다 느리면 다음으로 건강한 모델이 받습니다.
     """
     global current_model_index, gemini_model
 
     # 1. 날씨 요청 처리
-    supported_cities_kr = list(city_map.keys())
-    if not supported_cities_kr:
+    if not city_map:
         print("경고: weather.py의 city_map에 도시가 정의되어 있지 않습니다. 날씨 기능을 사용하기 어렵습니다.")
     else:
-        cities_pattern_group = "|".join(re.escape(city) for city in supported_cities_kr)
-        weather_pattern = re.compile(rf"(?i)\b({cities_pattern_group})\b\s*(?:은|는|이|가|의)?\s*날씨")
-        match = weather_pattern.search(user_message)
-        if match:
-            found_city_kr = match.group(1)
+        intent, weather_message = detect_forecast_intent(user_message) # '내일', '모레', '주말', '주간' 날씨 구분
+        found_city_kr = find_weather_city(weather_message) # 도시 목록이 바뀔 때만 다시 만들어지는 매처
+        if found_city_kr:
             print(f"날씨 요청 감지: '{found_city_kr}' (원본 메시지: '{user_message}')")
-            forecast_result = forecast_today(found_city_kr)
+            forecast_result = await forecast_async(found_city_kr, intent)
             return f"{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
-        elif user_message.strip().startswith("?") and "날씨" in user_message and not user_message.startswith(bot.command_prefix):
+
+        fuzzy_query, fuzzy_cities = resolve_weather_city(weather_message) # 오타/별칭까지 고려
+        if len(fuzzy_cities) == 1:
+            found_city_kr = fuzzy_cities[0]
+            print(f"날씨 요청 감지 (유사 이름 '{fuzzy_query}' -> '{found_city_kr}')")
+            forecast_result = await forecast_async(found_city_kr, intent)
+            return f"'{fuzzy_query}'... {found_city_kr} 말하는 거지, 선생?\n{forecast_result}\n{found_city_kr} 날씨 정보였어, 선생."
+        elif len(fuzzy_cities) > 1:
+            print(f"날씨 요청 도시가 모호함: '{fuzzy_query}' -> {fuzzy_cities}")
+            options = ", ".join(f"'{city} 날씨'" for city in fuzzy_cities[:5])
+            return f"으음... '{fuzzy_query}'가 어디인지 헷갈리네. 혹시 {options} 중에 하나야, 선생?"
+        elif fuzzy_query and should_geocode(weather_message, fuzzy_query): # 직접 묻는 요청만 (잡담 속 '날씨'는 Gemini로)
+            place = await geocode_city(fuzzy_query) # city_map에 없는 도시 (한 번 찾으면 로컬 캐시에서 바로)
+            if place is not None:
+                print(f"날씨 요청 감지 (지오코딩 '{fuzzy_query}' -> {place.name})")
+                forecast_result = await forecast_async(fuzzy_query, intent)
+                return f"{forecast_result}\n{place.name} 날씨 정보였어, 선생."
+
+        if user_message.strip().startswith("?") and "날씨" in user_message and not user_message.startswith(bot.command_prefix):
             default_city = "서울"
             if default_city in city_map:
                 print(f"일반 날씨 요청 감지. 기본 도시 '{default_city}'로 조회합니다. (원본: '{user_message}')")
-                forecast_result = forecast_today(default_city)
+                forecast_result = await forecast_async(default_city, intent)
                 return f"어떤 도시인지 정확히 안 알려줘서 일단 {default_city} 날씨를 가져왔어, 선생.\n{forecast_result}\n다른 도시가 궁금하면 '도시이름 날씨'라고 물어봐."
             else:
                 print(f"경고: 기본 도시 '{default_city}'가 city_map에 없습니다.")
@@ -157,91 +247,59 @@ async def generate_response(user_id: str, user_message: str, retry_count=0, orig
                 return "으앙... 지금은 머리가 너무 아파서 생각할 수가 없어, 선생... 나중에 다시 말 걸어줘."
         return "으앙... 지금은 머리가 너무 아파서 생각할 수가 없어, 선생... 나중에 다시 말 걸어줘."
 
+    # model_router가 응답 시간/오류율을 보고 주 모델을 고름 (지금 모델이 쓸 만하면 그대로 유지)
+    primary = model_router.choose(MODEL_NAMES[current_model_index])
+    if primary != MODEL_NAMES[current_model_index]:
+        initialize_model(MODEL_NAMES.index(primary))
+
     chat_session = get_or_create_chat_session(user_id)
     if not chat_session:
         return "으음... 선생이랑 대화 채널을 만드는 데 뭔가 문제가 생겼나 봐. 조금 있다 다시 시도해 줄래?"
-
-    try:
-        print(f"'{MODEL_NAMES[current_model_index]}' 모델에게 전달 (ID: {user_id}): {user_message}")
-        gemini_response = await chat_session.send_message_async(user_message)
-
-        if "API 할당량" in gemini_response.text and "모델 상태" in gemini_response.text:
-            print(f"응답 내용에서 API 할당량/모델 상태 문제 감지: '{gemini_response.text}'")
+    base_history = list(chat_session.history)
+
+    async def send_via(model_name: str):
+        model = pooled_model(model_name)
+        if chat_session.model is model:
+            session = chat_session
+        else: # 헤지/전환용: 같은 대화 기록으로 풀의 그 모델에 세션을 만들어 보냄
+            session = model.start_chat(history=base_history)
+        print(f"'{model_name}' 모델에게 전달 (ID: {user_id}): {user_message}")
+        response = await session.send_message_async(user_message)
+        if "API 할당량" in response.text and "모델 상태" in response.text:
+            print(f"응답 내용에서 API 할당량/모델 상태 문제 감지: '{response.text}'")
+            session.rewind() # 이 응답은 대화 기록에 남기지 않음
             raise Exception("API 할당량, 모델 상태 등을 확인해주세요. (응답 내용 기반)")
+        return response, session
 
-        return gemini_response.text
-
-    except Exception as e:
+    try:
+        (gemini_response, session), answered_by = await model_router.run(send_via, primary)
+    except AllModelsFailed as e:
+        print(f"모든 가용 모델을 시도했지만 실패했습니다: {e}")
+        return "흑흑... 내가 아는 모든 방법을 써봤는데도 지금은 대답하기가 너무 어려워, 선생... 정말 미안해, 나중에 다시 찾아와 줄래?"
+    except Exception as e: # 모델을 바꿔도 소용없는 오류 (is_retryable_error가 False)
         error_message = str(e)
         error_type = type(e).__name__
-        print(f"Gemini API 호출 중 오류 발생 (모델: {MODEL_NAMES[current_model_index]}, 사용자 ID: {user_id}): {error_type} - {error_message}")
+        print(f"Gemini API 호출 중 오류 발생 (모델: {primary}, 사용자 ID: {user_id}): {error_type} - {error_message}")
         traceback.print_exc()
 
         error_str_lower = error_message.lower()
-        
-        quota_error_keywords = ["quota", "rate limit", "resource exhausted", "api 할당량", "모델 상태"]
-        is_quota_or_model_issue = any(keyword in error_str_lower for keyword in quota_error_keywords)
-        if "api 할당량, 모델 상태 등을 확인해주세요." in error_str_lower:
-            is_quota_or_model_issue = True
-        
-        is_context_length_issue = "context length" in error_str_lower or "token" in error_str_lower or "size of the request" in error_str_lower
-        is_safety_issue = "block" in error_str_lower or "safety" in error_str_lower
-        is_api_key_issue = "api key not valid" in error_str_lower
-
-        # 모델 변경을 시도해야 하는 경우 (할당량 문제 또는 기타 명시적으로 처리되지 않은 오류)
-        if is_quota_or_model_issue or not (is_context_length_issue or is_safety_issue or is_api_key_issue):
-            if is_quota_or_model_issue:
-                print(f"API 할당량 또는 모델 상태 문제 감지. 다음 모델로 전환 시도 (현재 모델: {MODEL_NAMES[current_model_index]}).")
-            else:
-                # 이것이 '기타 오류'에 해당합니다.
-                print(f"기타 오류 발생 (오류 유형: {error_type}, 내용: {error_message}). 다음 모델로 전환 시도 (현재 모델: {MODEL_NAMES[current_model_index]}).")
-
-            # 재시도 루프를 위한 시작 모델 인덱스 설정
-            # original_error_model_index_for_retry는 이 재귀 호출 체인에서 처음 오류가 발생한 모델의 인덱스
-            if original_error_model_index_for_retry is None:
-                original_error_model_index_for_retry = current_model_index
-            
-            tried_models_in_this_cycle = 0
-            
-            # 현재 모델 인덱스부터 시작하여 순환하며 다음 모델 시도
-            for i in range(len(MODEL_NAMES)):
-                next_model_idx_candidate = (current_model_index + 1 + i) % len(MODEL_NAMES)
-                
-                # 모든 모델을 한 바퀴 다 돌았는지 확인 (현재 모델로 돌아왔고, 최소 한 번은 다른 모델을 시도한 경우)
-                if next_model_idx_candidate == original_error_model_index_for_retry and tried_models_in_this_cycle > 0 :
-                    print("모든 가용 모델을 순회하며 시도했지만 오류가 지속됩니다.")
-                    break # 루프 종료, 아래에서 최종 실패 메시지 반환
-
-                print(f"모델 전환 시도: {MODEL_NAMES[next_model_idx_candidate]}")
-                if initialize_model(next_model_idx_candidate):
-                    print(f"모델이 성공적으로 {MODEL_NAMES[current_model_index]}(으)로 변경되었습니다. 메시지 재전송 시도.")
-                    # 모델 변경 후에는 새 세션이 필요 (initialize_model에서 chat_sessions.clear() 호출)
-                    return await generate_response(user_id, user_message, retry_count + 1, original_error_model_index_for_retry)
-                else:
-                    print(f"{MODEL_NAMES[next_model_idx_candidate]} 모델 로드 실패. 다음 모델을 시도합니다.")
-                    tried_models_in_this_cycle += 1
-                    # current_model_index는 initialize_model 실패 시 변경되지 않으므로,
-                    # 다음 루프에서 (current_model_index + 1 + i) % len(MODEL_NAMES)는 다음 모델을 가리킴
-            
-            # 모든 모델을 시도했거나, 더 이상 시도할 모델이 없는 경우 (루프를 빠져나온 경우)
-            print("모든 가용 모델을 시도했지만 실패했습니다.")
-            return "흑흑... 내가 아는 모든 방법을 써봤는데도 지금은 대답하기가 너무 어려워, 선생... 정말 미안해, 나중에 다시 찾아와 줄래?"
-
-        elif is_context_length_issue:
-            print(f"컨텍스트/요청 크기 문제로 {user_id}의 세션을 초기화합니다.")
-            if user_id in chat_sessions:
-                del chat_sessions[user_id]
-            return "으음... 방금 무슨 이야기 하고 있었지? 다시 말해줄래, 선생? 머리가 잠깐 하얘졌어~"
-        elif is_safety_issue:
-            return "으음... 선생, 그건 좀 대답하기 곤란한 내용인 것 같아. 다른 이야기 하자~"
-        elif is_api_key_issue:
+        if "api key not valid" in error_str_lower:
             print("치명적 오류: Gemini API 키가 유효하지 않습니다. 봇 관리자에게 문의하세요.")
             return "으앙... 선생님이랑 이야기하고 싶은데, 뭔가 중요한 연결이 끊어진 것 같아... 관리자 아저씨한테 한번 물어봐 줄래?"
-        
-        # 이 부분은 이론상 위의 조건들(should_switch_model 포함)에 의해 커버되어야 하지만,
-        # 만약을 위한 최종 fallback (사실상 위의 should_switch_model이 True가 되어 모델 전환을 시도할 것임)
-        print(f"처리되지 않은 특정 예외 유형입니다. 오류: {error_type} - {error_message}")
-        return "우웅... 지금은 좀 피곤해서 대답하기 어렵네~ 나중에 다시 물어봐줘, 구만."
+        elif "block" in error_str_lower or "safety" in error_str_lower:
+            return "으음... 선생, 그건 좀 대답하기 곤란한 내용인 것 같아. 다른 이야기 하자~"
+        print(f"컨텍스트/요청 크기 문제로 {user_id}의 세션을 초기화합니다.")
+        if user_id in chat_sessions:
+            del chat_sessions[user_id]
+        return "으음... 방금 무슨 이야기 하고 있었지? 다시 말해줄래, 선생? 머리가 잠깐 하얘졌어~"
+
+    if session is not chat_session: # 다른 모델이 답했으면 그 세션으로 대화를 이어감
+        print(f"'{answered_by}' 모델이 대신 답했습니다. (주 모델: {primary}, ID: {user_id})")
+        chat_sessions[user_id] = session
+    saved_tokens = prompt_cache.record_usage(gemini_response)
+    if saved_tokens:
+        print(f"프롬프트 캐시로 입력 토큰 {saved_tokens}개를 아꼈습니다. (누적 {prompt_cache.tokens_saved})")
+    return gemini_response.text
 
 
 def initialize_model_globally():
@@ -289,6 +347,22 @@ async def reset_chat_session(ctx: commands.Context):
         await ctx.reply("응? 아직 우리 대화 시작도 안 한 것 같은데, 선생? 아니면 이미 깨끗한 상태야!", mention_author=False)
         print(f"초기화 요청: 이미 세션이 없거나 초기화된 상태입니다: {user_id} (요청자: {ctx.author.name})")
 
+@bot.command(name='모델상태')
+async def show_model_status(ctx: commands.Context):
+    """모델별 응답 시간과 오류율을 보여줍니다."""
+    stats = model_router.stats()
+    lines = []
+    for name, model in stats['models'].items():
+        latency = f"{model['latency_ewma']:.2f}s" if model['latency_ewma'] is not None else "-"
+        p95 = f"{model['p95']:.2f}s" if model['p95'] is not None else "-"
+        cooldown = f", 쉬는 중 {model['cooldown']:.0f}s" if model['cooldown'] else ""
+        marker = "▶ " if name == MODEL_NAMES[current_model_index] else "  "
+        lines.append(f"{marker}{name}: 평균 {latency}, p95 {p95}, 오류율 {model['error_rate']:.0%}, "
+                     f"요청 {model['requests']} (실패 {model['failures']}, 헤지 승리 {model['hedges_won']}){cooldown}")
+    await ctx.reply(f"🤖 모델 상태야, 선생. (헤지 {stats['hedges']}회, 대신 답한 요청 {stats['failovers']}건)\n```\n"
+                    + "\n".join(lines) + "\n```", mention_author=False)
+
+
 @bot.command(name='도움')
 async def show_help(ctx: commands.Context):
     """봇 사용법에 대한 도움말을 보여줍니다."""
@@ -317,6 +391,11 @@ async def show_help(ctx: commands.Context):
         value="`!초기화` 라고 입력하면 저와의 이전 대화 내용을 잊어버리고 새로 시작할 수 있어요.",
         inline=False
     )
+    embed.add_field(
+        name="🤖 모델 상태",
+        value="`!모델상태` 라고 입력하면 모델별 응답 속도와 오류율을 보여줄게요.",
+        inline=False
+    )
     embed.add_field(
         name="🙋 도움말 보기",
         value="`!도움` 이라고 입력하면 이 도움말을 다시 볼 수 있어요.",
@@ -0,0 +1,111 @@
+# city_matcher.py
+# 메시지에서 "도시 날씨" 요청을 찾는 매처. 도시 목록이 바뀔 때만 다시 만들어집니다.
+
+import re
+
+# 기존 정규식 (?i)\b(도시들)\b\s*(?:은|는|이|가|의)?\s*날씨 의 도시 뒷부분과 동일한 조건
+_WEATHER_TAIL_RE = re.compile(r"\b\s*(?:은|는|이|가|의)?\s*날씨")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class CityMatcher:
+    """
+    Aho-Corasick 오토마톤으로 도시 이름(별칭 포함)을 한 번의 스캔으로 찾습니다.
+    names는 {찾을 이름: 돌려줄 도시 이름} 매핑입니다. 대소문자는 구분하지 않습니다.
+    """
+    def __init__(self, names: dict):
+        self._goto = [{}]      # 상태 -> {문자: 다음 상태}
+        self._fail = [0]
+        self._output = [None]  # 상태 -> 이 상태에서 끝나는 가장 긴 이름의 (길이, 도시 이름), 없으면 None
+        self._dict_link = [0]  # 상태 -> 출력을 가진 가장 가까운 실패 링크 상태 (없으면 0)
+        self.max_len = 0
+        self.size = 0
+        for name, city in names.items():
+            self._add(name.lower(), city)
+        self._build_links()
+
+    def _add(self, name: str, city: str):
+        if not name:
+            return
+        state = 0
+        for ch in name:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._dict_link.append(0)
+                self._goto[state][ch] = next_state
+            state = next_state
+        if self._output[state] is None: # 같은 이름이 여러 번 들어오면 먼저 등록된 도시를 유지
+            self._output[state] = (len(name), city)
+            self.size += 1
+        self.max_len = max(self.max_len, len(name))
+
+    def _build_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                fail_state = self._fail[next_state]
+                self._dict_link[next_state] = fail_state if self._output[fail_state] else self._dict_link[fail_state]
+
+    def iter_matches(self, text: str):
+        """text에 나타나는 모든 이름을 (시작, 끝, 도시 이름)으로 돌려줍니다. (끝 위치 순서)"""
+        lowered = text.lower()
+        if len(lowered) != len(text): # 소문자 변환으로 길이가 바뀌는 드문 문자가 있으면 원문으로 검색
+            lowered = text
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        state = 0
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = state if output[state] else dict_link[state]
+            while hit:
+                length, city = output[hit]
+                yield i + 1 - length, i + 1, city
+                hit = dict_link[hit]
+
+    def find_weather_city(self, text: str):
+        """'도시 날씨' 형태의 요청에서 가장 앞(같으면 가장 긴) 도시를 찾습니다. 없으면 None."""
+        best = None # (시작, -길이, 도시 이름)
+        for start, end, city in self.iter_matches(text):
+            if best is not None and start > best[0]:
+                if end - self.max_len > best[0]:
+                    break # 이후 매치는 모두 best보다 뒤에서 시작함
+                continue
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if not _WEATHER_TAIL_RE.match(text, end):
+                continue
+            candidate = (start, start - end, city)
+            if best is None or candidate < best:
+                best = candidate
+        return best[2] if best else None
+
+
+_cached_matcher = None
+_cached_key = None
+
+
+def get_city_matcher(names: dict, version: int = 0) -> CityMatcher:
+    """(version, 이름 수)가 바뀌었을 때만 매처를 다시 만듭니다."""
+    global _cached_matcher, _cached_key
+    key = (version, len(names))
+    if _cached_matcher is None or _cached_key != key:
+        _cached_matcher = CityMatcher({name: name for name in names})
+        _cached_key = key
+    return _cached_matcher
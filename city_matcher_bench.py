@@ -0,0 +1,94 @@
+# city_matcher_bench.py
+# 도시 매처와 기존 "메시지마다 정규식 컴파일" 방식을 도시 12개 / 1,000개 / 10,000개에서 비교하고,
+# 오타 허용 리졸버의 조회 시간을 수만 개 규모에서 잽니다.
+# 사용법: python city_matcher_bench.py [--messages 2000]
+
+import argparse
+import random
+import re
+import time
+
+from city_matcher import CityMatcher
+from city_resolver import CityResolver
+
+BASE_CITIES = ["서울", "부산", "인천", "대구", "광주", "대전", "울산", "수원", "제주", "파주", "평양", "도쿄"]
+SAMPLE_MESSAGES = ["서울 날씨 어때?", "오늘 뭐 먹을까 선생", "?부산 날씨", "도쿄날씨", "호시노 낮잠 자?", "제주 날씨 알려줘"]
+
+
+def make_cities(count: int) -> list:
+    cities = list(BASE_CITIES[:count])
+    syllables = "가나다라마바사아자차카타파하강남북동서산천포주양"
+    rng = random.Random(count)
+    seen = set(cities)
+    while len(cities) < count:
+        name = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        if name not in seen:
+            seen.add(name)
+            cities.append(name)
+    return cities
+
+
+def legacy_find(cities: list, message: str):
+    """기존 generate_response와 같은 방식: 메시지마다 목록 복사 + 정규식 컴파일."""
+    supported_cities_kr = list(cities)
+    cities_pattern_group = "|".join(re.escape(city) for city in supported_cities_kr)
+    weather_pattern = re.compile(rf"(?i)(?:\? *)?\b({cities_pattern_group})\b\s*(?:은|는|이|가|의)?\s*날씨")
+    match = weather_pattern.search(message)
+    return match.group(1) if match else None
+
+
+def bench(count: int, messages: int):
+    cities = make_cities(count)
+    corpus = [random.choice(SAMPLE_MESSAGES) for _ in range(messages)]
+
+    legacy_runs = max(messages // max(count // 100, 1), 20) # 도시 수가 많으면 기존 방식이 너무 느려서 횟수를 줄임
+    t0 = time.perf_counter()
+    for message in corpus[:legacy_runs]:
+        re.purge() # 다른 정규식에 밀려 re 내부 캐시에서 빠진 경우 (컴파일 포함)
+        legacy_find(cities, message)
+    legacy_per_msg = (time.perf_counter() - t0) / legacy_runs
+
+    legacy_find(cities, corpus[0])
+    t0 = time.perf_counter()
+    for message in corpus[:legacy_runs]:
+        legacy_find(cities, message) # re 내부 캐시에 남아 있는 경우 (목록 복사 + escape + join만)
+    legacy_warm_per_msg = (time.perf_counter() - t0) / legacy_runs
+
+    t0 = time.perf_counter()
+    matcher = CityMatcher({city: city for city in cities})
+    build_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for message in corpus:
+        matcher.find_weather_city(message)
+    matcher_per_msg = (time.perf_counter() - t0) / len(corpus)
+
+    for message in SAMPLE_MESSAGES: # 결과가 같은지 확인
+        assert legacy_find(cities, message) == matcher.find_weather_city(message), message
+
+    print(f"도시 {count:>6}개: 기존 {legacy_per_msg * 1e6:>10.1f}us/메시지 (re 캐시 적중 시 {legacy_warm_per_msg * 1e6:.1f}us), "
+          f"매처 {matcher_per_msg * 1e6:>6.1f}us/메시지 (생성 1회 {build_time * 1000:.1f}ms)")
+
+
+def bench_resolver(count: int, lookups: int):
+    cities = make_cities(count)
+    t0 = time.perf_counter()
+    resolver = CityResolver(cities)
+    build_time = time.perf_counter() - t0
+
+    rng = random.Random(count)
+    queries = [city[:-1] + rng.choice("강산천") for city in rng.sample(cities, min(lookups, len(cities)))] # 마지막 글자 오타
+    t0 = time.perf_counter()
+    for query in queries:
+        resolver.resolve(query)
+    per_lookup = (time.perf_counter() - t0) / len(queries)
+    print(f"리졸버 {count:>6}개: 조회 {per_lookup * 1e6:>7.1f}us/건 (생성 1회 {build_time * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="도시 매처 마이크로 벤치마크")
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+    for count in (12, 1000, 10000):
+        bench(count, args.messages)
+    for count in (12, 10000, 50000):
+        bench_resolver(count, args.messages)
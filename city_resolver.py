@@ -0,0 +1,171 @@
+# city_resolver.py
+# "서을 날씨"처럼 오타가 있거나 별칭/구 이름으로 물어봐도 도시를 찾아주는 리졸버.
+# 한글을 자모로 풀어서 편집 거리를 재고, 삭제 이웃 색인으로 후보를 빠르게 좁힙니다.
+
+import re
+
+_HANGUL_BASE = 0xAC00
+_HANGUL_LAST = 0xD7A3
+_JUNG_COUNT = 21
+_JONG_COUNT = 28
+
+# "도시 날씨"에서 도시 자리의 단어를 뽑아냄. 조사는 extract_city_query에서 조건이 맞을 때만 뗌
+_QUERY_RE = re.compile(r"\??\s*([^\s?]+?)(\s*)날씨")
+_PARTICLES = ("은", "는", "이", "가", "의")
+# 확실한 날씨 요청 모양: '?'로 시작하거나, 메시지 전체가 "X 날씨"(+ 어때/알려줘, 문장부호)
+_EXPLICIT_REQUEST_RE = re.compile(r"[^\s?]+\s*날씨\s*(?:어때요?|알려줘|좀)?\s*[?!.~]*")
+# 도시가 아닌데 "날씨" 앞에 자주 오는 말 (시간, 지시어, 날씨를 꾸미는 말)
+_NOT_CITY_WORDS = {
+    "오늘", "내일", "모레", "주간", "이번주", "다음주", "지금", "요즘", "현재", "오늘의", "우리", "동네", "여기",
+    "이런", "그런", "저런", "무슨", "어떤", "어느", "이", "그", "저", "이번", "요새", "좋은", "나쁜", "이상한",
+    "맑은", "흐린", "추운", "더운", "따뜻한", "쌀쌀한", "습한", "비오는", "눈오는", "궂은", "화창한", "같은", "바깥",
+}
+
+
+def decompose_hangul(text: str) -> str:
+    """한글 음절을 초성/중성/종성 자모로 풉니다. (예: '서울' -> '서울') 그 외 문자는 소문자로."""
+    out = []
+    for ch in text:
+        code = ord(ch)
+        if _HANGUL_BASE <= code <= _HANGUL_LAST:
+            index = code - _HANGUL_BASE
+            cho, rest = divmod(index, _JUNG_COUNT * _JONG_COUNT)
+            jung, jong = divmod(rest, _JONG_COUNT)
+            out.append(chr(0x1100 + cho))
+            out.append(chr(0x1161 + jung))
+            if jong:
+                out.append(chr(0x11A7 + jong))
+        else:
+            out.append(ch.lower())
+    return "".join(out)
+
+
+def edit_distance(a: str, b: str) -> int:
+    """레벤슈타인 거리 (삽입/삭제/치환 각 1)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _deletes(key: str) -> set:
+    """key에서 글자(자모) 하나를 뺀 모든 문자열. (삭제 1회 이웃)"""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class DeleteIndex:
+    """
+    편집 거리 1 이내 검색용 대칭 삭제(symmetric delete) 색인.
+    두 문자열의 거리가 1 이하이면 각자에서 한 글자씩 지운 변형 중 겹치는 것이 반드시 있으므로,
+    질의 쪽 변형 몇 개만 해시로 찾아본 뒤 실제 거리로 확인합니다. 질의 비용이 색인 크기와 무관합니다.
+    (자모처럼 글자 종류가 적은 문자열에서는 BK-트리가 거의 모든 노드를 방문하게 되어 이 방식을 씁니다.)
+    """
+    def __init__(self):
+        self._variants = {} # 변형 문자열 -> 원래 키 집합
+        self._values = {}   # 원래 키 -> 값 목록
+
+    def add(self, key: str, value):
+        values = self._values.setdefault(key, [])
+        if value not in values:
+            values.append(value)
+        for variant in _deletes(key) | {key}:
+            self._variants.setdefault(variant, set()).add(key)
+
+    def __len__(self):
+        return len(self._values)
+
+    def search(self, key: str) -> list:
+        """거리가 1 이하인 (거리, 값) 목록을 거리 순으로 돌려줍니다."""
+        candidates = set()
+        for variant in _deletes(key) | {key}:
+            candidates |= self._variants.get(variant, set())
+        found = []
+        for candidate in candidates:
+            distance = edit_distance(key, candidate)
+            if distance <= 1:
+                found.extend((distance, value) for value in self._values[candidate])
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class CityResolver:
+    """
+    city_map 키와 별칭 표를 자모 단위 색인에 넣어 두고, 자모 하나가 틀린 이름을 도시로 바꿉니다.
+    resolve()는 가장 가까운 거리의 도시 목록을 돌려줍니다. (1개면 확정, 여러 개면 되물어보기)
+    """
+    def __init__(self, cities, aliases: dict = None):
+        self._exact = {}
+        self._index = DeleteIndex()
+        for city in cities:
+            self._add(city, city)
+        for alias, city in (aliases or {}).items():
+            self._add(alias, city)
+
+    def _add(self, name: str, city: str):
+        key = decompose_hangul(name)
+        self._exact.setdefault(key, city)
+        self._index.add(key, city)
+
+    def resolve(self, name: str) -> list:
+        key = decompose_hangul(name.strip())
+        if not key:
+            return []
+        if key in self._exact:
+            return [self._exact[key]]
+        matches = self._index.search(key)
+        if not matches:
+            return []
+        best = matches[0][0]
+        cities = []
+        for distance, city in matches:
+            if distance == best and city not in cities:
+                cities.append(city)
+        return cities
+
+
+def extract_city_query(message: str):
+    """
+    '서을 날씨' -> '서을', '서울의 날씨' -> '서울'. 날씨 요청 모양이 아니거나 도시 자리에 도시가 아닌 말이 오면 None.
+    조사는 띄어 쓴 '날씨' 바로 앞에 있고 떼고 남은 말이 두 글자 이상일 때만 뗍니다. ('맑은 날씨'가 '맑'이 되지 않게)
+    """
+    match = _QUERY_RE.search(message)
+    if not match:
+        return None
+    query, spacing = match.group(1), match.group(2)
+    if query in _NOT_CITY_WORDS:
+        return None
+    if spacing and len(query) >= 3 and query.endswith(_PARTICLES):
+        query = query[:-1]
+        if query in _NOT_CITY_WORDS:
+            return None
+    return query
+
+
+def is_city_candidate(query: str) -> bool:
+    """지오코딩처럼 네트워크를 쓰기 전에 거르는 조건: 두 글자 이상이고 도시가 아닌 말이 아님."""
+    return bool(query) and len(query) >= 2 and query not in _NOT_CITY_WORDS
+
+
+def is_explicit_weather_request(message: str) -> bool:
+    """'?부산 날씨', '부산 날씨', '부산 날씨 어때?'처럼 날씨를 직접 묻는 메시지인지. 대화 중에 '날씨'가 섞인 문장은 아님."""
+    text = message.strip()
+    return text.startswith("?") or _EXPLICIT_REQUEST_RE.fullmatch(text) is not None
+
+
+_cached_resolver = None
+_cached_key = None
+
+
+def get_city_resolver(cities: dict, aliases: dict, version: int = 0) -> CityResolver:
+    """(version, 도시 수, 별칭 수)가 바뀌었을 때만 리졸버를 다시 만듭니다."""
+    global _cached_resolver, _cached_key
+    key = (version, len(cities), len(aliases))
+    if _cached_resolver is None or _cached_key != key:
+        _cached_resolver = CityResolver(cities, aliases)
+        _cached_key = key
+    return _cached_resolver
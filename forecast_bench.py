@@ -0,0 +1,81 @@
+# forecast_bench.py
+# 기존 forecast_today 방식(오늘 하루만, 항목마다 datetime 변환 + descriptions.count)과
+# forecast_engine의 열 배열 집계로 오늘 예보를 뽑는 경로를 비교합니다. (둘 다 같은 결과: 오늘 하루 요약)
+# numpy 없이 array 열을 순수 Python 루프 한 번으로 모든 날짜를 집계합니다. (내일/모레/주말/주간 예보에도 같은 결과를 씀)
+# 오늘 하루만 보면 파싱까지 포함한 첫 계산은 기존보다 느리고, 캐시에 든 응답을 다시 쓸 때부터 빨라집니다.
+# 사용법: python forecast_bench.py [--repeat 50] [--payload 녹화한_응답.json]
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+from forecast_engine import ForecastColumns
+
+DESCRIPTIONS = ["맑음", "구름 조금", "온흐림", "튼구름", "실 비", "보통 비", "눈", "박무"]
+
+
+def make_payload(entries: int, seed: int = 0) -> dict:
+    """녹화된 응답이 없을 때 쓰는 합성 응답 (3시간 간격, 설명 종류 다양)."""
+    rng = random.Random(seed)
+    start = int(time.time()) // 10800 * 10800
+    return {
+        'cod': '200',
+        'city': {'name': 'Seoul', 'timezone': 32400},
+        'list': [{'dt': start + i * 10800,
+                  'main': {'temp': rng.uniform(-5, 30)},
+                  'weather': [{'description': rng.choice(DESCRIPTIONS)}]} for i in range(entries)],
+    }
+
+
+def legacy_today(data: dict):
+    """기존 forecast_today와 같은 방식: 오늘 항목만 datetime으로 골라 min/max와 descriptions.count로 최빈값."""
+    today = datetime.now().date()
+    temps, descriptions = [], []
+    for entry in data.get('list', []):
+        if datetime.fromtimestamp(entry['dt']).date() == today:
+            temps.append(entry['main']['temp'])
+            if entry.get('weather') and len(entry['weather']) > 0:
+                descriptions.append(entry['weather'][0]['description'])
+    if not temps:
+        return None
+    return min(temps), max(temps), max(set(descriptions), key=descriptions.count) if descriptions else None
+
+
+def engine_today(data: dict):
+    """지금 _format_forecast가 캐시에 없는 응답을 처리하는 방식: 열 배열로 풀고 날짜별 요약에서 오늘을 꺼냄."""
+    columns = ForecastColumns.from_payload(data)
+    return columns.daily_summaries().get(columns.local_today(time.time()))
+
+
+def engine_today_cached(columns: ForecastColumns):
+    """캐시에 든 응답: 파싱해 둔 열 배열(ForecastCache.columns)로 요약만 다시 계산."""
+    return columns.daily_summaries().get(columns.local_today(time.time()))
+
+
+def timeit(fn, data, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - t0) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="예보 집계 벤치마크")
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--payload', help="녹화해 둔 OpenWeatherMap 응답(JSON) 파일")
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, 'r', encoding='utf-8') as f:
+            payloads = [("녹화 응답", json.load(f))]
+    else:
+        payloads = [(f"항목 {n}개", make_payload(n)) for n in (40, 400, 4000)]
+
+    for label, data in payloads:
+        legacy = timeit(legacy_today, data, args.repeat)
+        engine = timeit(engine_today, data, args.repeat)
+        cached = timeit(engine_today_cached, ForecastColumns.from_payload(data), args.repeat)
+        print(f"{label}: 기존 {legacy * 1000:8.3f}ms, 열 배열(파싱 포함) {engine * 1000:7.3f}ms ({legacy / engine:.1f}배), "
+              f"캐시된 열 배열 {cached * 1000:7.3f}ms ({legacy / cached:.1f}배)")
@@ -0,0 +1,93 @@
+# forecast_engine.py
+# OpenWeatherMap 5일/3시간 예보 응답을 열(column) 배열로 한 번만 풀어 두고,
+# 도시 현지 시간(city.timezone) 기준으로 날짜별 최저/최고 기온과 대표 날씨를 한 번에 계산합니다.
+
+from array import array
+from collections import namedtuple
+from datetime import date
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_SECONDS_PER_DAY = 86400
+
+DaySummary = namedtuple('DaySummary', ['date', 'min_temp', 'max_temp', 'main_desc', 'count'])
+
+
+class ForecastColumns:
+    """
+    예보 항목들을 시간/기온/날씨 설명 번호 배열로 보관합니다.
+    날씨 설명 문자열은 descriptions 표에 한 번씩만 저장하고 배열에는 번호만 둡니다.
+    """
+    __slots__ = ('local_day', 'temp', 'desc_id', 'descriptions', 'tz_offset')
+
+    def __init__(self, tz_offset: int = 0):
+        self.local_day = array('l')  # 현지 기준 1970-01-01부터의 날짜 번호
+        self.temp = array('d')
+        self.desc_id = array('l')    # descriptions 인덱스, 설명이 없으면 -1
+        self.descriptions = []
+        self.tz_offset = tz_offset
+
+    @classmethod
+    def from_payload(cls, data: dict) -> 'ForecastColumns':
+        """API 응답을 한 번 훑어 열 배열로 만듭니다. 필수 키가 없으면 KeyError."""
+        tz_offset = int((data.get('city') or {}).get('timezone', 0))
+        columns = cls(tz_offset)
+        desc_index = {}
+        local_day, temp, desc_id = columns.local_day, columns.temp, columns.desc_id
+        for entry in data.get('list', []):
+            local_day.append((entry['dt'] + tz_offset) // _SECONDS_PER_DAY)
+            temp.append(entry['main']['temp'])
+            weather = entry.get('weather')
+            if weather:
+                description = weather[0]['description']
+                index = desc_index.get(description)
+                if index is None:
+                    index = desc_index[description] = len(columns.descriptions)
+                    columns.descriptions.append(description)
+                desc_id.append(index)
+            else:
+                desc_id.append(-1)
+        return columns
+
+    def __len__(self):
+        return len(self.temp)
+
+    def local_today(self, now: float) -> int:
+        """현재 시각(epoch)의 현지 날짜 번호."""
+        return int((now + self.tz_offset) // _SECONDS_PER_DAY)
+
+    def daily_summaries(self) -> dict:
+        """
+        날짜 번호 -> DaySummary. 항목은 시간순이므로 같은 날짜끼리 붙어 있고, 한 번의 순회로
+        최저/최고 기온과 가장 자주 나온 날씨 설명(동률이면 먼저 나온 것)을 계산합니다.
+        """
+        summaries = {}
+        days, temps, desc_ids, descriptions = self.local_day, self.temp, self.desc_id, self.descriptions
+        n = len(temps)
+        i = 0
+        while i < n:
+            day = days[i]
+            low = high = temps[i]
+            counts = [0] * len(descriptions)
+            best_id, best_count = -1, 0
+            count = 0
+            while i < n and days[i] == day:
+                t = temps[i]
+                if t < low:
+                    low = t
+                elif t > high:
+                    high = t
+                d = desc_ids[i]
+                if d >= 0:
+                    counts[d] += 1
+                    if counts[d] > best_count:
+                        best_id, best_count = d, counts[d]
+                count += 1
+                i += 1
+            main_desc = descriptions[best_id] if best_id >= 0 else None
+            previous = summaries.get(day)
+            if previous is not None: # 시간순이 아닌 응답이 섞인 드문 경우: 합쳐서 보수적으로 처리
+                low, high = min(low, previous.min_temp), max(high, previous.max_temp)
+                main_desc = previous.main_desc or main_desc
+                count += previous.count
+            summaries[day] = DaySummary(date.fromordinal(_EPOCH_ORDINAL + day), low, high, main_desc, count)
+        return summaries
@@ -0,0 +1,120 @@
+# gemini_dispatch.py
+# 사용자별로 Gemini 요청을 한 번에 하나씩 보내는 디스패처.
+# 같은 ChatSession에 send_message_async가 동시에 두 번 들어가 대화 기록이 꼬이는 것을 막습니다.
+
+import asyncio
+import logging
+import os
+from collections import deque
+
+from gemini_scheduler import SchedulerBusy
+
+logger = logging.getLogger('HoshinoBot.dispatch')
+
+COALESCE_FOLLOWUPS = os.getenv('GEMINI_COALESCE_FOLLOWUPS', '1') == '1' # 처리 중에 온 메시지들을 한 턴으로 합칠지 여부
+
+
+class _Batch:
+    """
+    한 번의 send로 보낼 메시지 묶음. 묶음의 첫 호출자만 응답을 받고 나머지는 None을 받습니다.
+    send도 첫 호출자의 것을 씁니다. (스트리밍 답장처럼 호출자마다 send가 다를 수 있음)
+    """
+    __slots__ = ('messages', 'future', 'send')
+
+    def __init__(self, send):
+        self.messages = []
+        self.future = asyncio.get_running_loop().create_future()
+        self.send = send
+
+
+class _UserQueue:
+    __slots__ = ('batches', 'worker', 'in_flight', 'max_depth')
+
+    def __init__(self):
+        self.batches = deque()
+        self.worker: asyncio.Task = None
+        self.in_flight = 0 # 지금 보내는 중인 메시지 수
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return self.in_flight + sum(len(batch.messages) for batch in self.batches)
+
+
+class UserDispatcher:
+    """
+    submit(user_id, message, send)는 사용자별 대기열에 메시지를 넣고, 사용자마다 하나뿐인 작업자가
+    순서대로 묶음의 send(text)를 호출합니다. coalesce가 켜져 있으면 앞 요청이 처리되는 동안 쌓인 메시지들을
+    줄바꿈으로 이어 한 번의 후속 턴으로 보냅니다.
+    """
+    def __init__(self, coalesce: bool = COALESCE_FOLLOWUPS):
+        self.coalesce = coalesce
+        self._queues = {} # user_id -> _UserQueue (처리할 것이 없으면 제거)
+        self.total_sent = 0      # 실제로 보낸 send 횟수
+        self.total_coalesced = 0 # 다른 메시지에 합쳐져 따로 보내지 않은 메시지 수
+
+    async def submit(self, user_id: str, message: str, send):
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = _UserQueue()
+
+        if self.coalesce and queue.batches:
+            batch = queue.batches[-1] # 아직 시작하지 않은 마지막 묶음에 합침
+            self.total_coalesced += 1
+        else:
+            batch = _Batch(send)
+            queue.batches.append(batch)
+        batch.messages.append(message)
+        is_first = len(batch.messages) == 1
+        queue.max_depth = max(queue.max_depth, queue.depth)
+
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._drain(user_id, queue))
+
+        try:
+            result = await asyncio.shield(batch.future)
+        except Exception:
+            if not is_first:
+                return None # 오류 안내는 묶음의 첫 메시지에만
+            raise
+        return result if is_first else None
+
+    async def _drain(self, user_id: str, queue: _UserQueue):
+        try:
+            while queue.batches:
+                batch = queue.batches.popleft()
+                queue.in_flight = len(batch.messages)
+                if len(batch.messages) > 1:
+                    logger.info(f"사용자 {user_id}의 메시지 {len(batch.messages)}개를 한 턴으로 합쳐 보냅니다.")
+                try:
+                    result = await batch.send("\n".join(batch.messages))
+                    batch.future.set_result(result)
+                except Exception as e:
+                    batch.future.set_exception(e)
+                except BaseException:
+                    # 취소(스케줄러 종료, 작업 안에서 난 취소 등): 기다리는 호출자가 영원히 멈추지 않고 '바쁨' 안내를
+                    # 받도록 이 묶음과 남은 묶음을 SchedulerBusy로 끝내고, 취소는 이 작업자에서 다시 올림
+                    batch.future.set_exception(SchedulerBusy('cancelled'))
+                    while queue.batches:
+                        queue.batches.popleft().future.set_exception(SchedulerBusy('cancelled'))
+                    raise
+                finally:
+                    self.total_sent += 1
+                    queue.in_flight = 0
+        finally:
+            if not queue.batches and self._queues.get(user_id) is queue:
+                del self._queues[user_id]
+
+    def queue_depth(self, user_id: str) -> int:
+        queue = self._queues.get(user_id)
+        return queue.depth if queue else 0
+
+    def stats(self) -> dict:
+        """전체 통계와 대기 중인 사용자별 대기열 깊이."""
+        per_user = {user_id: {'depth': queue.depth, 'max_depth': queue.max_depth} for user_id, queue in self._queues.items()}
+        return {
+            'active_users': len(per_user),
+            'total_sent': self.total_sent,
+            'total_coalesced': self.total_coalesced,
+            'per_user': per_user,
+        }
@@ -0,0 +1,217 @@
+# gemini_scheduler.py
+# 봇 전체의 Gemini API 호출을 정해진 수의 작업자로만 보내는 스케줄러.
+# 레이드나 이벤트로 요청이 몰려도 동시에 나가는 호출 수를 제한해 모두가 같이 쓰는 할당량을 지키고,
+# 대기열이 가득 차거나 너무 오래 기다린 요청은 조용히 쌓아 두지 않고 SchedulerBusy로 바로 돌려보냅니다.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger('HoshinoBot.scheduler')
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')) # 동시에 보내는 Gemini 호출 수
+GEMINI_QUEUE_MAX = int(os.getenv('GEMINI_QUEUE_MAX', '100')) # 대기열 최대 길이, 넘치면 바쁘다고 답함
+GEMINI_QUEUE_DEADLINE = float(os.getenv('GEMINI_QUEUE_DEADLINE', '20')) # 이 시간 안에 시작하지 못한 요청은 포기 (초)
+_METRIC_WINDOW = 200 # 최근 몇 건으로 대기/처리 시간 평균과 p95를 계산할지
+
+# 우선순위 (작을수록 먼저)
+PRIORITY_DM = 0
+PRIORITY_MENTION = 1
+PRIORITY_PREFIX = 2 # '?'로 시작하는 메시지
+PRIORITY_BACKGROUND = 3 # 대화 요약 같은 백그라운드 호출
+PRIORITY_NAMES = {PRIORITY_DM: 'DM', PRIORITY_MENTION: '멘션', PRIORITY_PREFIX: '?', PRIORITY_BACKGROUND: '백그라운드'}
+
+
+class SchedulerBusy(Exception):
+    """대기열이 가득 찼거나, 기한 안에 시작하지 못해 요청을 보내지 않았을 때."""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Job:
+    __slots__ = ('call', 'priority', 'future', 'enqueued', 'deadline')
+
+    def __init__(self, call, priority: int, deadline: float):
+        self.call = call
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.deadline = deadline
+
+
+def _summary(samples) -> tuple:
+    if not samples:
+        return 0.0, 0.0
+    ordered = sorted(samples)
+    return sum(ordered) / len(ordered), ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+
+def _task_cancelling(task) -> bool:
+    """Task.cancelling()은 3.11부터 있어서, 그 아래에서는 close()의 _closing 표시만 봅니다."""
+    cancelling = getattr(task, 'cancelling', None)
+    return bool(cancelling and cancelling())
+
+
+class GeminiScheduler:
+    """
+    run(call, priority)는 call()이 돌려주는 코루틴을 작업자 중 하나가 실행하게 하고 그 결과를 돌려줍니다.
+    대기열은 (우선순위, 도착 순서) 순으로 꺼내며, 가득 찼을 때 더 급한 요청이 오면 가장 덜 급한 대기 요청을 밀어냅니다.
+    기한(deadline)은 대기 시간에만 적용됩니다. 이미 시작한 호출은 끝까지 기다립니다.
+    """
+    def __init__(self, workers: int = GEMINI_MAX_CONCURRENCY, max_queue: int = GEMINI_QUEUE_MAX,
+                 deadline: float = GEMINI_QUEUE_DEADLINE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._heap = [] # (priority, seq, _Job)
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Condition = None
+        self._tasks = []
+        self._closing = False
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.shed_full = 0      # 대기열이 가득 차 거절/밀려남
+        self.shed_deadline = 0  # 기한 안에 시작하지 못함
+        self.shed_predicted = 0 # 예상 대기 시간이 기한을 넘어 바로 거절
+        self.max_depth = 0
+        self.wait_times = deque(maxlen=_METRIC_WINDOW)
+        self.run_times = deque(maxlen=_METRIC_WINDOW)
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._work_forever(i)) for i in range(self.workers)]
+        logger.info(f"Gemini 스케줄러 시작: 작업자 {self.workers}개, 대기열 {self.max_queue}, 대기 기한 {self.deadline}초")
+
+    @property
+    def queue_length(self) -> int:
+        return sum(1 for _, _, job in self._heap if not job.future.done())
+
+    def estimated_wait(self, priority: int = PRIORITY_BACKGROUND) -> float:
+        """priority로 지금 들어오면 시작까지 기다릴 것으로 예상되는 시간 (초)."""
+        ahead = sum(1 for p, _, job in self._heap if p <= priority and not job.future.done())
+        if self.running + ahead < self.workers:
+            return 0.0
+        avg_run = _summary(self.run_times)[0]
+        return (self.running + ahead - self.workers + 1) * avg_run / self.workers
+
+    def _shed(self, job: _Job, reason: str):
+        if not job.future.done():
+            job.future.set_exception(SchedulerBusy(reason))
+
+    def _make_room(self, priority: int) -> bool:
+        """대기열에 자리가 없으면 priority보다 덜 급한 대기 요청 중 가장 늦게 온 것을 밀어냅니다."""
+        self._heap = [entry for entry in self._heap if not entry[2].future.done()]
+        heapq.heapify(self._heap)
+        if len(self._heap) < self.max_queue:
+            return True
+        victim = max(self._heap, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+        self._heap.remove(victim)
+        heapq.heapify(self._heap)
+        self.shed_full += 1
+        self._shed(victim[2], 'queue_full')
+        return True
+
+    async def run(self, call, priority: int = PRIORITY_BACKGROUND, deadline: float = None):
+        self._ensure_started()
+        deadline = self.deadline if deadline is None else deadline
+        if not self._make_room(priority):
+            self.shed_full += 1
+            logger.info(f"Gemini 대기열이 가득 차 요청을 거절합니다. (대기 {len(self._heap)}, 우선순위 {PRIORITY_NAMES.get(priority, priority)})")
+            raise SchedulerBusy('queue_full')
+        if self.estimated_wait(priority) > deadline:
+            self.shed_predicted += 1
+            logger.info(f"예상 대기 시간이 기한({deadline}초)을 넘어 요청을 거절합니다. (대기 {len(self._heap)})")
+            raise SchedulerBusy('predicted_wait')
+
+        job = _Job(call, priority, time.monotonic() + deadline)
+        heapq.heappush(self._heap, (priority, next(self._seq), job))
+        self.max_depth = max(self.max_depth, len(self._heap))
+        async with self._wakeup:
+            self._wakeup.notify()
+        return await job.future # 호출자가 취소되면 future도 취소되어 작업자가 건너뜀
+
+    async def _next_job(self) -> _Job:
+        async with self._wakeup:
+            while True:
+                while self._heap:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.future.done():
+                        continue # 밀려났거나 호출자가 취소함
+                    if time.monotonic() > job.deadline:
+                        self.shed_deadline += 1
+                        self._shed(job, 'deadline')
+                        continue
+                    return job
+                await self._wakeup.wait()
+
+    async def _work_forever(self, index: int):
+        while True:
+            job = await self._next_job()
+            started = time.monotonic()
+            self.wait_times.append(started - job.enqueued)
+            self.running += 1
+            try:
+                result = await job.call()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                if self._closing or _task_cancelling(asyncio.current_task()):
+                    raise # 작업자 자신이 취소됨 (close, 종료 중인 이벤트 루프)
+                self.failed += 1 # job.call() 안에서 난 취소: 이 작업만 실패로 치고 작업자는 계속
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.running -= 1
+                self.run_times.append(time.monotonic() - started)
+
+    async def close(self):
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for _, _, job in self._heap:
+            self._shed(job, 'closed')
+        self._heap.clear()
+
+    def stats(self) -> dict:
+        wait_avg, wait_p95 = _summary(self.wait_times)
+        run_avg, run_p95 = _summary(self.run_times)
+        by_priority = {}
+        for priority, _, job in self._heap:
+            if not job.future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                by_priority[name] = by_priority.get(name, 0) + 1
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'queued': self.queue_length,
+            'max_queue': self.max_queue,
+            'max_depth': self.max_depth,
+            'queued_by_priority': by_priority,
+            'completed': self.completed,
+            'failed': self.failed,
+            'shed_full': self.shed_full,
+            'shed_deadline': self.shed_deadline,
+            'shed_predicted': self.shed_predicted,
+            'wait_avg': wait_avg, 'wait_p95': wait_p95,
+            'run_avg': run_avg, 'run_p95': run_p95,
+            'estimated_wait': self.estimated_wait(),
+        }
@@ -0,0 +1,137 @@
+# geocoding.py
+# city_map에 없는 도시 이름을 좌표로 바꾼 결과를 SQLite 파일에 보관하는 캐시.
+# 한 번 찾은 도시는 이후 네트워크 없이 바로 좌표를 얻습니다.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger('HoshinoBot.geocoding')
+
+GEOCODE_CACHE_FILE = os.getenv('GEOCODE_CACHE_FILE', 'geocode_cache.sqlite3')
+GEOCODE_CACHE_MAX = int(os.getenv('GEOCODE_CACHE_MAX', '5000')) # 최대 보관 건수 (넘으면 가장 오래 안 쓴 것부터 삭제)
+GEOCODE_TOUCH_INTERVAL = float(os.getenv('GEOCODE_TOUCH_INTERVAL', '3600')) # 적중한 항목의 마지막 사용 시각을 이보다 자주 기록하지 않음 (초)
+GEOCODE_NOT_FOUND_TTL = float(os.getenv('GEOCODE_NOT_FOUND_TTL', '86400')) # '없는 도시' 기록을 믿는 시간 (초, 일시적인 API 오류 대비)
+
+
+class GeoPlace(namedtuple('GeoPlace', ['name', 'lat', 'lon', 'country'])):
+    """지오코딩 결과. key는 예보 캐시/요청 합치기에서 쓰는 위치 식별자입니다."""
+    __slots__ = ()
+
+    @property
+    def key(self) -> str:
+        return f"geo:{self.lat:.4f},{self.lon:.4f}"
+
+
+NOT_FOUND = object() # "찾아봤지만 없는 도시"도 캐시해서 같은 질의로 다시 API를 부르지 않음
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.strip().lower().split())
+
+
+class GeocodeCache:
+    """
+    질의 -> GeoPlace를 SQLite에 저장하는 LRU 캐시. 파일은 처음 조회할 때 엽니다.
+    sqlite 호출은 짧지만 이벤트 루프 밖(스레드 풀)에서 부르는 것을 전제로 잠금을 둡니다.
+    적중할 때마다 쓰지 않도록 마지막 사용 시각은 touch_interval이 지났을 때만 갱신하고(LRU 순서는 그만큼 거칠어짐),
+    '없는 도시' 기록은 갱신하지 않아 저장 후 not_found_ttl이 지나면 지우고 다시 찾게 합니다.
+    """
+    def __init__(self, path: str = GEOCODE_CACHE_FILE, max_entries: int = GEOCODE_CACHE_MAX,
+                 touch_interval: float = GEOCODE_TOUCH_INTERVAL, not_found_ttl: float = GEOCODE_NOT_FOUND_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.not_found_ttl = not_found_ttl
+        self._conn: sqlite3.Connection = None
+        self._count = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            " query TEXT PRIMARY KEY, name TEXT, lat REAL, lon REAL, country TEXT,"
+            " found INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS places_last_used ON places (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+        logger.info(f"지오코딩 캐시 '{self.path}' 열기 ({self._count}건)")
+
+    def get(self, query: str):
+        """GeoPlace, NOT_FOUND(없는 도시로 기록됨), 또는 None(캐시에 없음)을 반환합니다."""
+        query = normalize_query(query)
+        with self._lock:
+            self._connect()
+            row = self._conn.execute(
+                "SELECT name, lat, lon, country, found, last_used FROM places WHERE query = ?", (query,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and not row[4] and now - row[5] > self.not_found_ttl:
+                self._conn.execute("DELETE FROM places WHERE query = ?", (query,)) # 오래된 '없는 도시': 다시 찾아봄
+                self._conn.commit()
+                self._count -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if row[4] and now - row[5] >= self.touch_interval:
+                self._conn.execute("UPDATE places SET last_used = ? WHERE query = ?", (now, query))
+                self._conn.commit()
+        if not row[4]:
+            return NOT_FOUND
+        return GeoPlace(row[0], row[1], row[2], row[3])
+
+    def put(self, query: str, place):
+        """place가 None이면 '없는 도시'로 기록합니다."""
+        query = normalize_query(query)
+        with self._lock:
+            self._connect()
+            exists = self._conn.execute("SELECT 1 FROM places WHERE query = ?", (query,)).fetchone()
+            if place is None:
+                values = (query, None, None, None, None, 0, time.time())
+            else:
+                values = (query, place.name, place.lat, place.lon, place.country, 1, time.time())
+            self._conn.execute("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+            if not exists:
+                self._count += 1
+            if self._count > self.max_entries:
+                overflow = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM places WHERE query IN (SELECT query FROM places ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {'entries': self._count, 'hits': self.hits, 'misses': self.misses, 'max_entries': self.max_entries}
+
+
+class StaticGeocoder:
+    """
+    네트워크 없이 고정된 표로 답하는 지오코더. 테스트나 오프라인 벤치마크에서
+    weather.geocoder를 이것으로 바꿔 끼워 사용합니다.
+    """
+    def __init__(self, places: dict):
+        self._places = {normalize_query(query): place for query, place in places.items()}
+        self.calls = 0
+
+    async def geocode(self, query: str):
+        self.calls += 1
+        return self._places.get(normalize_query(query))
@@ -0,0 +1,169 @@
+# history_store.py
+# 사용자별 Gemini 대화 기록을 SQLite(WAL)에 남겨 두는 저장소.
+# 재시작이나 세션 정리 후에도 그 사용자가 다시 말을 걸 때 기록을 읽어 세션을 되살립니다.
+# 쓰기는 모아서 스레드 풀에서 한꺼번에 처리하므로 이벤트 루프를 막지 않습니다.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('HoshinoBot.history')
+
+HISTORY_DB_FILE = os.getenv('CHAT_HISTORY_FILE', 'chat_history.sqlite3')
+HISTORY_FLUSH_INTERVAL = float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', '1.0')) # 모아 둔 기록을 쓰는 주기 (초)
+HISTORY_BATCH_SIZE = 200 # 이만큼 쌓이면 주기를 기다리지 않고 바로 씀
+HISTORY_LOAD_TURNS = int(os.getenv('CHAT_HISTORY_LOAD_TURNS', '100')) # 세션을 되살릴 때 읽어올 최근 기록 수
+
+_APPEND = 'append'
+_CLEAR = 'clear'
+
+
+class HistoryStore:
+    """
+    append_exchange()는 메모리 대기열에 넣기만 하고, 작성 작업이 주기적으로(또는 많이 쌓이면 바로)
+    한 트랜잭션으로 기록합니다. load()는 대기 중인 기록을 먼저 쓴 뒤 최근 기록을 읽습니다.
+    DB 파일은 start()에서 열기만 하고 사용자 수에 비례하는 작업은 하지 않습니다.
+    """
+    def __init__(self, path: str = HISTORY_DB_FILE, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 batch_size: int = HISTORY_BATCH_SIZE, load_turns: int = HISTORY_LOAD_TURNS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.load_turns = load_turns
+        self._conn: sqlite3.Connection = None
+        self._lock = threading.Lock()         # sqlite 연결 보호 (스레드 풀)
+        self._flush_lock: asyncio.Lock = None # 배치가 순서대로 기록되도록
+        self._pending = []                    # (op, user_id, role, text, created)
+        self._wakeup: asyncio.Event = None
+        self._writer: asyncio.Task = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.sessions_loaded = 0
+
+    # --- sqlite (스레드 풀에서 실행) ---
+    def _connect(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # WAL에서는 커밋마다 fsync하지 않아도 손상되지 않음
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL,"
+            " role TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS turns_user ON turns (user_id, id)")
+        self._conn.commit()
+        logger.info(f"대화 기록 저장소 '{self.path}' 열기")
+
+    def _write_batch(self, batch: list):
+        with self._lock:
+            self._connect()
+            with self._conn: # 배치 하나 = 트랜잭션 하나
+                for op, user_id, role, text, created in batch:
+                    if op == _APPEND:
+                        self._conn.execute(
+                            "INSERT INTO turns (user_id, role, text, created) VALUES (?, ?, ?, ?)",
+                            (user_id, role, text, created),
+                        )
+                    else:
+                        self._conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+
+    def _read_recent(self, user_id: str, limit: int) -> list:
+        with self._lock:
+            self._connect()
+            rows = self._conn.execute(
+                "SELECT role, text FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _has_rows(self, user_id: str) -> bool:
+        with self._lock:
+            self._connect()
+            return self._conn.execute("SELECT 1 FROM turns WHERE user_id = ? LIMIT 1", (user_id,)).fetchone() is not None
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- 이벤트 루프 쪽 ---
+    async def start(self):
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._connect)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_forever())
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+    def _enqueue(self, op: str, user_id: str, role: str = None, text: str = None):
+        self._pending.append((op, user_id, role, text, time.time()))
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def append_exchange(self, user_id: str, user_text: str, model_text: str):
+        """한 번의 주고받기(사용자 메시지 + 모델 응답)를 기록 대기열에 넣습니다."""
+        self._enqueue(_APPEND, user_id, 'user', user_text)
+        self._enqueue(_APPEND, user_id, 'model', model_text)
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"대화 기록 {len(batch)}건 저장 실패: {e}")
+                self._pending[:0] = batch # 다음 주기에 다시 시도
+                return
+            self.rows_written += len(batch)
+            self.batches_written += 1
+
+    async def _write_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def load(self, user_id: str) -> list:
+        """start_chat(history=...)에 넣을 최근 기록. 없으면 빈 목록."""
+        await self.flush() # 진행 중인 배치까지 기다려야 방금 나눈 대화가 빠지지 않음
+        rows = await asyncio.to_thread(self._read_recent, user_id, self.load_turns)
+        if rows and rows[0][0] != 'user':
+            rows = rows[1:] # 잘린 앞부분이 모델 응답으로 시작하지 않도록
+        if rows:
+            self.sessions_loaded += 1
+        return [{'role': role, 'parts': [text]} for role, text in rows]
+
+    async def clear(self, user_id: str) -> bool:
+        """사용자의 저장된 기록을 지웁니다. 지울 기록이 있었으면 True."""
+        had_pending = any(op[0] == _APPEND and op[1] == user_id for op in self._pending)
+        had_rows = had_pending or await asyncio.to_thread(self._has_rows, user_id)
+        self._enqueue(_CLEAR, user_id)
+        return had_rows
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'sessions_loaded': self.sessions_loaded,
+        }
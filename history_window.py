@@ -0,0 +1,190 @@
+# history_window.py
+# ChatSession 대화 기록을 토큰 예산 안에 유지하는 관리자.
+# 최근 대화는 그대로 두고, 예산을 넘긴 오래된 대화는 백그라운드에서 요약 한 턴으로 접습니다.
+# 요청이 컨텍스트 한도를 넘어 실패한 뒤 세션을 통째로 지우는 일을 미리 막기 위한 것입니다.
+
+import asyncio
+import logging
+import os
+import weakref
+
+logger = logging.getLogger('HoshinoBot.window')
+
+HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '6000')) # 이보다 길어지면 오래된 대화를 요약
+HISTORY_TOKEN_LIMIT = int(os.getenv('CHAT_HISTORY_TOKEN_LIMIT', '12000')) # 요약이 늦어져도 절대 넘기지 않는 상한
+HISTORY_KEEP_RATIO = 0.5 # 요약할 때 예산 중 원문 그대로 남길 최근 대화 비율
+
+SUMMARY_PREFIX = "(지금까지의 대화 요약)\n"
+SUMMARY_ACK = "응, 지금까지 나눈 이야기 기억하고 있어, 선생."
+SUMMARY_INSTRUCTION = (
+    "다음은 사용자와 AI 캐릭터 '호시노'의 이전 대화야. 이후 대화를 이어가는 데 필요한 사실, "
+    "사용자의 정보와 취향, 약속, 진행 중인 주제를 빠짐없이 한국어로 간결하게 요약해줘. "
+    "요약만 출력해.\n\n"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수. 영문/숫자는 약 4자당 1토큰, 한글 등은 글자당 약 1토큰으로 셉니다."""
+    ascii_chars = sum(1 for ch in text if ch < '\x80')
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars) + 1
+
+
+def turn_role_and_text(content) -> tuple:
+    """Content 객체와 {'role', 'parts'} 딕셔너리 양쪽에서 (역할, 텍스트)를 꺼냅니다."""
+    if isinstance(content, dict):
+        role, parts = content.get('role'), content.get('parts', [])
+    else:
+        role, parts = content.role, content.parts
+    texts = []
+    for part in parts:
+        text = part if isinstance(part, str) else getattr(part, 'text', None)
+        if text:
+            texts.append(text)
+    return role, "\n".join(texts)
+
+
+class _WindowState:
+    __slots__ = ('turn_tokens', 'summary', 'summarizing', 'pending')
+
+    def __init__(self):
+        self.turn_tokens = [] # history와 같은 순서의 턴별 토큰 수
+        self.summary = None   # 마지막으로 만든 요약 문자열
+        self.summarizing: asyncio.Task = None
+        self.pending = None   # 다 만들었지만 아직 기록에 넣지 않은 (요약한 마지막 턴, 턴 수, 요약)
+
+
+class HistoryWindow:
+    """
+    fit()은 보내기 직전에 호출해 기록이 limit를 넘지 않도록 가장 오래된 주고받기를 잘라내고,
+    after_reply()는 응답 뒤에 호출해 기록이 budget을 넘으면 오래된 부분의 요약을 백그라운드로 시작합니다.
+    요약이 끝나도 기록은 바로 건드리지 않고, 다음 fit()에서(그 사용자의 요청이 진행 중이지 않을 때) 그 부분을
+    [요약, 확인 응답] 두 턴으로 바꿉니다. 스트리밍 중인 세션의 history를 바꾸면 진행 중인 주고받기가 세션에 남지 않기 때문입니다.
+    summarize(text)는 요약 문자열을 돌려주는 코루틴입니다.
+    """
+    def __init__(self, summarize, budget: int = HISTORY_TOKEN_BUDGET, limit: int = HISTORY_TOKEN_LIMIT):
+        self.summarize = summarize
+        self.budget = budget
+        self.limit = max(limit, budget)
+        self._states = weakref.WeakKeyDictionary() # ChatSession -> _WindowState (정리된 세션은 자동으로 빠짐)
+        self.summaries_made = 0
+        self.summary_failures = 0
+        self.turns_folded = 0
+        self.turns_dropped = 0
+        self.requests = 0
+        self.prompt_tokens = 0 # API가 알려준 실제 입력 토큰 합계 (usage_metadata)
+
+    def _state(self, chat_session) -> _WindowState:
+        state = self._states.get(chat_session)
+        if state is None:
+            state = self._states[chat_session] = _WindowState()
+        return state
+
+    def _sync(self, state: _WindowState, history: list) -> list:
+        """새로 붙은 턴의 토큰 수만 계산합니다. 기록이 바깥에서 바뀌었으면 전부 다시 셉니다."""
+        tokens = state.turn_tokens
+        if len(tokens) > len(history):
+            tokens.clear()
+        for content in history[len(tokens):]:
+            tokens.append(estimate_tokens(turn_role_and_text(content)[1]))
+        return tokens
+
+    def history_tokens(self, chat_session) -> int:
+        return sum(self._sync(self._state(chat_session), chat_session.history))
+
+    def fit(self, user_id: str, chat_session, incoming: str = "") -> int:
+        """
+        보내기 직전(그 사용자의 다른 요청이 진행 중이지 않을 때)에 호출합니다. 다 만든 요약이 있으면 먼저 넣고,
+        보낼 메시지까지 합쳐 limit 이하가 되도록 오래된 주고받기를 버린 뒤 보낼 기록의 토큰 수를 돌려줍니다.
+        """
+        state = self._state(chat_session)
+        if state.pending is not None:
+            self._apply_summary(user_id, chat_session, state)
+        history = chat_session.history
+        tokens = self._sync(state, history)
+        total = sum(tokens) + estimate_tokens(incoming)
+        if total <= self.limit:
+            return total
+        cut = 0
+        while cut < len(history) and total > self.limit:
+            total -= tokens[cut]
+            cut += 1
+        while cut < len(history) and turn_role_and_text(history[cut])[0] != 'user':
+            total -= tokens[cut] # 항상 사용자 턴부터 시작하도록
+            cut += 1
+        chat_session.history = history[cut:]
+        del tokens[:cut]
+        self.turns_dropped += cut
+        logger.warning(f"사용자 {user_id}의 대화 기록이 상한({self.limit}토큰)을 넘어 오래된 {cut}턴을 잘라냈습니다.")
+        return total
+
+    def after_reply(self, user_id: str, chat_session, response=None):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_token_count
+        state = self._state(chat_session)
+        history = chat_session.history
+        tokens = self._sync(state, history)
+        if sum(tokens) <= self.budget or state.pending is not None:
+            return
+        if state.summarizing is not None and not state.summarizing.done():
+            return
+        keep_budget = int(self.budget * HISTORY_KEEP_RATIO)
+        cut, kept = len(history), 0
+        while cut > 0 and kept + tokens[cut - 1] <= keep_budget:
+            cut -= 1
+            kept += tokens[cut]
+        while cut < len(history) and turn_role_and_text(history[cut])[0] != 'user':
+            cut += 1
+        if cut < 2:
+            return
+        folded = history[:cut]
+        state.summarizing = asyncio.create_task(self._fold(user_id, chat_session, state, folded))
+
+    async def _fold(self, user_id: str, chat_session, state: _WindowState, folded: list):
+        lines = []
+        for content in folded:
+            role, text = turn_role_and_text(content)
+            if role == 'user' and text.startswith(SUMMARY_PREFIX):
+                lines.append(text) # 이전 요약도 새 요약에 포함 (누적 요약)
+            elif text != SUMMARY_ACK:
+                lines.append(f"{'사용자' if role == 'user' else '호시노'}: {text}")
+        try:
+            summary = (await self.summarize(SUMMARY_INSTRUCTION + "\n".join(lines))).strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.summary_failures += 1
+            logger.error(f"사용자 {user_id}의 대화 요약 실패 (다음 응답 뒤 다시 시도): {e}")
+            return
+        state.pending = (folded[-1], len(folded), summary) # 기록은 다음 fit()에서 바꿈
+        state.summary = summary
+        self.summaries_made += 1
+
+    def _apply_summary(self, user_id: str, chat_session, state: _WindowState):
+        last_folded, folded_count, summary = state.pending
+        state.pending = None
+        history = chat_session.history
+        # 요약하는 사이 fit()이 앞부분을 더 잘라냈을 수 있으므로, 요약한 마지막 턴의 현재 위치까지를 바꿈
+        end = next((i for i, content in enumerate(history) if content is last_folded), None)
+        if end is None:
+            return # 기록이 초기화되었거나 요약한 부분이 모두 잘려 나감
+        chat_session.history = [
+            {'role': 'user', 'parts': [SUMMARY_PREFIX + summary]},
+            {'role': 'model', 'parts': [SUMMARY_ACK]},
+        ] + history[end + 1:]
+        state.turn_tokens.clear() # 아래 _sync에서 새 기록 기준으로 다시 셈
+        self.turns_folded += folded_count
+        logger.info(f"사용자 {user_id}의 오래된 대화 {folded_count}턴을 요약 한 턴({estimate_tokens(summary)}토큰)으로 접었습니다.")
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._states),
+            'budget': self.budget,
+            'limit': self.limit,
+            'summaries_made': self.summaries_made,
+            'summary_failures': self.summary_failures,
+            'turns_folded': self.turns_folded,
+            'turns_dropped': self.turns_dropped,
+            'avg_prompt_tokens': self.prompt_tokens / self.requests if self.requests else 0.0,
+        }
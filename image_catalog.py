@@ -0,0 +1,182 @@
+# image_catalog.py
+# !사진에 쓰는 img 폴더의 그림 목록을 메모리에 들고, image_catalog.json에 저장해 둡니다.
+# 요청마다 폴더 전체를 listdir + stat하지 않고, 폴더 수정 시각이 바뀌었을 때만 새로 생긴 파일만 stat합니다.
+# 파일을 보낼 수 있는 크기순으로 정렬해 두어, 업로드 한도 안의 파일 중 하나를 bisect + 난수 한 번으로 고릅니다.
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger('HoshinoBot.image_catalog')
+
+IMAGE_CATALOG_FILE = os.getenv('IMAGE_CATALOG_FILE', 'image_catalog.json') # 그림 목록 저장 파일
+IMAGE_CATALOG_POLL = float(os.getenv('IMAGE_CATALOG_POLL', '30')) # 폴더가 바뀌었는지 확인하는 간격 (초)
+
+
+def _scan(folder: str, extensions: set, known: dict) -> tuple:
+    """
+    (폴더 수정 시각 ns, {파일명: [크기, 수정 시각 ns, inode]}). 이미 아는 파일은 inode가 같을 때만 stat하지 않습니다.
+    (같은 이름으로 바꿔 넣은 파일은 inode가 달라 다시 stat) 스레드 풀에서 실행됩니다.
+    """
+    dir_mtime_ns = os.stat(folder).st_mtime_ns
+    files = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            cached = known.get(entry.name)
+            if cached is not None and len(cached) == 3 and cached[2] == entry.inode():
+                files[entry.name] = cached
+            elif entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns, entry.inode()]
+    return dir_mtime_ns, files
+
+
+class ImageCatalog:
+    """
+    start()는 저장된 목록을 불러오고(없거나 폴더가 바뀌었으면 스레드에서 다시 훑고) 주기적인 확인을 시작합니다.
+    pick(budget)은 보낼 크기가 budget 이하인 파일 중 하나를 (경로, 원본 크기)로, 없으면 None을 돌려줍니다.
+    size_hint(path, size)를 주면 너무 큰 파일은 그 함수가 알려준 크기(예: 줄인 변형본 크기)로 따집니다.
+    """
+    def __init__(self, folder: str, extensions: set, manifest_path: str = IMAGE_CATALOG_FILE,
+                 poll: float = IMAGE_CATALOG_POLL, size_hint=None, hint_above: int = 0):
+        self.folder = folder
+        self.extensions = {ext.lower() for ext in extensions}
+        self.manifest_path = manifest_path
+        self.poll = poll
+        self.size_hint = size_hint
+        self.hint_above = hint_above # 이 크기를 넘는 파일만 size_hint로 다시 따짐
+        self.ready = False
+        self.exists = False
+        self._files = {}    # 파일명 -> [크기, 수정 시각 ns, inode]
+        self._dir_mtime_ns = None
+        self._hints = {}    # 너무 큰 파일명 -> size_hint 결과
+        self._order = []    # 보낼 크기순 파일명
+        self._sizes = []    # _order와 같은 순서의 보낼 크기 (bisect용)
+        self._task = None
+        self.scans = 0
+        self.last_scan_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        await self._load()
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"그림 목록 갱신 중 오류: {e}", exc_info=True)
+            self.ready = True
+            await asyncio.sleep(self.poll)
+
+    def _read_manifest(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def _load(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return
+        try:
+            raw = await asyncio.to_thread(self._read_manifest)
+            if raw.get('folder') != self.folder:
+                return # 다른 폴더의 목록
+            self._files = {name: list(value) for name, value in raw.get('files', {}).items()}
+            self._dir_mtime_ns = raw.get('dir_mtime_ns')
+            self.exists = True
+            self._reindex()
+            logger.info(f"저장된 그림 목록 {len(self._files)}개를 불러왔습니다.")
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.warning(f"그림 목록 파일 '{self.manifest_path}'를 읽지 못해 폴더를 새로 훑습니다: {e}")
+            self._files, self._dir_mtime_ns = {}, None
+
+    def _write_manifest(self, snapshot: dict):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def refresh(self, force: bool = False):
+        """폴더 수정 시각이 바뀌었을 때만 다시 훑습니다. 너무 큰 파일의 size_hint는 매번 다시 확인합니다."""
+        try:
+            dir_mtime_ns = (await asyncio.to_thread(os.stat, self.folder)).st_mtime_ns
+        except OSError:
+            if self.exists:
+                logger.warning(f"이미지 폴더 '{self.folder}'를 찾을 수 없습니다.")
+            self.exists = False
+            self._files, self._dir_mtime_ns = {}, None
+            self._reindex()
+            return
+        self.exists = True
+        if force or dir_mtime_ns != self._dir_mtime_ns:
+            started = time.perf_counter()
+            self._dir_mtime_ns, self._files = await asyncio.to_thread(_scan, self.folder, self.extensions, dict(self._files))
+            self.scans += 1
+            self.last_scan_ms = (time.perf_counter() - started) * 1000
+            self._reindex()
+            logger.info(f"이미지 폴더를 다시 훑었습니다: {len(self._files)}개 ({self.last_scan_ms:.0f}ms)")
+            if self.manifest_path:
+                snapshot = {'folder': self.folder, 'dir_mtime_ns': self._dir_mtime_ns, 'files': dict(self._files)}
+                try:
+                    await asyncio.to_thread(self._write_manifest, snapshot)
+                except OSError as e:
+                    logger.warning(f"그림 목록 저장 실패: {e}")
+        elif self._refresh_hints():
+            self._reindex(hints_ready=True)
+
+    def _refresh_hints(self) -> bool:
+        """너무 큰 파일의 size_hint가 달라졌으면(예: 변형본이 새로 생김) True."""
+        if self.size_hint is None:
+            return False
+        hints = {}
+        for name, (size, *_) in self._files.items():
+            if size > self.hint_above:
+                hints[name] = self.size_hint(os.path.join(self.folder, name), size)
+        changed = hints != self._hints
+        self._hints = hints
+        return changed
+
+    def _reindex(self, hints_ready: bool = False):
+        if not hints_ready:
+            self._refresh_hints()
+        sized = []
+        for name, (size, *_) in self._files.items():
+            hint = self._hints.get(name)
+            sized.append((min(size, hint) if hint else size, name))
+        sized.sort()
+        self._sizes = [size for size, _ in sized]
+        self._order = [name for _, name in sized]
+
+    def pick(self, budget: int) -> tuple:
+        count = bisect.bisect_right(self._sizes, budget)
+        if count == 0:
+            return None
+        name = self._order[random.randrange(count)]
+        return os.path.join(self.folder, name), self._files[name][0]
+
+    def discard(self, path: str):
+        """보내려다 없어진 파일은 다음 폴더 확인 전까지 고르지 않음."""
+        name = os.path.basename(path)
+        if self._files.pop(name, None) is not None:
+            self._reindex()
+
+    def stats(self, budget: int = None) -> dict:
+        return {
+            'ready': self.ready,
+            'files': len(self._files),
+            'sendable': bisect.bisect_right(self._sizes, budget) if budget is not None else len(self._sizes),
+            'scans': self.scans,
+            'last_scan_ms': self.last_scan_ms,
+        }
@@ -0,0 +1,88 @@
+# image_catalog_bench.py
+# 그림 30,000개가 든 임시 폴더에서 기존 !사진의 그림 고르기(매번 listdir + 파일마다 isfile)와
+# image_catalog.ImageCatalog 조회를 비교합니다. 디스코드 전송은 빼고 파일 고르기까지만 잽니다.
+# 사용법: python image_catalog_bench.py [--files 30000] [--lookups 2000]
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from image_catalog import ImageCatalog
+
+ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"}
+BUDGET = int(8 * 1024 * 1024 * 0.975)
+
+
+def make_folder(folder: str, files: int):
+    extensions = sorted(ALLOWED_IMAGE_EXTENSIONS)
+    for i in range(files):
+        with open(os.path.join(folder, f"img_{i}{extensions[i % len(extensions)]}"), 'wb') as f:
+            f.write(bytes(32))
+
+
+def legacy_pick(folder: str):
+    """기존 show_random_image와 같은 방식: 요청마다 폴더 전체를 읽고 파일마다 isfile."""
+    valid_images = [
+        f for f in os.listdir(folder)
+        if os.path.isfile(os.path.join(folder, f)) and os.path.splitext(f)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
+    ]
+    return os.path.join(folder, random.choice(valid_images)) if valid_images else None
+
+
+async def run_bench(files: int, lookups: int):
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, 'img')
+        os.mkdir(folder)
+        make_folder(folder, files)
+        manifest = os.path.join(root, 'image_catalog.json') # 그림 폴더 밖에 둬야 저장할 때 폴더 수정 시각이 안 바뀜
+
+        legacy_runs = max(lookups // 50, 10) # 기존 방식은 느려서 횟수를 줄임
+        t0 = time.perf_counter()
+        for _ in range(legacy_runs):
+            legacy_pick(folder)
+        legacy_per_call = (time.perf_counter() - t0) / legacy_runs
+
+        catalog = ImageCatalog(folder, ALLOWED_IMAGE_EXTENSIONS, manifest_path=manifest)
+        t0 = time.perf_counter()
+        await catalog.refresh()
+        build_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(lookups):
+            catalog.pick(BUDGET)
+        pick_per_call = (time.perf_counter() - t0) / lookups
+
+        with open(os.path.join(folder, "img_new.png"), 'wb') as f:
+            f.write(bytes(32))
+        t0 = time.perf_counter()
+        await catalog.refresh()
+        incremental_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        await catalog.refresh()
+        unchanged_time = time.perf_counter() - t0
+
+        reloaded = ImageCatalog(folder, ALLOWED_IMAGE_EXTENSIONS, manifest_path=manifest)
+        t0 = time.perf_counter()
+        await reloaded._load()
+        await reloaded.refresh()
+        restart_time = time.perf_counter() - t0
+
+    print(f"그림 {files}개, 조회 {lookups}회")
+    print(f"기존 방식 (매번 listdir + isfile): {legacy_per_call * 1000:9.2f} ms/회")
+    print(f"목록 처음 만들기 (시작 시 1회):    {build_time * 1000:9.1f} ms")
+    print(f"목록에서 고르기:                   {pick_per_call * 1000:9.4f} ms/회 ({legacy_per_call / pick_per_call:,.0f}배)")
+    print(f"파일 하나 추가 후 갱신:            {incremental_time * 1000:9.1f} ms (새 파일만 stat, 목록 저장 포함)")
+    print(f"변화 없을 때 확인:                 {unchanged_time * 1000:9.3f} ms (폴더 stat 한 번)")
+    print(f"재시작 (저장된 목록 불러오기):     {restart_time * 1000:9.1f} ms, 다시 훑은 횟수 {reloaded.scans}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="!사진 그림 목록 벤치마크")
+    parser.add_argument('--files', type=int, default=30000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run_bench(args.files, args.lookups))
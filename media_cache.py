@@ -0,0 +1,134 @@
+# media_cache.py
+# 자주 보내는 작은 이미지/GIF(가위바위보 GIF, 인기 반응 GIF 등)의 바이트를 메모리에 들고 있는 LRU 캐시.
+# 디스크 읽기는 모두 스레드 풀에서 하므로 큰 파일을 읽는 동안에도 이벤트 루프가 멈추지 않습니다.
+# 호출하는 쪽은 돌려받은 바이트로 discord.File(io.BytesIO(data), filename=...)을 만듭니다.
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('HoshinoBot.media')
+
+MEDIA_CACHE_MB = float(os.getenv('MEDIA_CACHE_MB', '64')) # 캐시에 둘 전체 바이트 상한 (MB)
+MEDIA_CACHE_MAX_FILE_MB = float(os.getenv('MEDIA_CACHE_MAX_FILE_MB', '4')) # 이보다 큰 파일은 캐시하지 않고 매번 읽음 (MB)
+MEDIA_CACHE_REVALIDATE = 30 # 캐시된 파일이 디스크에서 바뀌었는지 확인하는 간격 (초)
+
+
+class _Entry:
+    __slots__ = ('data', 'signature', 'checked_at', 'hits')
+
+    def __init__(self, data: bytes, signature: tuple):
+        self.data = data
+        self.signature = signature # (크기, 수정 시각 ns)
+        self.checked_at = time.monotonic()
+        self.hits = 0
+
+
+def _signature(stat: os.stat_result) -> tuple:
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_file(path: str) -> tuple:
+    """(바이트, 서명). 스레드 풀에서 실행됩니다."""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        return f.read(), _signature(stat)
+
+
+class MediaCache:
+    """
+    read(path)는 파일 바이트를 돌려줍니다. max_file_bytes 이하인 파일은 max_bytes까지 LRU로 보관하고,
+    보관 중인 파일은 revalidate초마다 한 번 stat으로 크기/수정 시각을 확인해 바뀌었으면 다시 읽습니다.
+    같은 파일을 동시에 여러 번 요청하면 디스크에서는 한 번만 읽습니다.
+    """
+    def __init__(self, max_bytes: int = int(MEDIA_CACHE_MB * 1024 * 1024),
+                 max_file_bytes: int = int(MEDIA_CACHE_MAX_FILE_MB * 1024 * 1024),
+                 revalidate: float = MEDIA_CACHE_REVALIDATE):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = min(max_file_bytes, max_bytes)
+        self.revalidate = revalidate
+        self._entries = OrderedDict() # path -> _Entry (오래 안 쓴 것부터)
+        self._loading = {}            # path -> asyncio.Task (같은 파일 동시 읽기 합치기)
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncached_reads = 0 # 너무 커서 캐시하지 않고 읽은 횟수
+        self.evictions = 0
+        self.bytes_read = 0
+
+    async def read(self, path: str) -> bytes:
+        entry = self._entries.get(path)
+        if entry is not None and await self._still_valid(path, entry):
+            self._entries.move_to_end(path)
+            entry.hits += 1
+            self.hits += 1
+            return entry.data
+
+        task = self._loading.get(path)
+        if task is None:
+            task = self._loading[path] = asyncio.create_task(self._load(path))
+            task.add_done_callback(lambda _: self._loading.pop(path, None))
+        return await asyncio.shield(task)
+
+    async def _still_valid(self, path: str, entry: _Entry) -> bool:
+        now = time.monotonic()
+        if now - entry.checked_at < self.revalidate:
+            return True
+        try:
+            signature = _signature(await asyncio.to_thread(os.stat, path))
+        except OSError:
+            self._drop(path)
+            return False
+        entry.checked_at = now
+        if signature != entry.signature:
+            logger.info(f"캐시된 파일이 바뀌어 다시 읽습니다: {path}")
+            self._drop(path)
+            return False
+        return True
+
+    async def _load(self, path: str) -> bytes:
+        data, signature = await asyncio.to_thread(_read_file, path)
+        self.bytes_read += len(data)
+        if len(data) > self.max_file_bytes:
+            self.uncached_reads += 1
+            return data
+        self.misses += 1
+        self._drop(path)
+        self._entries[path] = _Entry(data, signature)
+        self.resident_bytes += len(data)
+        while self.resident_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_path, _ = next(iter(self._entries.items()))
+            self._drop(evicted_path)
+            self.evictions += 1
+        return data
+
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.resident_bytes -= len(entry.data)
+
+    def clear(self):
+        self._entries.clear()
+        self.resident_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        hottest = sorted(self._entries.items(), key=lambda item: item[1].hits, reverse=True)[:5]
+        return {
+            'entries': len(self._entries),
+            'resident_bytes': self.resident_bytes,
+            'max_bytes': self.max_bytes,
+            'max_file_bytes': self.max_file_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'uncached_reads': self.uncached_reads,
+            'evictions': self.evictions,
+            'bytes_read': self.bytes_read,
+            'hottest': [(os.path.basename(path), entry.hits) for path, entry in hottest],
+        }
+
+
+media_cache = MediaCache()
@@ -0,0 +1,162 @@
+# media_registry.py
+# 한 번 디스코드에 올린 그림 파일의 첨부 URL을 기억해 두었다가, 다음부터는 다시 올리지 않고 임베드로 URL만 보냅니다.
+# 디스코드 CDN 첨부 URL은 서명이 붙어 있어 ex= 시각이 지나면 열리지 않으므로, 만료가 가까워졌거나
+# 파일 내용(sha256)이 바뀌었거나 원본 메시지가 지워지면 기록을 버리고 다시 올립니다.
+# 기록은 media_registry.json에 저장되어 재시작 후에도 유지됩니다.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger('HoshinoBot.media')
+
+MEDIA_REGISTRY_ENABLED = os.getenv('MEDIA_REGISTRY_ENABLED', '1') == '1' # 올린 첨부 URL 재사용 여부
+MEDIA_REGISTRY_FILE = os.getenv('MEDIA_REGISTRY_FILE', 'media_registry.json') # 첨부 URL 기록 파일
+MEDIA_URL_EXPIRY_MARGIN = 3600 # URL 만료 이 시간(초) 전부터는 재사용하지 않고 다시 올림
+
+
+def url_expiry(url: str) -> float:
+    """디스코드 CDN URL의 ex= (16진수 유닉스 시각). 없으면 만료 없는 예전 형식이라 None."""
+    try:
+        value = parse_qs(urlparse(url).query).get('ex')
+        return float(int(value[0], 16)) if value else None
+    except ValueError:
+        return 0.0 # 알아볼 수 없으면 이미 만료된 것으로 취급
+
+
+def _file_signature(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaRegistry:
+    """
+    lookup(path)는 재사용할 수 있는 첨부 URL을, 없으면 None을 돌려줍니다.
+    파일 크기/수정 시각이 기록과 다르면 sha256을 다시 계산해, 내용이 같을 때만 URL을 계속 씁니다.
+    record(path, data, url, message_id)는 방금 올린 첨부를 기록합니다.
+    """
+    def __init__(self, path: str = MEDIA_REGISTRY_FILE, enabled: bool = MEDIA_REGISTRY_ENABLED,
+                 margin: float = MEDIA_URL_EXPIRY_MARGIN):
+        self.path = path
+        self.enabled = enabled
+        self.margin = margin
+        self._entries = {} # 파일 경로 -> {'sha256', 'signature', 'url', 'message_id', 'size'}
+        self.reused = 0
+        self.uploads = 0
+        self.expired = 0
+        self.changed = 0
+        self.bytes_saved = 0
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = {path: entry for path, entry in json.load(f).items() if entry.get('url')}
+            logger.info(f"첨부 URL 기록 {len(self._entries)}개를 불러왔습니다.")
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"첨부 URL 기록 파일 '{self.path}'를 읽지 못해 비우고 시작합니다: {e}")
+            self._entries = {}
+
+    def _write(self, snapshot: dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    async def save(self):
+        if not self.path:
+            return
+        try:
+            await asyncio.to_thread(self._write, {path: dict(entry) for path, entry in self._entries.items()})
+        except OSError as e:
+            logger.warning(f"첨부 URL 기록 저장 실패: {e}")
+
+    def _expired(self, entry: dict) -> bool:
+        expires = url_expiry(entry['url'])
+        return expires is not None and time.time() >= expires - self.margin
+
+    async def lookup(self, path: str) -> str:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self.expired += 1
+            await self.forget(path)
+            return None
+        try:
+            signature = await asyncio.to_thread(_file_signature, path)
+            if signature != entry['signature']:
+                if await asyncio.to_thread(_file_sha256, path) != entry['sha256']:
+                    logger.info(f"파일 내용이 바뀌어 첨부를 다시 올립니다: {path}")
+                    self.changed += 1
+                    await self.forget(path)
+                    return None
+                entry['signature'] = signature # 수정 시각만 바뀜 (내용은 같음)
+        except OSError:
+            await self.forget(path)
+            return None
+        self.reused += 1
+        self.bytes_saved += entry['size']
+        return entry['url']
+
+    async def record(self, path: str, data: bytes, url: str, message_id: int):
+        if not self.enabled:
+            return
+        self.uploads += 1
+        if url_expiry(url) == 0.0:
+            return # 만료 시각을 알 수 없는 URL은 기록하지 않음
+        sha256 = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        try:
+            signature = await asyncio.to_thread(_file_signature, path)
+        except OSError:
+            return
+        self._entries[path] = {'sha256': sha256, 'signature': signature, 'url': url,
+                               'message_id': message_id, 'size': len(data)}
+        await self.save()
+
+    async def forget(self, path: str):
+        if self._entries.pop(path, None) is not None:
+            await self.save()
+
+    def is_source(self, message_id: int) -> bool:
+        """이 메시지의 첨부를 재사용 중인지. 그런 메시지의 첨부를 지우면 기록된 URL도 죽습니다."""
+        return any(entry['message_id'] == message_id for entry in self._entries.values())
+
+    async def forget_message(self, message_id: int):
+        """원본 메시지가 지워지면 그 첨부 URL도 더는 열리지 않으므로 기록에서 뺍니다."""
+        paths = [path for path, entry in self._entries.items() if entry['message_id'] == message_id]
+        for path in paths:
+            del self._entries[path]
+        if paths:
+            logger.info(f"원본 메시지(ID: {message_id})가 지워져 첨부 URL 기록 {len(paths)}개를 버립니다.")
+            await self.save()
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'reused': self.reused,
+            'uploads': self.uploads,
+            'expired': self.expired,
+            'changed': self.changed,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+media_registry = MediaRegistry()
@@ -0,0 +1,340 @@
+# media_transcode.py
+# 업로드 한도(서버 부스트 단계별 8/25/50/100MB)보다 큰 그림/GIF를 한도에 맞게 줄인 변형본을 미리 만들어 둡니다.
+# 변환은 이 모듈만 불러오는 별도 프로세스(python -m media_transcode)에서 돌아 이벤트 루프와 GIL을 붙잡지 않고
+# (봇 스크립트를 다시 실행하는 multiprocessing spawn과 달리 로그 파일, DB, Gemini 설정을 건드리지 않음), 결과는 원본 내용의 sha256으로
+# media_variants/ 폴더에 저장되어 파일 이름이 바뀌거나 재시작해도 다시 쓰입니다.
+# GIF는 크기 축소 -> 프레임 솎기 -> 색 수 줄이기 순으로, 정지 그림은 JPEG(투명하면 WebP) 품질을 조절해 맞춥니다.
+# Pillow가 없으면 변환 없이 예전처럼 너무 크다고만 안내합니다.
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError: # 선택 의존성: pip install Pillow
+    Image = None
+
+logger = logging.getLogger('HoshinoBot.media')
+
+MEDIA_TRANSCODE_ENABLED = os.getenv('MEDIA_TRANSCODE_ENABLED', '1') == '1' # 큰 그림을 줄인 변형본으로 보낼지 여부
+MEDIA_TRANSCODE_DIR = os.getenv('MEDIA_TRANSCODE_DIR', 'media_variants') # 변형본과 manifest.json을 두는 폴더
+MEDIA_TRANSCODE_WORKERS = int(os.getenv('MEDIA_TRANSCODE_WORKERS', '2')) # 동시에 돌리는 변환 프로세스 수
+DEFAULT_UPLOAD_LIMIT = 8 * 1024 * 1024 # DM처럼 서버 정보가 없을 때의 업로드 한도
+UPLOAD_TIERS = (8 * 1024 * 1024, 25 * 1024 * 1024, 50 * 1024 * 1024, 100 * 1024 * 1024) # 변형본을 만드는 한도 단계
+UPLOAD_HEADROOM = 0.975 # 한도의 이 비율까지만 채움 (8MB -> 약 7.8MB, 요청 본문 여유분)
+TRANSCODE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"}
+
+
+class MediaTooLarge(Exception):
+    """업로드 한도를 넘는 파일. pending이면 맞는 변형본을 지금 만드는 중이라 잠시 뒤에는 보낼 수 있습니다."""
+    def __init__(self, path: str, size: int, limit: int, pending: bool):
+        super().__init__(f"{path}: {size}바이트 > 한도 {limit}바이트")
+        self.path = path
+        self.size = size
+        self.limit = limit
+        self.pending = pending
+
+
+def upload_budget(limit: int = None) -> int:
+    """Discord가 알려준 업로드 한도(guild.filesize_limit)에서 실제로 채울 바이트 수."""
+    return int((limit or DEFAULT_UPLOAD_LIMIT) * UPLOAD_HEADROOM)
+
+
+# --- 변환 프로세스(python -m media_transcode)에서 실행되는 부분 ---
+
+def _encode_gif(frames: list, durations: list, loop: int, scale: float, step: int, colors: int) -> bytes:
+    picked, picked_durations = [], []
+    for i in range(0, len(frames), step):
+        frame = frames[i]
+        if scale < 1:
+            frame = frame.resize((max(1, int(frame.width * scale)), max(1, int(frame.height * scale))), Image.LANCZOS)
+        picked.append(frame.quantize(colors=colors, method=Image.Quantize.FASTOCTREE))
+        picked_durations.append(sum(durations[i:i + step])) # 솎아낸 프레임 시간만큼 늘려 재생 속도 유지
+    buf = io.BytesIO()
+    picked[0].save(buf, format='GIF', save_all=True, append_images=picked[1:], duration=picked_durations,
+                   loop=loop, optimize=True, disposal=2)
+    return buf.getvalue()
+
+
+def _fit_gif(image, source_size: int, budget: int):
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        frames.append(frame.convert('RGBA'))
+        durations.append(frame.info.get('duration', 100))
+    loop = image.info.get('loop', 0)
+    ratio = budget / source_size
+    # (크기 배율, 프레임 간격, 색 수): 화질이 덜 상하는 것부터. 줄어드는 정도가 턱없이 모자란 시도는 건너뜀
+    attempts = [(1.0, 1, 128), (0.85, 1, 128), (0.7, 1, 128), (0.7, 2, 128), (0.55, 2, 96),
+                (0.45, 2, 64), (0.45, 3, 64), (0.35, 3, 48), (0.25, 4, 32)]
+    for scale, step, colors in attempts:
+        if scale * scale / step > ratio * 4:
+            continue
+        data = _encode_gif(frames, durations, loop, scale, step, colors)
+        if len(data) <= budget:
+            return data, 'gif'
+    return None
+
+
+def _fit_still(image, budget: int):
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fmt, ext = ('WEBP', 'webp') if has_alpha else ('JPEG', 'jpg')
+    for scale in (1.0, 0.75, 0.5, 0.35, 0.25):
+        scaled = image if scale == 1 else image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+        low, high, best = 40, 92, None
+        while low <= high: # 한도 안에서 가장 높은 품질을 이진 탐색
+            quality = (low + high) // 2
+            buf = io.BytesIO()
+            scaled.save(buf, format=fmt, quality=quality, optimize=True)
+            if buf.tell() <= budget:
+                best, low = buf.getvalue(), quality + 1
+            else:
+                high = quality - 1
+        if best is not None:
+            return best, ext
+    return None
+
+
+def transcode(source_path: str, out_dir: str, sha256: str, tier: int):
+    """source_path를 upload_budget(tier) 이하로 줄여 out_dir에 저장합니다. (파일 이름, 크기) 또는 맞출 수 없으면 None."""
+    budget = upload_budget(tier)
+    source_size = os.path.getsize(source_path)
+    with Image.open(source_path) as image:
+        if getattr(image, 'is_animated', False) and image.format == 'GIF':
+            result = _fit_gif(image, source_size, budget)
+        else:
+            image.load()
+            result = _fit_still(image, budget)
+    if result is None:
+        return None
+    data, ext = result
+    filename = f"{sha256[:24]}_{tier // (1024 * 1024)}mb.{ext}"
+    tmp_path = os.path.join(out_dir, f"{filename}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, os.path.join(out_dir, filename))
+    return filename, len(data)
+
+
+def _file_sha256(path: str) -> tuple:
+    """(서명, sha256). 스레드 풀에서 실행됩니다."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return [stat.st_size, stat.st_mtime_ns], digest.hexdigest()
+
+
+def _scan_oversized(folders: list, min_size: int) -> list:
+    found = []
+    for folder in folders:
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[1].lower() in TRANSCODE_EXTENSIONS and entry.is_file():
+                        size = entry.stat().st_size
+                        if size > min_size:
+                            found.append((entry.path, size))
+        except OSError as e:
+            logger.warning(f"변환할 큰 파일을 찾다가 '{folder}' 폴더를 읽지 못했습니다: {e}")
+    return found
+
+
+class MediaTranscoder:
+    """
+    pick(path, size, limit)는 원본이 한도에 맞으면 원본을, 아니면 이미 만들어 둔 변형본 중 한도 안에서 가장 큰 것의
+    (경로, 크기)를 돌려줍니다. 맞는 변형본이 없으면 백그라운드 변환을 걸고 MediaTooLarge(pending=True)를 올립니다.
+    """
+    def __init__(self, out_dir: str = MEDIA_TRANSCODE_DIR, workers: int = MEDIA_TRANSCODE_WORKERS,
+                 enabled: bool = MEDIA_TRANSCODE_ENABLED):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.enabled = enabled and Image is not None
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self._sources = {}  # 원본 경로 -> [크기, 수정 시각 ns, sha256]
+        self._variants = {} # sha256 -> {한도 단계(str): {'file', 'size'} 또는 {'failed': True}}
+        self._pending = {}  # (sha256, 한도 단계) -> asyncio.Task
+        self._prewarm_task = None
+        self.served = 0
+        self.converted = 0
+        self.failed = 0
+        if enabled and Image is None:
+            logger.warning("Pillow가 설치되어 있지 않아 큰 그림을 줄여 보내는 기능을 끕니다. (pip install Pillow)")
+        self.load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.out_dir, 'manifest.json')
+
+    def load(self):
+        if not self.enabled or not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self._sources = raw.get('sources', {})
+            self._variants = raw.get('variants', {})
+            logger.info(f"그림 변형본 기록 {sum(len(v) for v in self._variants.values())}개를 불러왔습니다.")
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"변형본 기록 '{self.manifest_path}'를 읽지 못해 비우고 시작합니다: {e}")
+
+    def _write(self, snapshot: dict):
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def save(self):
+        snapshot = {'sources': dict(self._sources), 'variants': {sha: dict(v) for sha, v in self._variants.items()}}
+        try:
+            await asyncio.to_thread(self._write, snapshot)
+        except OSError as e:
+            logger.warning(f"변형본 기록 저장 실패: {e}")
+
+    async def _run_transcode(self, path: str, sha256: str, tier: int):
+        """이 모듈만 불러오는 새 파이썬 프로세스에서 transcode()를 실행합니다. 취소되면 프로세스도 끝냅니다."""
+        async with self._slots:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'media_transcode', os.path.abspath(path), os.path.abspath(self.out_dir), sha256, str(tier),
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            try:
+                stdout, stderr = await proc.communicate()
+            except asyncio.CancelledError:
+                proc.kill()
+                await proc.wait()
+                raise
+        if proc.returncode != 0:
+            raise RuntimeError(f"변환 프로세스 종료 코드 {proc.returncode}: {stderr.decode(errors='replace').strip()[-500:]}")
+        result = json.loads(stdout)
+        return (result['file'], result['size']) if result else None
+
+    async def _content_hash(self, path: str) -> str:
+        known = self._sources.get(path)
+        stat = await asyncio.to_thread(os.stat, path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        signature, sha256 = await asyncio.to_thread(_file_sha256, path)
+        self._sources[path] = signature + [sha256]
+        return sha256
+
+    def _ready_variant(self, sha256: str, budget: int):
+        """한도 안에 드는 완성된 변형본 중 가장 큰 것 (경로, 크기)."""
+        best = None
+        for variant in self._variants.get(sha256, {}).values():
+            if 'file' in variant and variant['size'] <= budget and (best is None or variant['size'] > best[1]):
+                path = os.path.join(self.out_dir, variant['file'])
+                if os.path.exists(path):
+                    best = (path, variant['size'])
+        return best
+
+    def ready_size(self, path: str, size: int = None):
+        """이 파일의 완성된 변형본 중 가장 작은 것의 크기. 아직 없으면 None. (해시를 계산하지 않고 기록만 봄)"""
+        known = self._sources.get(path)
+        if not known or (size is not None and known[0] != size):
+            return None
+        sizes = [variant['size'] for variant in self._variants.get(known[2], {}).values() if 'file' in variant]
+        return min(sizes, default=None)
+
+    def _tiers_below(self, size: int, limit: int = None) -> list:
+        tiers = [tier for tier in UPLOAD_TIERS if upload_budget(tier) < size]
+        return [tier for tier in tiers if limit is None or tier <= limit]
+
+    def schedule(self, path: str, sha256: str, tier: int):
+        key = (sha256, tier)
+        if key in self._pending or str(tier) in self._variants.get(sha256, {}):
+            return self._pending.get(key)
+        task = self._pending[key] = asyncio.create_task(self._convert(path, sha256, tier))
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    async def _convert(self, path: str, sha256: str, tier: int):
+        try:
+            await asyncio.to_thread(os.makedirs, self.out_dir, exist_ok=True)
+            result = await self._run_transcode(path, sha256, tier)
+        except Exception as e:
+            logger.error(f"그림 변환 실패: {path} ({tier // (1024 * 1024)}MB 한도): {e}", exc_info=True)
+            result = None
+        variants = self._variants.setdefault(sha256, {})
+        if result is None:
+            self.failed += 1
+            variants[str(tier)] = {'failed': True} # 같은 내용으로는 다시 시도하지 않음
+            logger.warning(f"'{path}'를 {tier // (1024 * 1024)}MB 한도에 맞게 줄이지 못했습니다.")
+        else:
+            filename, size = result
+            self.converted += 1
+            variants[str(tier)] = {'file': filename, 'size': size}
+            logger.info(f"그림 변형본 생성: {path} -> {filename} ({size / 1024 / 1024:.2f}MB)")
+        await self.save()
+
+    async def pick(self, path: str, size: int, limit: int = None) -> tuple:
+        budget = upload_budget(limit)
+        if size <= budget:
+            return path, size
+        if not self.enabled:
+            raise MediaTooLarge(path, size, budget, pending=False)
+        sha256 = await self._content_hash(path)
+        variant = self._ready_variant(sha256, budget)
+        if variant is not None:
+            self.served += 1
+            return variant
+        tiers = self._tiers_below(size, limit) # 이 서버에는 한도 안에서 가장 큰 단계만 있으면 됨
+        task = self.schedule(path, sha256, max(tiers)) if tiers else None
+        raise MediaTooLarge(path, size, budget, pending=task is not None)
+
+    def prewarm(self, folders: list):
+        """시작할 때 폴더에서 가장 작은 한도를 넘는 파일을 찾아, 모든 한도 단계의 변형본을 미리 만들어 둡니다."""
+        if not self.enabled or self._prewarm_task is not None:
+            return
+
+        async def run():
+            found = await asyncio.to_thread(_scan_oversized, folders, upload_budget(min(UPLOAD_TIERS)))
+            if found:
+                logger.info(f"업로드 한도를 넘는 그림 {len(found)}개의 변형본을 백그라운드에서 준비합니다.")
+            for path, size in found:
+                try:
+                    sha256 = await self._content_hash(path)
+                except OSError:
+                    continue
+                for tier in self._tiers_below(size):
+                    self.schedule(path, sha256, tier)
+            if self._pending:
+                await asyncio.gather(*list(self._pending.values()), return_exceptions=True)
+
+        self._prewarm_task = asyncio.create_task(run())
+
+    async def close(self):
+        tasks = list(self._pending.values()) + ([self._prewarm_task] if self._prewarm_task else [])
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True) # 돌고 있던 변환 프로세스도 함께 끝남
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'pillow': Image is not None,
+            'variants': sum(1 for v in self._variants.values() for entry in v.values() if 'file' in entry),
+            'pending': len(self._pending),
+            'served': self.served,
+            'converted': self.converted,
+            'failed': self.failed,
+        }
+
+
+media_transcoder = MediaTranscoder()
+
+
+if __name__ == "__main__":
+    # MediaTranscoder가 띄우는 변환 프로세스: python -m media_transcode <원본> <출력 폴더> <sha256> <한도 단계>
+    # 결과는 {"file": 파일 이름, "size": 크기} 또는 null을 JSON 한 줄로 표준 출력에 씁니다.
+    source_path, out_dir, sha256, tier = sys.argv[1:5]
+    result = transcode(source_path, out_dir, sha256, int(tier))
+    print(json.dumps({'file': result[0], 'size': result[1]} if result else None))
@@ -0,0 +1,201 @@
+# model_router.py
+# 여러 Gemini 모델의 응답 시간(EWMA, p95)과 오류율을 모델별로 기록해, 요청마다 가장 건강한 모델로 보내는 라우터.
+# 주 모델이 평소 p95보다 늦으면 다음 모델에도 같은 요청을 보내(헤지) 먼저 온 응답을 씁니다.
+# 실패하면 다음으로 건강한 모델로 바로 넘어가므로, 장애 하나에 타임아웃을 여러 번 기다리지 않습니다.
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger('HoshinoBot.router')
+
+ROUTER_HEDGE = os.getenv('GEMINI_ROUTER_HEDGE', '1') == '1' # 주 모델이 p95보다 늦으면 다음 모델에도 보낼지 여부
+ROUTER_HEDGE_MIN_SAMPLES = 20 # p95를 믿고 헤지하려면 필요한 최소 성공 표본 수
+ROUTER_EWMA_ALPHA = 0.2 # 최근 값의 가중치
+ROUTER_SWITCH_RATIO = 1.5 # 지금 모델 점수가 최고 점수의 이 배수를 넘어야 주 모델을 바꿈 (자주 바꾸지 않게)
+ROUTER_ERROR_SWITCH = 0.5 # 지금 모델의 오류율(EWMA)이 이보다 높으면 점수와 관계없이 바꿈
+ROUTER_COOLDOWN = float(os.getenv('GEMINI_ROUTER_COOLDOWN', '60')) # 할당량 오류가 난 모델을 쉬게 하는 시간 (초)
+_LATENCY_WINDOW = 100 # p95 계산에 쓰는 최근 성공 표본 수
+QUOTA_KEYWORDS = ("quota", "rate limit", "resource exhausted", "429", "api 할당량", "모델 상태")
+
+
+class AllModelsFailed(Exception):
+    """모든 후보 모델이 실패했을 때. errors는 (모델 이름, 예외) 목록입니다."""
+    def __init__(self, errors: list):
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors) or "사용 가능한 모델 없음")
+        self.errors = errors
+
+
+def is_quota_error(error: Exception) -> bool:
+    text = str(error).lower()
+    return any(keyword in text for keyword in QUOTA_KEYWORDS)
+
+
+class ModelHealth:
+    __slots__ = ('latency_ewma', 'error_ewma', 'latencies', 'cooldown_until', 'requests', 'failures', 'hedges_won')
+
+    def __init__(self):
+        self.latency_ewma = None # 아직 성공한 적 없으면 None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def p95(self) -> float:
+        if len(self.latencies) < ROUTER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class ModelRouter:
+    """
+    choose(current)는 주 모델을 고르고, run(call, primary)는 call(model_name) 코루틴을 주 모델부터 실행합니다.
+    retryable(e)가 False인 오류(안전 필터, 컨텍스트 초과처럼 모델을 바꿔도 같은 오류)는 다른 모델로 넘기지 않고 그대로 올립니다.
+    """
+    def __init__(self, model_names, hedge: bool = ROUTER_HEDGE, cooldown: float = ROUTER_COOLDOWN,
+                 alpha: float = ROUTER_EWMA_ALPHA, retryable=None):
+        self.model_names = list(model_names)
+        self.hedge = hedge
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.retryable = retryable or (lambda error: True)
+        self.health = {name: ModelHealth() for name in self.model_names}
+        self.hedges = 0
+        self.failovers = 0
+
+    def available(self, name: str, now: float = None) -> bool:
+        return (now or time.monotonic()) >= self.health[name].cooldown_until
+
+    def score(self, name: str) -> float:
+        """낮을수록 좋음. 응답 시간 EWMA에 오류율만큼 벌점을 줍니다. 아직 모르는 모델은 가장 빠른 모델과 같게 봅니다."""
+        health = self.health[name]
+        known = [h.latency_ewma for h in self.health.values() if h.latency_ewma is not None]
+        latency = health.latency_ewma if health.latency_ewma is not None else min(known, default=1.0)
+        return latency * (1 + 4 * health.error_ewma)
+
+    def ranked(self, first: str = None) -> list:
+        """쉬는 중이 아닌 모델을 점수순으로 (같으면 MODEL_NAMES 순서). 모두 쉬는 중이면 가장 먼저 풀리는 순서로."""
+        now = time.monotonic()
+        order = {name: i for i, name in enumerate(self.model_names)}
+        ready = sorted((n for n in self.model_names if self.available(n, now)), key=lambda n: (self.score(n), order[n]))
+        if not ready:
+            ready = sorted(self.model_names, key=lambda n: self.health[n].cooldown_until)
+        if first in ready:
+            ready.remove(first)
+            ready.insert(0, first)
+        return ready
+
+    def choose(self, current: str = None) -> str:
+        """지금 모델이 쓸 만하면 그대로 두고, 확실히 나쁠 때만 가장 건강한 모델로 바꿉니다."""
+        best = self.ranked()[0]
+        if current is None or current not in self.health or current == best:
+            return best
+        health = self.health[current]
+        if (self.available(current) and health.error_ewma < ROUTER_ERROR_SWITCH
+                and self.score(current) <= self.score(best) * ROUTER_SWITCH_RATIO):
+            return current
+        logger.info(f"주 모델 변경: {current} -> {best} (점수 {self.score(current):.2f} -> {self.score(best):.2f})")
+        return best
+
+    def record_success(self, name: str, latency: float):
+        health = self.health[name]
+        health.requests += 1
+        health.latencies.append(latency)
+        health.latency_ewma = latency if health.latency_ewma is None else \
+            self.alpha * latency + (1 - self.alpha) * health.latency_ewma
+        health.error_ewma *= (1 - self.alpha)
+
+    def record_failure(self, name: str, error: Exception):
+        health = self.health[name]
+        health.requests += 1
+        health.failures += 1
+        health.error_ewma = self.alpha + (1 - self.alpha) * health.error_ewma
+        if is_quota_error(error):
+            health.cooldown_until = time.monotonic() + self.cooldown
+            logger.warning(f"'{name}' 모델 할당량/상태 오류, {self.cooldown:.0f}초 동안 쉬게 합니다: {error}")
+
+    async def run(self, call, primary: str = None):
+        """(결과, 응답한 모델 이름)을 돌려줍니다. 모든 후보가 실패하면 AllModelsFailed."""
+        candidates = self.ranked(primary)
+        pending = {} # task -> (모델 이름, 시작 시각)
+        errors = []
+        fatal = None # 다른 모델로 넘기지 않을 오류 (다른 후보가 아직 돌고 있으면 그 결과까지 기다림)
+        launched = 0
+        hedged = False
+
+        def launch():
+            nonlocal launched
+            name = candidates[launched]
+            launched += 1
+            pending[asyncio.create_task(call(name))] = (name, time.monotonic())
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and not hedged and len(pending) == 1 and launched < len(candidates):
+                    name, started = next(iter(pending.values()))
+                    p95 = self.health[name].p95()
+                    if p95 is not None:
+                        timeout = max(0.0, started + p95 - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done: # 주 모델이 평소 p95보다 늦음: 다음 모델에도 보냄
+                    hedged = True
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    name, started = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not self.retryable(e):
+                            if not pending:
+                                raise
+                            fatal = fatal or e
+                            logger.warning(f"'{name}' 모델이 다시 보낼 수 없는 오류로 실패, 남은 요청을 기다립니다: {e}")
+                            continue
+                        self.record_failure(name, e)
+                        errors.append((name, e))
+                        logger.warning(f"'{name}' 모델 요청 실패, 다음 모델로 넘깁니다: {e}")
+                        continue
+                    self.record_success(name, time.monotonic() - started)
+                    if hedged and name != candidates[0]:
+                        self.health[name].hedges_won += 1
+                    if errors:
+                        self.failovers += 1
+                    return result, name
+                if not pending and launched < len(candidates) and fatal is None:
+                    launch()
+            if fatal is not None:
+                raise fatal
+            raise AllModelsFailed(errors)
+        finally:
+            for task in pending: # 진 쪽 요청은 취소 (기록하지 않음)
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            'hedges': self.hedges,
+            'failovers': self.failovers,
+            'models': {
+                name: {
+                    'latency_ewma': health.latency_ewma,
+                    'p95': health.p95(),
+                    'error_rate': health.error_ewma,
+                    'requests': health.requests,
+                    'failures': health.failures,
+                    'hedges_won': health.hedges_won,
+                    'cooldown': max(0.0, health.cooldown_until - now),
+                }
+                for name, health in self.health.items()
+            },
+        }
@@ -0,0 +1,133 @@
+# model_router_bench.py
+# 가짜 모델 백엔드로 응답 지연과 장애를 흉내 내어, 기존 순차 전환(bot5의 예외 후 다음 모델)과
+# model_router의 건강도 기반 라우팅, 헤지 요청을 비교합니다. 네트워크 없이 동작합니다.
+# 사용법: python model_router_bench.py [--requests 400] [--concurrency 8] [--seed 7]
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from model_router import ModelRouter, AllModelsFailed
+
+MODEL_NAMES = ['gemini-2.5-flash-preview-05-20', 'gemini-2.0-flash-001', 'gemma-3-27b-it', 'gemini-1.5-flash-002']
+
+
+class FakeModelBackend:
+    """
+    모델별 지연 분포와 실패율을 흉내 냅니다. 단위는 초이며, 실제보다 짧게 줄여 빨리 돌게 했습니다.
+    outage 구간(전체 요청 진행률 기준)에는 해당 모델이 timeout만큼 기다린 뒤 할당량 오류를 냅니다.
+    """
+    PROFILES = {
+        # 이름: (중앙값, 느린 꼬리 확률, 꼬리 배수, 무작위 실패율)
+        'gemini-2.5-flash-preview-05-20': (0.040, 0.10, 10.0, 0.02),
+        'gemini-2.0-flash-001': (0.060, 0.03, 4.0, 0.01),
+        'gemma-3-27b-it': (0.150, 0.05, 3.0, 0.05),
+        'gemini-1.5-flash-002': (0.050, 0.03, 4.0, 0.01),
+    }
+
+    def __init__(self, rng: random.Random, outage_model: str = MODEL_NAMES[0], outage=(0.3, 0.6), timeout: float = 0.3):
+        self.rng = rng
+        self.outage_model = outage_model
+        self.outage = outage
+        self.timeout = timeout
+        self.progress = 0.0 # 0~1, 벤치마크가 갱신
+        self.calls = 0
+
+    async def send(self, model_name: str, text: str) -> str:
+        self.calls += 1
+        median, tail_p, tail_x, fail_p = self.PROFILES[model_name]
+        if model_name == self.outage_model and self.outage[0] <= self.progress < self.outage[1]:
+            await asyncio.sleep(self.timeout)
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+        latency = median * self.rng.lognormvariate(0, 0.25)
+        if self.rng.random() < tail_p:
+            latency *= tail_x
+        await asyncio.sleep(latency)
+        if self.rng.random() < fail_p:
+            raise RuntimeError("500 Internal error encountered.")
+        return f"{model_name}: {text}"
+
+
+class SerialFailover:
+    """기존 bot5 방식: 지금 모델로 보내고, 예외가 나면 MODEL_NAMES 순서대로 다음 모델로 바꿔 다시 보냄."""
+    def __init__(self, backend: FakeModelBackend):
+        self.backend = backend
+        self.current = 0
+
+    async def send(self, text: str) -> str:
+        start = self.current
+        for i in range(len(MODEL_NAMES)):
+            index = (start + i) % len(MODEL_NAMES)
+            try:
+                result = await self.backend.send(MODEL_NAMES[index], text)
+                self.current = index
+                return result
+            except RuntimeError:
+                continue
+        raise AllModelsFailed([])
+
+
+class RoutedSender:
+    def __init__(self, backend: FakeModelBackend, hedge: bool):
+        self.backend = backend
+        self.router = ModelRouter(MODEL_NAMES, hedge=hedge, cooldown=0.5)
+        self.current = None
+
+    async def send(self, text: str) -> str:
+        self.current = self.router.choose(self.current)
+        result, self.current = await self.router.run(lambda name: self.backend.send(name, text), self.current)
+        return result
+
+
+async def run_case(label: str, make_sender, total: int, concurrency: int, seed: int):
+    backend = FakeModelBackend(random.Random(seed))
+    sender = make_sender(backend)
+    latencies, failures = [], 0
+    counter = iter(range(total))
+
+    async def client():
+        nonlocal failures
+        for i in counter:
+            backend.progress = i / total
+            started = time.monotonic()
+            try:
+                await sender.send(f"요청 {i}")
+                latencies.append(time.monotonic() - started)
+            except AllModelsFailed:
+                failures += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+    print(f"{label:<22} p50 {pick(0.50):6.0f}ms  p95 {pick(0.95):6.0f}ms  p99 {pick(0.99):6.0f}ms  "
+          f"실패 {failures:3d}  모델 호출 {backend.calls:4d}  전체 {elapsed:.1f}s")
+    return sender
+
+
+async def run_bench(total: int, concurrency: int, seed: int):
+    print(f"요청 {total}건, 동시 {concurrency}, 진행률 30~60% 구간에 '{MODEL_NAMES[0]}' 장애 (0.3초 뒤 할당량 오류)")
+    await run_case("순차 전환 (기존)", SerialFailover, total, concurrency, seed)
+    await run_case("라우터", lambda backend: RoutedSender(backend, hedge=False), total, concurrency, seed)
+    routed = await run_case("라우터 + 헤지", lambda backend: RoutedSender(backend, hedge=True), total, concurrency, seed)
+
+    stats = routed.router.stats()
+    print(f"헤지 {stats['hedges']}회, 다른 모델로 넘긴 요청 {stats['failovers']}건")
+    for name, model in stats['models'].items():
+        latency = f"{model['latency_ewma'] * 1000:.0f}ms" if model['latency_ewma'] is not None else "-"
+        p95 = f"{model['p95'] * 1000:.0f}ms" if model['p95'] is not None else "-"
+        print(f"  {name:<32} 요청 {model['requests']:4d}  실패 {model['failures']:3d}  EWMA {latency:>6}  p95 {p95:>6}  "
+              f"오류율 {model['error_rate']:.2f}  헤지 승리 {model['hedges_won']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="모델 라우터/헤지 요청 오프라인 시뮬레이션")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING) # 모델 전환 로그는 생략하고 결과만
+    asyncio.run(run_bench(args.requests, args.concurrency, args.seed))
@@ -0,0 +1,202 @@
+# prompt_build.py
+# prompt.py의 SYSTEM_PROMPT를 섹션 단위로 나눠 중복 문단을 없애고, 줄인 버전을 system_prompt.min.json으로 씁니다.
+# 봇은 시작할 때 load_system_prompt()로 이 파일을 읽고, 체크섬이 맞지 않으면 원본 SYSTEM_PROMPT를 그대로 씁니다.
+# 사용법: python prompt_build.py [--output system_prompt.min.json] [--check]
+# (네트워크 없이 동작하며, 토큰 수는 history_window.estimate_tokens의 추정치입니다)
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+
+from history_window import estimate_tokens
+from prompt import SYSTEM_PROMPT
+
+logger = logging.getLogger('HoshinoBot.prompt')
+
+BUILT_PROMPT_FILE = os.getenv('SYSTEM_PROMPT_BUILD_FILE', 'system_prompt.min.json')
+USE_BUILT_PROMPT = os.getenv('USE_BUILT_PROMPT', '1') == '1' # 줄인 프롬프트 사용 여부
+MIN_DUPLICATE_CHARS = 30 # 이보다 짧은 줄("장점:", "단점: 정보 없음" 등)은 문맥에 따라 뜻이 달라 지우지 않음
+SHARED_PREFIX_RATIO = 0.8 # 더 긴 줄과 앞부분이 이만큼 같으면 확장판이 있는 것으로 보고 짧은 줄을 지움
+
+Section = namedtuple('Section', ['title', 'lines'])
+
+_MARKUP_RE = re.compile(r"\*\*|__|`")
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+\.)\s+")
+_SEPARATOR_RE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,}|[@#~=]+)\s*$")
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _normalize(line: str) -> str:
+    """중복 비교용: 마크다운 기호, 글머리표, 공백 차이를 지운 문자열."""
+    line = _MARKUP_RE.sub("", line).strip().lstrip('#').strip()
+    line = _BULLET_RE.sub("", line)
+    return " ".join(line.split()).rstrip(':').strip()
+
+
+def _minify_line(line: str) -> str:
+    line = _MARKUP_RE.sub("", line.rstrip())
+    indent = len(line) - len(line.lstrip())
+    return " " * min(indent, 2) + " ".join(line.split())
+
+
+def _is_shorter_variant(key: str, other: str) -> bool:
+    """key가 other에 통째로 들어 있거나, other가 key의 앞부분 대부분을 그대로 쓰고 내용을 덧붙인 줄인지."""
+    if len(other) <= len(key):
+        return False
+    if key in other:
+        return True
+    return len(os.path.commonprefix([key, other])) >= len(key) * SHARED_PREFIX_RATIO
+
+
+def split_sections(prompt: str) -> list:
+    """마크다운 제목(#)과, 앞서 나온 제목과 같은 평문 제목 줄을 기준으로 섹션을 나눕니다."""
+    sections = [Section("(머리말)", [])]
+    titles = set()
+    for line in prompt.split("\n"):
+        stripped = line.strip()
+        key = _normalize(line)
+        if stripped.startswith('#') or (key in titles and len(key) < 30):
+            titles.add(key)
+            sections.append(Section(key, [line]))
+        else:
+            sections[-1].lines.append(line)
+    return [section for section in sections if any(l.strip() for l in section.lines)]
+
+
+def deduplicate(sections: list) -> list:
+    """
+    정규화했을 때 같은 줄은 처음 것만 남기고, 더 긴 확장판이 있는 줄(_is_shorter_variant)은 긴 쪽만 남깁니다.
+    줄이 모두 빠진 섹션은 제목까지 없애고, 같은 제목의 섹션은 하나로 합칩니다.
+    """
+    entries = [] # (섹션 번호, 줄 번호, 정규화 키)
+    for s_index, section in enumerate(sections):
+        for l_index, line in enumerate(section.lines):
+            if s_index > 0 and l_index == 0:
+                continue # 제목 줄은 섹션이 남는지에 따라 결정
+            key = _normalize(line)
+            if key and not _SEPARATOR_RE.match(line):
+                entries.append((s_index, l_index, key))
+
+    drop = set()
+    seen = set()
+    long_keys = {key for _, _, key in entries if len(key) >= MIN_DUPLICATE_CHARS}
+    for s_index, l_index, key in entries:
+        if key not in long_keys:
+            continue
+        if key in seen or any(_is_shorter_variant(key, other) for other in long_keys):
+            drop.add((s_index, l_index))
+        seen.add(key)
+
+    result = []
+    by_title = {}
+    for s_index, section in enumerate(sections):
+        kept = [_minify_line(line) for l_index, line in enumerate(section.lines)
+                if (s_index, l_index) not in drop and not _SEPARATOR_RE.match(line)]
+        body = kept[1:] if s_index > 0 else kept
+        if not any(line.strip() for line in body):
+            continue
+        if section.title in by_title: # 같은 제목이 다시 나오면 처음 섹션 뒤에 이어 붙임
+            by_title[section.title].lines.extend(body)
+        else:
+            by_title[section.title] = Section(section.title, kept)
+            result.append(by_title[section.title])
+    return result
+
+
+def assemble(sections: list) -> str:
+    """섹션 안의 빈 줄은 모두 빼고, 섹션 사이에만 빈 줄 하나를 둡니다."""
+    return "\n\n".join("\n".join(line for line in section.lines if line.strip()) for section in sections)
+
+
+def _measure(sections: list) -> dict:
+    report = {}
+    for section in sections:
+        text = "\n".join(line for line in section.lines if line.strip())
+        tokens, size = report.get(section.title, (0, 0))
+        report[section.title] = (tokens + estimate_tokens(text), size + len(text.encode('utf-8')))
+    return report
+
+
+def build(prompt: str = SYSTEM_PROMPT) -> dict:
+    sections = split_sections(prompt)
+    built_sections = deduplicate(sections)
+    built = assemble(built_sections)
+    before, after = _measure(sections), _measure(built_sections)
+    return {
+        'source_sha256': sha256(prompt),
+        'sha256': sha256(built),
+        'prompt': built,
+        'sections': [
+            {'title': title, 'tokens_before': tokens, 'bytes_before': size,
+             'tokens_after': after.get(title, (0, 0))[0], 'bytes_after': after.get(title, (0, 0))[1]}
+            for title, (tokens, size) in before.items()
+        ],
+        'tokens_before': estimate_tokens(prompt),
+        'bytes_before': len(prompt.encode('utf-8')),
+        'tokens_after': estimate_tokens(built),
+        'bytes_after': len(built.encode('utf-8')),
+    }
+
+
+def load_system_prompt(path: str = BUILT_PROMPT_FILE) -> str:
+    """줄인 프롬프트를 읽습니다. 파일이 없거나 prompt.py와 어긋나거나 내용이 손상되었으면 원본을 씁니다."""
+    if not USE_BUILT_PROMPT:
+        return SYSTEM_PROMPT
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            built = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"줄인 프롬프트 '{path}'가 없어 prompt.py의 원본 프롬프트를 사용합니다.")
+        return SYSTEM_PROMPT
+    except (OSError, ValueError) as e:
+        logger.warning(f"줄인 프롬프트 '{path}'를 읽지 못해 원본 프롬프트를 사용합니다: {e}")
+        return SYSTEM_PROMPT
+
+    if built.get('source_sha256') != sha256(SYSTEM_PROMPT):
+        logger.warning(f"prompt.py가 '{path}'를 만든 뒤에 바뀌었습니다. 원본 프롬프트를 사용합니다. (python prompt_build.py로 다시 빌드하세요)")
+        return SYSTEM_PROMPT
+    prompt = built.get('prompt') or ""
+    if built.get('sha256') != sha256(prompt):
+        logger.warning(f"'{path}'의 체크섬이 맞지 않습니다 (직접 수정되었거나 손상됨). 원본 프롬프트를 사용합니다.")
+        return SYSTEM_PROMPT
+    logger.info(f"줄인 프롬프트 사용: {built['bytes_before']} -> {built['bytes_after']}바이트, 약 {built['tokens_before']} -> {built['tokens_after']}토큰")
+    return prompt
+
+
+def print_report(built: dict):
+    print(f"{'섹션':<30} {'토큰(전)':>8} {'토큰(후)':>8} {'바이트(전)':>10} {'바이트(후)':>10}")
+    for section in built['sections']:
+        print(f"{section['title'][:30]:<30} {section['tokens_before']:>8} {section['tokens_after']:>8} "
+              f"{section['bytes_before']:>10} {section['bytes_after']:>10}")
+    saved = built['tokens_before'] - built['tokens_after']
+    print(f"합계: 약 {built['tokens_before']} -> {built['tokens_after']}토큰 ({saved / built['tokens_before']:.1%} 절감), "
+          f"{built['bytes_before']} -> {built['bytes_after']}바이트")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SYSTEM_PROMPT 중복 제거 및 측정")
+    parser.add_argument('--output', default=BUILT_PROMPT_FILE)
+    parser.add_argument('--check', action='store_true', help="파일을 쓰지 않고 기존 빌드가 최신인지만 확인")
+    args = parser.parse_args()
+
+    built = build()
+    print_report(built)
+    if args.check:
+        try:
+            with open(args.output, 'r', encoding='utf-8') as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = {}
+        up_to_date = current.get('source_sha256') == built['source_sha256'] and current.get('sha256') == built['sha256']
+        print(f"'{args.output}': {'최신' if up_to_date else '다시 빌드 필요'}")
+        raise SystemExit(0 if up_to_date else 1)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(built, f, ensure_ascii=False, indent=1)
+    print(f"'{args.output}'에 저장했습니다. (sha256 {built['sha256'][:12]})")
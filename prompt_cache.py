@@ -0,0 +1,236 @@
+# prompt_cache.py
+# 44KB짜리 SYSTEM_PROMPT를 Gemini 서버에 캐시된 컨텍스트(CachedContent)로 한 번만 올려 두고,
+# 모델마다 그 캐시를 참조하는 GenerativeModel을 만들어 주는 관리자.
+# 캐시를 못 쓰는 모델(버전 고정이 아닌 이름, 최소 토큰 미달, 미지원 모델 등)은 조용히 일반 모델로 대신합니다.
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+
+logger = logging.getLogger('HoshinoBot.prompt_cache')
+
+PROMPT_CACHE_ENABLED = os.getenv('GEMINI_PROMPT_CACHE', '1') == '1' # 서버 측 프롬프트 캐시 사용 여부
+PROMPT_CACHE_TTL = int(os.getenv('GEMINI_PROMPT_CACHE_TTL', '3600')) # 캐시 수명 (초), 만료 전에 계속 연장
+PROMPT_CACHE_REFRESH_MARGIN = 300 # 만료까지 이만큼 남으면 연장 (초)
+PROMPT_CACHE_RETRY = 1800 # 캐시를 만들지 못한 모델은 이 시간 뒤에 다시 시도 (초)
+PROMPT_CACHE_DISPLAY_NAME = 'hoshino-persona'
+
+
+def is_model_alias(model_name: str) -> bool:
+    """'gemini-1.5-flash-latest'처럼 버전이 고정되지 않은 별칭. 캐시된 컨텍스트는 고정 버전 모델에만 만들 수 있습니다."""
+    return model_name.endswith('-latest')
+
+
+class GenaiCacheBackend:
+    """google.generativeai의 caching API를 감싼 실제 백엔드. 모든 메서드는 동기(네트워크) 호출입니다."""
+    def __init__(self):
+        import google.generativeai as genai
+        from google.generativeai import caching
+        self._genai = genai
+        self._caching = caching
+
+    def create(self, model_name: str, system_instruction: str, ttl: int):
+        model = model_name if model_name.startswith('models/') else f'models/{model_name}'
+        return self._caching.CachedContent.create(
+            model=model,
+            display_name=PROMPT_CACHE_DISPLAY_NAME,
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+
+    def extend(self, cache, ttl: int):
+        cache.update(ttl=datetime.timedelta(seconds=ttl))
+
+    def delete(self, cache):
+        cache.delete()
+
+    def cached_tokens(self, cache) -> int:
+        usage = getattr(cache, 'usage_metadata', None)
+        return getattr(usage, 'total_token_count', 0) if usage is not None else 0
+
+    def model_from_cache(self, cache, **model_kwargs):
+        return self._genai.GenerativeModel.from_cached_content(cache, **model_kwargs)
+
+    def plain_model(self, model_name: str, system_instruction: str, **model_kwargs):
+        return self._genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction, **model_kwargs)
+
+
+class FakeCacheBackend:
+    """
+    네트워크 없이 캐시 동작을 흉내 내는 백엔드. supported에 없는 모델은 캐시 생성에 실패합니다.
+    만든 모델은 (model_name, cached 여부) 튜플이라 벤치마크나 점검 스크립트에서 바로 확인할 수 있습니다.
+    """
+    def __init__(self, supported=(), tokens_per_char: float = 0.6, fail_extend: bool = False):
+        self.supported = set(supported)
+        self.tokens_per_char = tokens_per_char
+        self.fail_extend = fail_extend
+        self.created = []
+        self.extended = 0
+        self.deleted = 0
+
+    def create(self, model_name: str, system_instruction: str, ttl: int):
+        if model_name not in self.supported:
+            raise ValueError(f"400 Model {model_name} does not support cached content")
+        cache = {'name': f'cachedContents/fake-{len(self.created)}', 'model': model_name,
+                 'tokens': int(len(system_instruction) * self.tokens_per_char)}
+        self.created.append(cache)
+        return cache
+
+    def extend(self, cache, ttl: int):
+        if self.fail_extend:
+            raise RuntimeError("404 cached content not found")
+        self.extended += 1
+
+    def delete(self, cache):
+        self.deleted += 1
+
+    def cached_tokens(self, cache) -> int:
+        return cache['tokens']
+
+    def model_from_cache(self, cache, **model_kwargs):
+        return (cache['model'], True)
+
+    def plain_model(self, model_name: str, system_instruction: str, **model_kwargs):
+        return (model_name, False)
+
+
+class _CacheEntry:
+    __slots__ = ('handle', 'expires_at', 'tokens')
+
+    def __init__(self, handle, expires_at: float, tokens: int):
+        self.handle = handle
+        self.expires_at = expires_at
+        self.tokens = tokens
+
+
+class PromptCache:
+    """
+    prepare(model_names)로 모델별 캐시를 만들고, model(name, ...)은 캐시가 살아 있으면 캐시를 참조하는 모델을,
+    아니면 system_instruction을 직접 넣은 일반 모델을 돌려줍니다. 백그라운드 작업이 만료 전에 TTL을 연장하고,
+    연장에 실패해 캐시를 잃으면 on_invalidate(model_name)을 불러 그 캐시에 묶인 세션을 정리할 기회를 줍니다.
+    """
+    def __init__(self, system_instruction: str, backend=None, ttl: int = PROMPT_CACHE_TTL,
+                 refresh_margin: int = PROMPT_CACHE_REFRESH_MARGIN, enabled: bool = PROMPT_CACHE_ENABLED,
+                 on_invalidate=None):
+        self.system_instruction = system_instruction
+        self._backend = backend
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.enabled = enabled
+        self.on_invalidate = on_invalidate
+        self._entries = {}     # model_name -> _CacheEntry
+        self._retry_after = {} # model_name -> 다시 시도할 monotonic 시각
+        self._uncacheable = set() # 다시 시도해도 소용없는 모델 (버전 별칭)
+        self._refresher: asyncio.Task = None
+        self.requests = 0
+        self.cached_requests = 0
+        self.tokens_saved = 0
+        self.last_saved = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = GenaiCacheBackend()
+        return self._backend
+
+    async def _create(self, model_name: str) -> bool:
+        if is_model_alias(model_name):
+            if model_name not in self._uncacheable:
+                self._uncacheable.add(model_name)
+                logger.warning(f"'{model_name}'은 버전 별칭이라 프롬프트 캐시를 만들 수 없어 일반 모델로 씁니다. (예: -002처럼 버전을 고정하세요)")
+            return False
+        try:
+            handle = await asyncio.to_thread(self.backend.create, model_name, self.system_instruction, self.ttl)
+        except Exception as e:
+            self._retry_after[model_name] = time.monotonic() + PROMPT_CACHE_RETRY
+            logger.info(f"'{model_name}' 모델은 프롬프트 캐시를 쓸 수 없어 일반 모델로 대신합니다: {e}")
+            return False
+        entry = _CacheEntry(handle, time.monotonic() + self.ttl, self.backend.cached_tokens(handle))
+        self._entries[model_name] = entry
+        self._retry_after.pop(model_name, None)
+        logger.info(f"'{model_name}' 모델용 프롬프트 캐시 생성 ({entry.tokens}토큰, {self.ttl}초)")
+        return True
+
+    async def prepare(self, model_names):
+        """모델별 캐시를 만들고 연장 작업을 시작합니다. 꺼져 있으면 아무것도 하지 않습니다."""
+        if not self.enabled:
+            return
+        await asyncio.gather(*(self._create(name) for name in model_names if name not in self._entries))
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_forever())
+
+    def is_cached(self, model_name: str) -> bool:
+        entry = self._entries.get(model_name)
+        return entry is not None and entry.expires_at > time.monotonic()
+
+    def model(self, model_name: str, **model_kwargs):
+        """캐시가 있으면 캐시를 참조하는 모델, 없으면 일반 모델. 네트워크 호출 없이 바로 돌아옵니다."""
+        if self.is_cached(model_name):
+            try:
+                return self.backend.model_from_cache(self._entries[model_name].handle, **model_kwargs)
+            except Exception as e:
+                logger.warning(f"'{model_name}' 캐시 모델 생성 실패, 일반 모델로 대신합니다: {e}")
+        return self.backend.plain_model(model_name, self.system_instruction, **model_kwargs)
+
+    async def _refresh_forever(self):
+        while True:
+            now = time.monotonic()
+            deadlines = [entry.expires_at - self.refresh_margin for entry in self._entries.values()]
+            deadlines += list(self._retry_after.values())
+            await asyncio.sleep(max(1.0, min(deadlines, default=now + 60) - now))
+            await self._refresh_due()
+
+    async def _refresh_due(self):
+        now = time.monotonic()
+        for model_name, entry in list(self._entries.items()):
+            if entry.expires_at - now > self.refresh_margin:
+                continue
+            try:
+                await asyncio.to_thread(self.backend.extend, entry.handle, self.ttl)
+                entry.expires_at = time.monotonic() + self.ttl
+            except Exception as e:
+                logger.warning(f"'{model_name}' 프롬프트 캐시 연장 실패, 새로 만듭니다: {e}")
+                del self._entries[model_name]
+                await self._create(model_name)
+                if self.on_invalidate is not None:
+                    self.on_invalidate(model_name)
+        for model_name, retry_at in list(self._retry_after.items()):
+            if retry_at <= now and await self._create(model_name) and self.on_invalidate is not None:
+                self.on_invalidate(model_name) # 이제 캐시를 쓸 수 있으니 새 세션부터 캐시 모델로
+
+    async def close(self):
+        """연장을 멈추고 만든 캐시를 지웁니다. (남겨 두면 TTL이 끝날 때까지 보관 비용이 듭니다)"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        for model_name, entry in list(self._entries.items()):
+            try:
+                await asyncio.to_thread(self.backend.delete, entry.handle)
+            except Exception as e:
+                logger.warning(f"'{model_name}' 프롬프트 캐시 삭제 실패: {e}")
+        self._entries.clear()
+
+    def record_usage(self, response) -> int:
+        """응답의 usage_metadata에서 캐시로 대신한 입력 토큰 수를 읽어 누적하고 돌려줍니다."""
+        usage = getattr(response, 'usage_metadata', None)
+        saved = getattr(usage, 'cached_content_token_count', 0) or 0
+        self.requests += 1
+        if saved:
+            self.cached_requests += 1
+            self.tokens_saved += saved
+        self.last_saved = saved
+        return saved
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'cached_models': sorted(self._entries),
+            'fallback_models': sorted(set(self._retry_after) | self._uncacheable),
+            'requests': self.requests,
+            'cached_requests': self.cached_requests,
+            'tokens_saved': self.tokens_saved,
+            'avg_saved': self.tokens_saved / self.requests if self.requests else 0.0,
+        }
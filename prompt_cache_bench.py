@@ -0,0 +1,64 @@
+# prompt_cache_bench.py
+# 가짜 백엔드로 프롬프트 캐시의 생성/대체/연장 동작과 요청당 아끼는 입력 토큰을 오프라인에서 확인합니다.
+# 사용법: python prompt_cache_bench.py [--requests 100] [--ttl 4] [--history-tokens 800]
+
+import argparse
+import asyncio
+from types import SimpleNamespace
+
+from prompt import SYSTEM_PROMPT
+from prompt_cache import PromptCache, FakeCacheBackend
+
+MODEL_NAMES = ['gemini-2.5-flash-preview-05-20', 'gemini-2.0-flash-001', 'gemma-3-27b-it', 'gemini-1.5-flash-002']
+CACHE_SUPPORTED = {'gemini-2.0-flash-001', 'gemini-1.5-flash-002'} # 가짜 백엔드에서 캐시가 되는 모델
+
+
+def fake_response(model, prompt_tokens: int, history_tokens: int):
+    """캐시 모델이면 시스템 프롬프트 토큰이 cached_content_token_count로 잡히는 가짜 응답."""
+    _, cached = model
+    usage = SimpleNamespace(
+        prompt_token_count=prompt_tokens + history_tokens,
+        cached_content_token_count=prompt_tokens if cached else 0,
+    )
+    return SimpleNamespace(text="으헤~", usage_metadata=usage)
+
+
+async def run_bench(total: int, ttl: int, history_tokens: int):
+    backend = FakeCacheBackend(supported=CACHE_SUPPORTED)
+    invalidated = []
+    cache = PromptCache(SYSTEM_PROMPT, backend=backend, ttl=ttl, refresh_margin=ttl // 2,
+                        enabled=True, on_invalidate=invalidated.append)
+    await cache.prepare(MODEL_NAMES)
+    prompt_tokens = backend.cached_tokens(backend.created[0]) if backend.created else 0
+
+    print(f"시스템 프롬프트: {len(SYSTEM_PROMPT)}자 / {len(SYSTEM_PROMPT.encode('utf-8'))}바이트 / 약 {prompt_tokens}토큰")
+    for model_name in MODEL_NAMES:
+        print(f"  {model_name}: {'캐시 모델' if cache.model(model_name)[1] else '일반 모델 (대체)'}")
+
+    for i in range(total):
+        model = cache.model(MODEL_NAMES[i % len(MODEL_NAMES)])
+        cache.record_usage(fake_response(model, prompt_tokens, history_tokens))
+    stats = cache.stats()
+    plain_input = total * (prompt_tokens + history_tokens)
+    print(f"요청 {total}건 (모델 순환): 캐시 적용 {stats['cached_requests']}건, "
+          f"아낀 입력 토큰 {stats['tokens_saved']} / 전체 {plain_input} ({stats['tokens_saved'] / plain_input:.0%}), "
+          f"요청당 평균 {stats['avg_saved']:.0f}")
+
+    await asyncio.sleep(ttl) # 연장 작업이 만료 전에 TTL을 늘리는지 확인
+    print(f"TTL {ttl}초 경과 후: 연장 {backend.extended}회, 캐시 유지 {stats['cached_models'] == cache.stats()['cached_models']}")
+
+    backend.fail_extend = True # 연장이 실패하면 새로 만들고 on_invalidate로 알림
+    await asyncio.sleep(ttl)
+    print(f"연장 실패 시: 다시 만든 캐시 {len(backend.created) - len(CACHE_SUPPORTED)}개, on_invalidate {sorted(set(invalidated))}")
+
+    await cache.close()
+    print(f"종료: 삭제한 캐시 {backend.deleted}개")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="프롬프트 캐시 오프라인 점검")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--ttl', type=int, default=4)
+    parser.add_argument('--history-tokens', type=int, default=800)
+    args = parser.parse_args()
+    asyncio.run(run_bench(args.requests, args.ttl, args.history_tokens))
@@ -0,0 +1,162 @@
+# rate_limit.py
+# AI 대화(멘션, DM, '?')에 사용자/서버/전체 단위 토큰 버킷 속도 제한을 겁니다.
+# 한 사람이 도배해 모두가 같이 쓰는 하루 할당량을 다 써 버리는 것을 막고, 막힌 요청은 API를 부르지 않고 바로 답합니다.
+# 서버별 제한은 rate_limits.json에 저장되어 재시작 후에도 유지됩니다.
+
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+logger = logging.getLogger('HoshinoBot.rate_limit')
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1' # AI 대화 속도 제한 사용 여부
+RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', 'rate_limits.json') # 서버별 제한 설정 파일
+RATE_LIMIT_USER_PER_MIN = float(os.getenv('RATE_LIMIT_USER_PER_MIN', '6')) # 사용자 한 명의 분당 요청 수
+RATE_LIMIT_USER_BURST = int(os.getenv('RATE_LIMIT_USER_BURST', '4')) # 사용자가 연달아 보낼 수 있는 요청 수
+RATE_LIMIT_GUILD_PER_MIN = float(os.getenv('RATE_LIMIT_GUILD_PER_MIN', '30')) # 서버 하나의 분당 요청 수
+RATE_LIMIT_GUILD_BURST = int(os.getenv('RATE_LIMIT_GUILD_BURST', '10'))
+RATE_LIMIT_GLOBAL_PER_MIN = float(os.getenv('RATE_LIMIT_GLOBAL_PER_MIN', '60')) # 봇 전체의 분당 요청 수
+RATE_LIMIT_GLOBAL_BURST = int(os.getenv('RATE_LIMIT_GLOBAL_BURST', '20'))
+_PRUNE_MIN = 1024 # 버킷이 이 수를 넘으면 가득 찬(= 없는 것과 같은) 버킷을 정리
+
+Limit = namedtuple('Limit', ['per_minute', 'burst'])
+Decision = namedtuple('Decision', ['allowed', 'scope', 'retry_after', 'notify'])
+ALLOWED = Decision(True, None, 0.0, False)
+
+
+class _Bucket:
+    """토큰 수와 마지막 갱신 시각만 들고 있는 버킷. 사용자가 많아도 작게 유지하려고 __slots__를 씁니다."""
+    __slots__ = ('tokens', 'stamp', 'warned_until')
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+        self.warned_until = 0.0 # 이 시각까지는 막혀도 다시 안내하지 않음
+
+    def refill(self, limit: Limit, now: float) -> float:
+        self.tokens = min(limit.burst, self.tokens + (now - self.stamp) * limit.per_minute / 60)
+        self.stamp = now
+        return self.tokens
+
+    def wait_time(self, limit: Limit) -> float:
+        """토큰 하나가 찰 때까지 남은 시간 (초)."""
+        return (1 - self.tokens) * 60 / limit.per_minute if limit.per_minute > 0 else float('inf')
+
+
+class RateLimiter:
+    """
+    check(user_id, guild_id)는 사용자, 서버(DM이면 생략), 전체 버킷에 모두 토큰이 있을 때만 하나씩 꺼내고 허용합니다.
+    하나라도 비어 있으면 아무것도 꺼내지 않고 막힌 범위와 다시 시도할 수 있는 시간을 돌려줍니다.
+    notify는 막힌 동안 한 번만 True가 되어, 도배하는 사용자에게 안내를 매번 보내지 않게 합니다.
+    """
+    def __init__(self, path: str = RATE_LIMIT_FILE, enabled: bool = RATE_LIMIT_ENABLED,
+                 user_limit: Limit = Limit(RATE_LIMIT_USER_PER_MIN, RATE_LIMIT_USER_BURST),
+                 guild_limit: Limit = Limit(RATE_LIMIT_GUILD_PER_MIN, RATE_LIMIT_GUILD_BURST),
+                 global_limit: Limit = Limit(RATE_LIMIT_GLOBAL_PER_MIN, RATE_LIMIT_GLOBAL_BURST)):
+        self.path = path
+        self.enabled = enabled
+        self.user_limit = user_limit
+        self.guild_limit = guild_limit
+        self.global_limit = global_limit
+        self.guild_overrides = {} # guild_id -> {'user': Limit, 'guild': Limit}
+        self._users = {}  # user_id -> _Bucket
+        self._guilds = {} # guild_id -> _Bucket
+        self._global = _Bucket(global_limit.burst, time.monotonic())
+        self._prune_at = _PRUNE_MIN
+        self.allowed = 0
+        self.throttled = {'user': 0, 'guild': 0, 'global': 0}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self.guild_overrides = {
+                int(guild_id): {scope: Limit(*value) for scope, value in limits.items() if scope in ('user', 'guild')}
+                for guild_id, limits in raw.items()
+            }
+            logger.info(f"서버별 속도 제한 {len(self.guild_overrides)}개를 불러왔습니다.")
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"속도 제한 설정 파일 '{self.path}'를 읽지 못해 기본값을 사용합니다: {e}")
+
+    def save(self):
+        snapshot = {str(guild_id): {scope: list(limit) for scope, limit in limits.items()}
+                    for guild_id, limits in self.guild_overrides.items()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def limits_for(self, guild_id: int = None) -> tuple:
+        """(사용자 제한, 서버 제한). 서버별 설정이 없으면 기본값."""
+        overrides = self.guild_overrides.get(guild_id, {})
+        return overrides.get('user', self.user_limit), overrides.get('guild', self.guild_limit)
+
+    def set_guild_limits(self, guild_id: int, user: Limit = None, guild: Limit = None):
+        overrides = self.guild_overrides.setdefault(guild_id, {})
+        if user is not None:
+            overrides['user'] = user
+        if guild is not None:
+            overrides['guild'] = guild
+        self._guilds.pop(guild_id, None) # 새 한도로 다시 시작
+        self.save()
+
+    def _bucket(self, buckets: dict, key, limit: Limit, now: float) -> _Bucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket(limit.burst, now)
+        else:
+            bucket.refill(limit, now)
+        return bucket
+
+    def check(self, user_id: int, guild_id: int = None) -> Decision:
+        if not self.enabled:
+            return ALLOWED
+        now = time.monotonic()
+        user_limit, guild_limit = self.limits_for(guild_id)
+        user = self._bucket(self._users, user_id, user_limit, now)
+        scopes = [('user', user, user_limit)]
+        if guild_id is not None:
+            scopes.append(('guild', self._bucket(self._guilds, guild_id, guild_limit, now), guild_limit))
+        self._global.refill(self.global_limit, now)
+        scopes.append(('global', self._global, self.global_limit))
+
+        for scope, bucket, limit in scopes:
+            if bucket.tokens < 1:
+                self.throttled[scope] += 1
+                retry_after = bucket.wait_time(limit)
+                notify = now >= user.warned_until
+                if notify:
+                    user.warned_until = now + retry_after
+                return Decision(False, scope, retry_after, notify)
+        for _, bucket, _ in scopes:
+            bucket.tokens -= 1
+        self.allowed += 1
+        if len(self._users) >= self._prune_at:
+            self._prune(now)
+        return ALLOWED
+
+    def _prune(self, now: float):
+        """다시 가득 찼을 만큼 오래 쉰 버킷은 새로 만든 것과 같으므로 지웁니다."""
+        limits = [self.user_limit, self.guild_limit] + [limit for o in self.guild_overrides.values() for limit in o.values()]
+        horizon = max(limit.burst * 60 / limit.per_minute for limit in limits if limit.per_minute > 0)
+        for buckets in (self._users, self._guilds):
+            idle = [key for key, bucket in buckets.items() if now - bucket.stamp >= horizon and now >= bucket.warned_until]
+            for key in idle:
+                del buckets[key]
+        self._prune_at = max(_PRUNE_MIN, len(self._users) * 2)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'allowed': self.allowed,
+            'throttled': dict(self.throttled),
+            'tracked_users': len(self._users),
+            'tracked_guilds': len(self._guilds),
+            'guild_overrides': len(self.guild_overrides),
+            'global_tokens': self._global.tokens,
+        }
@@ -1,67 +1,93 @@
 # reaction.py
 
+import asyncio
+import io
 import os
 import discord
 import random
 import logging
 
+from reaction_index import ReactionIndex
+from media_cache import media_cache
+from media_registry import media_registry
+from media_transcode import media_transcoder, MediaTooLarge
+
 logger = logging.getLogger('HoshinoBot.reaction')
 
 REACTION_GIF_DIR = "reaction_gifs"
 
+reaction_index = ReactionIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), REACTION_GIF_DIR))
+
+async def _send_registered(send, path: str, **kwargs):
+    """전에 올린 첨부 URL이 아직 쓸 만하면 임베드로 URL만 보냄. 보냈으면 메시지, 아니면 None."""
+    url = await media_registry.lookup(path)
+    if not url:
+        return None
+    embed = discord.Embed()
+    embed.set_image(url=url)
+    return await send(embed=embed, **kwargs)
+
+async def send_media(send, path: str, filename: str, size: int = None, guild: discord.Guild = None, **kwargs) -> discord.Message:
+    """
+    send(ctx.send, ctx.reply 등)로 그림 파일을 보냅니다. 전에 올린 첨부 URL이 아직 쓸 만하면 임베드로 URL만 보내고,
+    아니면 파일을 올린 뒤 그 첨부 URL을 media_registry에 기록합니다.
+    파일이 guild의 업로드 한도보다 크면 한도에 맞게 줄인 변형본을 대신 보내고, 변형본이 아직 없으면 MediaTooLarge를 올립니다.
+    """
+    sent_message = await _send_registered(send, path, **kwargs) # URL은 업로드 한도와 상관없음
+    if sent_message:
+        return sent_message
+
+    if size is None:
+        size = (await asyncio.to_thread(os.stat, path)).st_size
+    send_path, _ = await media_transcoder.pick(path, size, guild.filesize_limit if guild else None)
+    if send_path != path:
+        filename = os.path.splitext(filename)[0] + os.path.splitext(send_path)[1]
+        sent_message = await _send_registered(send, send_path, **kwargs)
+        if sent_message:
+            return sent_message
+
+    data = await media_cache.read(send_path) # 자주 쓰는 파일은 메모리에서, 아니면 스레드 풀에서 읽음
+    sent_message = await send(file=discord.File(io.BytesIO(data), filename=filename), **kwargs)
+    if sent_message and sent_message.attachments:
+        await media_registry.record(send_path, data, sent_message.attachments[0].url, sent_message.id)
+    return sent_message
+
 async def send_reaction_gif(ctx: discord.ext.commands.Context, target_user: discord.Member, reaction_name_upper: str): # reaction_name은 대문자로 받음
     """
-    지정된 반응 이름 (대문자)에 해당하는 GIF (또는 이름으로 시작하는 GIF 중 랜덤)를 찾아
+    지정된 반응 이름 (대문자)에 해당하는 GIF 중 하나를 반응 GIF 색인에서 랜덤으로 골라
     대상 사용자에게 메시지를 보냅니다.
     """
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    gif_folder_path = os.path.join(project_root, REACTION_GIF_DIR)
-
-    if not os.path.exists(gif_folder_path) or not os.path.isdir(gif_folder_path):
-        logger.warning(f"반응 GIF 폴더 '{gif_folder_path}'를 찾을 수 없습니다. (reaction.py에서 확인)")
+    if not reaction_index.exists and not await reaction_index.refresh():
+        logger.warning(f"반응 GIF 폴더 '{reaction_index.folder}'를 찾을 수 없습니다. (reaction.py에서 확인)")
         await ctx.send(f"으음... 반응에 쓸 그림들을 모아둔 폴더({REACTION_GIF_DIR})를 못 찾겠어, 선생.", ephemeral=True, mention_author=False)
         return None
 
-    possible_gif_files = []
-    try:
-        for f_name in os.listdir(gif_folder_path):
-            # 파일명이 reaction_name_upper로 시작하고 .gif로 끝나는지 확인 (대소문자 구분 없이)
-            if f_name.upper().startswith(reaction_name_upper) and f_name.lower().endswith(".gif"):
-                possible_gif_files.append(f_name)
-    except Exception as e:
-        logger.error(f"'{gif_folder_path}' 폴더에서 반응 GIF 목록을 가져오는 중 오류 발생: {e}", exc_info=True)
-        await ctx.send("반응 GIF 폴더를 읽는 중에 문제가 생겼어, 선생.", ephemeral=True, mention_author=False)
-        return None
-
-    if not possible_gif_files:
-        # 이 경우는 bot.py의 setup_hook에서 해당 reaction_name으로 시작하는 GIF가 하나도 없을 때 발생 가능
-        # 또는 사용자가 !없는반응 @유저 입력 시 (이건 CommandNotFound로 처리됨)
-        logger.info(f"'{reaction_name_upper}' 반응에 해당하는 GIF 파일을 찾을 수 없습니다. (폴더: {gif_folder_path})")
-        # 사용자에게는 CommandNotFound가 뜨거나, setup_hook에서 명령어가 안 만들어짐.
-        # 이 함수는 등록된 명령어를 통해서만 호출되므로, 파일이 없다는 건 setup_hook 로직 검토 필요.
-        # 보통은 여기에 도달하지 않음.
+    candidates = reaction_index.files(reaction_name_upper)
+    if not candidates:
+        # 명령어를 등록한 뒤 그 반응의 GIF가 모두 지워진 경우
+        logger.info(f"'{reaction_name_upper}' 반응에 해당하는 GIF 파일을 찾을 수 없습니다. (폴더: {reaction_index.folder})")
         return None
 
-    selected_gif_filename = random.choice(possible_gif_files)
-    gif_path = os.path.join(gif_folder_path, selected_gif_filename)
-
-    logger.info(f"선택된 반응 GIF: {selected_gif_filename} (요청: {reaction_name_upper}, 후보: {len(possible_gif_files)}개)")
+    selected = random.choice(candidates)
+    selected_gif_filename, gif_path = selected.filename, selected.path
+    logger.info(f"선택된 반응 GIF: {selected_gif_filename} (요청: {reaction_name_upper}, 후보: {len(candidates)}개)")
 
     try:
         message_text = f"으헤~ {ctx.author.mention} 선생이 {target_user.mention} 선생에게 **{reaction_name_upper}**! (후훗)"
-        
-        if os.path.getsize(gif_path) > 7.8 * 1024 * 1024: 
-            logger.warning(f"반응 GIF '{gif_path}' 파일 크기가 너무 큽니다 ({os.path.getsize(gif_path) / (1024*1024):.2f}MB).")
-            await ctx.send(f"이 그림({reaction_name_upper})은 너무 커서 보여줄 수가 없어, 선생...", ephemeral=True, mention_author=False)
-            return None
-
-        reaction_file = discord.File(gif_path, filename=selected_gif_filename) # 파일명도 실제 선택된 파일명으로
-        sent_message = await ctx.send(content=message_text, file=reaction_file, mention_author=False)
+        sent_message = await send_media(ctx.send, gif_path, selected_gif_filename, size=selected.size, guild=ctx.guild,
+                                        content=message_text, mention_author=False) # 파일명도 실제 선택된 파일명으로
         logger.info(f"반응 GIF 전송: {ctx.author} -> {target_user} ({reaction_name_upper}, 파일: {selected_gif_filename})")
         return sent_message
 
-    except FileNotFoundError: 
+    except MediaTooLarge as e:
+        logger.warning(f"반응 GIF '{gif_path}' 파일 크기가 너무 큽니다 ({e.size / (1024*1024):.2f}MB, 변환 중: {e.pending}).")
+        if e.pending:
+            await ctx.send(f"이 그림({reaction_name_upper})은 너무 커서 지금 줄이고 있어, 선생. 조금 있다가 다시 불러줘~", ephemeral=True, mention_author=False)
+        else:
+            await ctx.send(f"이 그림({reaction_name_upper})은 너무 커서 보여줄 수가 없어, 선생...", ephemeral=True, mention_author=False)
+    except FileNotFoundError:
         logger.error(f"반응 GIF 파일 '{gif_path}'를 찾을 수 없습니다 (전송 시도 중).")
+        await reaction_index.refresh(force=True) # 색인이 폴더와 어긋남
         await ctx.send(f"'{reaction_name_upper}' 그림을 찾았는데... 파일이 갑자기 사라졌나봐, 미안해 선생.", ephemeral=True, mention_author=False)
     except discord.errors.HTTPException as e:
         if e.status == 413 or (e.text and "Request entity too large" in e.text):
@@ -0,0 +1,87 @@
+# reaction_bench.py
+# 반응 GIF 10,000개가 든 임시 폴더에서 기존 send_reaction_gif의 파일 찾기(매번 listdir + 대문자 변환 + getsize)와
+# reaction_index.ReactionIndex 조회를 비교합니다. 디스코드 전송은 빼고 파일 고르기까지만 잽니다.
+# 사용법: python reaction_bench.py [--files 10000] [--reactions 200] [--lookups 2000]
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from reaction_index import ReactionIndex
+
+
+def make_folder(folder: str, files: int, reactions: int) -> list:
+    names = [f"R{i:03d}" for i in range(reactions)]
+    for i in range(files):
+        with open(os.path.join(folder, f"{names[i % reactions]}_{i}.gif"), 'wb') as f:
+            f.write(b"GIF89a" + bytes(64))
+    return names
+
+
+def legacy_pick(folder: str, reaction_name_upper: str):
+    """기존 send_reaction_gif와 같은 방식: 요청마다 폴더 전체를 읽고 파일명을 대문자로 바꿔 비교."""
+    possible_gif_files = []
+    for f_name in os.listdir(folder):
+        if f_name.upper().startswith(reaction_name_upper) and f_name.lower().endswith(".gif"):
+            possible_gif_files.append(f_name)
+    if not possible_gif_files:
+        return None
+    gif_path = os.path.join(folder, random.choice(possible_gif_files))
+    if os.path.getsize(gif_path) > 7.8 * 1024 * 1024:
+        return None
+    return gif_path
+
+
+async def run_bench(files: int, reactions: int, lookups: int):
+    with tempfile.TemporaryDirectory() as folder:
+        names = make_folder(folder, files, reactions)
+        queries = [random.choice(names) for _ in range(lookups)]
+
+        legacy_runs = max(lookups // 10, 50) # 기존 방식은 느려서 횟수를 줄임
+        t0 = time.perf_counter()
+        for name in queries[:legacy_runs]:
+            legacy_pick(folder, name)
+        legacy_per_call = (time.perf_counter() - t0) / legacy_runs
+
+        index = ReactionIndex(folder, check_interval=5)
+        t0 = time.perf_counter()
+        await index.refresh(force=True)
+        build_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for name in queries:
+            random.choice(index.files(name))
+        index_per_call = (time.perf_counter() - t0) / lookups
+
+        index.check_interval = 0 # 매 조회마다 폴더 확인을 거는 최악의 경우 (확인 자체는 스레드에서 돌고 조회는 기다리지 않음)
+        t0 = time.perf_counter()
+        for name in queries:
+            random.choice(index.files(name))
+        checked_per_call = (time.perf_counter() - t0) / lookups
+
+        with open(os.path.join(folder, f"{names[0]}_new.gif"), 'wb') as f:
+            f.write(b"GIF89a")
+        t0 = time.perf_counter()
+        await index.refresh()
+        rescan_time = time.perf_counter() - t0
+        before = len(index.files(names[0]))
+        stats = index.stats()
+
+    print(f"GIF {files}개 / 반응 {reactions}종류, 조회 {lookups}회")
+    print(f"기존 방식 (매번 listdir):   {legacy_per_call * 1000:8.3f} ms/회")
+    print(f"색인 만들기 (시작 시 1회):  {build_time * 1000:8.1f} ms")
+    print(f"색인 조회:                  {index_per_call * 1000:8.4f} ms/회 ({legacy_per_call / index_per_call:,.0f}배)")
+    print(f"색인 조회 + 매번 폴더 확인: {checked_per_call * 1000:8.4f} ms/회")
+    print(f"파일 추가 후 색인: '{names[0]}' {before}개, {rescan_time * 1000:.1f} ms (폴더를 다시 훑은 횟수 {stats['scans']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="반응 GIF 색인 벤치마크")
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--reactions', type=int, default=200)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run_bench(args.files, args.reactions, args.lookups))
@@ -0,0 +1,122 @@
+# reaction_index.py
+# 반응 GIF 폴더를 메모리에 색인해, !hug/!pat 같은 명령마다 폴더 전체를 읽지 않고 바로 고를 수 있게 합니다.
+# (discord에 의존하지 않아 벤치마크 스크립트에서도 그대로 씁니다)
+
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+
+logger = logging.getLogger('HoshinoBot.reaction')
+
+REACTION_INDEX_CHECK_INTERVAL = float(os.getenv('REACTION_INDEX_CHECK_INTERVAL', '5')) # 폴더가 바뀌었는지 확인하는 최소 간격 (초)
+
+ReactionGif = namedtuple('ReactionGif', ['filename', 'path', 'size', 'mtime'])
+
+
+def reaction_base_name(filename: str) -> str:
+    """파일명에서 반응 이름을 뽑습니다. 예: "SLEEP_1.gif" -> "SLEEP", "PAT.gif" -> "PAT"."""
+    return os.path.splitext(filename)[0].split('_')[0].upper()
+
+
+def _scan_folder(folder: str, known_mtime) -> tuple:
+    """
+    (폴더 수정 시각, {반응 이름: [ReactionGif]}). 폴더 수정 시각이 known_mtime과 같으면 훑지 않고 색인 자리에 None.
+    폴더가 없거나 읽지 못하면 OSError. 스레드 풀에서 실행됩니다.
+    """
+    folder_mtime = os.stat(folder).st_mtime_ns
+    if folder_mtime == known_mtime:
+        return folder_mtime, None
+    gifs = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".gif"):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue # 훑는 사이 지워진 파일
+            gif = ReactionGif(entry.name, entry.path, stat.st_size, stat.st_mtime)
+            gifs.setdefault(reaction_base_name(entry.name), []).append(gif)
+    for files in gifs.values():
+        files.sort() # 파일명 순 (도움말 등에서 순서가 흔들리지 않게)
+    return folder_mtime, gifs
+
+
+class ReactionIndex:
+    """
+    반응 이름(대문자) -> 그 이름의 GIF 목록(파일명, 경로, 크기, 수정 시각)을 메모리에 들고 있는 색인.
+    시작할 때 한 번 폴더를 훑고, 이후에는 조회할 때 최대 check_interval마다 한 번 백그라운드에서 폴더의 수정 시각을
+    확인해 파일이 추가/삭제되었으면 다시 훑습니다. stat/scandir는 모두 스레드 풀에서 돌아 이벤트 루프를 막지 않고,
+    조회는 그동안 지금 색인으로 바로 답합니다. (딕셔너리 조회 + random.choice)
+    """
+    def __init__(self, folder: str, check_interval: float = REACTION_INDEX_CHECK_INTERVAL):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._gifs = {}          # 반응 이름 -> [ReactionGif]
+        self._folder_mtime = None
+        self._checked_at = 0.0
+        self._refreshing: asyncio.Task = None
+        self.scans = 0
+
+    @property
+    def exists(self) -> bool:
+        return self._folder_mtime is not None
+
+    async def refresh(self, force: bool = False) -> bool:
+        """폴더가 바뀌었으면(force면 무조건) 스레드에서 다시 훑습니다. 폴더를 찾아 색인이 유효하면 True."""
+        if not force and self._refreshing is not None and not self._refreshing.done():
+            return await asyncio.shield(self._refreshing) # 이미 확인 중이면 그 결과를 같이 기다림
+        task = self._refreshing = asyncio.create_task(self._refresh(force))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, force: bool) -> bool:
+        self._checked_at = time.monotonic()
+        try:
+            folder_mtime, gifs = await asyncio.to_thread(_scan_folder, self.folder, None if force else self._folder_mtime)
+        except (FileNotFoundError, NotADirectoryError):
+            if self._folder_mtime is not None:
+                logger.warning(f"반응 GIF 폴더 '{self.folder}'를 찾을 수 없습니다.")
+            self._gifs, self._folder_mtime = {}, None
+            return False
+        except OSError as e:
+            logger.error(f"반응 GIF 폴더 '{self.folder}'를 읽는 중 오류 발생 (이전 색인 유지): {e}")
+            return self.exists
+        if gifs is None:
+            return True # 바뀐 것 없음
+        self._gifs, self._folder_mtime = gifs, folder_mtime
+        self.scans += 1
+        logger.info(f"반응 GIF 색인: {sum(len(files) for files in gifs.values())}개 파일, 반응 {len(gifs)}종류")
+        return True
+
+    def _maybe_refresh(self):
+        """확인할 때가 됐으면 백그라운드 확인만 걸고 바로 돌아갑니다. (이벤트 루프 밖에서는 아무것도 안 함)"""
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._checked_at = time.monotonic()
+        self._refreshing = asyncio.create_task(self._refresh(False))
+
+    def names(self) -> list:
+        """반응 이름(대문자) 목록, 이름순."""
+        self._maybe_refresh()
+        return sorted(self._gifs)
+
+    def files(self, reaction_name_upper: str) -> list:
+        self._maybe_refresh()
+        return self._gifs.get(reaction_name_upper, [])
+
+    def stats(self) -> dict:
+        return {
+            'reactions': len(self._gifs),
+            'files': sum(len(files) for files in self._gifs.values()),
+            'scans': self.scans,
+        }
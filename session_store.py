@@ -0,0 +1,155 @@
+# session_store.py
+# 사용자별 Gemini ChatSession을 개수/추정 메모리/유휴 시간 기준으로 제한하는 저장소.
+# 가장 오래 안 쓴 세션부터 내보내서(LRU) 바쁜 봇에서도 메모리가 끝없이 늘지 않게 합니다.
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('HoshinoBot.sessions')
+
+SESSION_MAX_COUNT = int(os.getenv('CHAT_SESSION_MAX', '1000')) # 동시에 들고 있을 최대 세션 수
+SESSION_MAX_BYTES = int(float(os.getenv('CHAT_SESSION_MAX_MB', '200')) * 1024 * 1024) # 대화 기록 추정 메모리 상한
+SESSION_TTL = float(os.getenv('CHAT_SESSION_TTL', '21600')) # 이 시간 동안 말이 없으면 세션 정리 (초)
+SWEEP_INTERVAL = 60 # 유휴 세션 정리 주기 (초)
+_TURN_OVERHEAD_BYTES = 200 # Content/Part 객체 자체의 대략적인 크기
+
+
+def estimate_history(history) -> tuple:
+    """(턴 수, 추정 바이트). 텍스트 파트의 UTF-8 길이에 턴당 고정 오버헤드를 더합니다."""
+    total = 0
+    for content in history:
+        total += _TURN_OVERHEAD_BYTES
+        for part in getattr(content, 'parts', ()):
+            text = getattr(part, 'text', None)
+            if text:
+                total += len(text.encode('utf-8'))
+    return len(history), total
+
+
+class _Entry:
+    __slots__ = ('session', 'last_used', 'turns', 'bytes')
+
+    def __init__(self, session):
+        self.session = session
+        self.last_used = time.monotonic()
+        self.turns = 0
+        self.bytes = 0
+
+
+class ChatSessionStore:
+    """
+    user_id -> ChatSession. get_or_create()로 꺼내 쓰고, 응답을 받은 뒤 touch()로 크기를 갱신합니다.
+    max_count / max_bytes를 넘으면 가장 오래 안 쓴 세션부터 내보내고, ttl 동안 안 쓴 세션은 주기적으로 정리합니다.
+    is_busy(user_id)가 True인 세션(요청 처리 중)은 내보내지 않습니다.
+    """
+    def __init__(self, max_count: int = SESSION_MAX_COUNT, max_bytes: int = SESSION_MAX_BYTES,
+                 ttl: float = SESSION_TTL, is_busy=None):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.is_busy = is_busy or (lambda user_id: False)
+        self._entries = OrderedDict() # 오래 안 쓴 순서 -> 최근에 쓴 순서
+        self._total_turns = 0
+        self._total_bytes = 0
+        self._sweeper: asyncio.Task = None
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str):
+        entry = self._entries.get(user_id)
+        return entry.session if entry else None
+
+    def get_or_create(self, user_id: str, factory):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry(factory())
+            self._enforce_limits()
+        else:
+            self._entries.move_to_end(user_id)
+        entry.last_used = time.monotonic()
+        return entry.session
+
+    def touch(self, user_id: str):
+        """응답을 받은 뒤 호출: 사용 시각과 기록 크기를 갱신하고 한도를 넘으면 다른 세션을 내보냅니다."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        turns, size = estimate_history(entry.session.history)
+        self._total_turns += turns - entry.turns
+        self._total_bytes += size - entry.bytes
+        entry.turns, entry.bytes = turns, size
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(user_id)
+        self._enforce_limits()
+
+    def discard(self, user_id: str) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self._total_turns -= entry.turns
+        self._total_bytes -= entry.bytes
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._total_turns = 0
+        self._total_bytes = 0
+
+    def _enforce_limits(self):
+        if len(self._entries) <= self.max_count and self._total_bytes <= self.max_bytes:
+            return
+        newest = next(reversed(self._entries))
+        for user_id in list(self._entries):
+            if len(self._entries) <= self.max_count and self._total_bytes <= self.max_bytes:
+                break
+            if user_id == newest or self.is_busy(user_id):
+                continue
+            self.discard(user_id)
+            self.evicted_lru += 1
+            logger.info(f"세션 한도 초과로 가장 오래 안 쓴 세션을 정리합니다: {user_id}")
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.ttl
+        expired = [user_id for user_id, entry in self._entries.items()
+                   if entry.last_used < cutoff and not self.is_busy(user_id)]
+        for user_id in expired:
+            self.discard(user_id)
+        self.evicted_ttl += len(expired)
+        if expired:
+            logger.info(f"{self.ttl / 60:.0f}분 이상 대화가 없던 세션 {len(expired)}개를 정리했습니다.")
+        return len(expired)
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            self.evict_idle()
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._entries),
+            'turns': self._total_turns,
+            'bytes': self._total_bytes,
+            'max_count': self.max_count,
+            'max_bytes': self.max_bytes,
+            'evicted_lru': self.evicted_lru,
+            'evicted_ttl': self.evicted_ttl,
+        }
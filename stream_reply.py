@@ -0,0 +1,179 @@
+# stream_reply.py
+# Gemini 스트리밍 응답을 디스코드 메시지로 점점 채워 보여주는 도우미.
+# 첫 조각이 오면 바로 답장을 달고, 이후에는 편집 속도 제한을 넘지 않게 모아서 메시지를 고칩니다.
+# 2000자를 넘으면 현재 메시지를 마무리하고 다음 메시지로 이어 씁니다.
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger('HoshinoBot.stream')
+
+STREAM_REPLIES = os.getenv('GEMINI_STREAM_REPLIES', '1') == '1' # 스트리밍 답장 사용 여부
+STREAM_EDIT_INTERVAL = float(os.getenv('GEMINI_STREAM_EDIT_INTERVAL', '1.2')) # 같은 메시지 편집 최소 간격 (초), 디스코드 제한은 대략 5초에 5번
+DISCORD_MESSAGE_LIMIT = 2000
+_SPLIT_MIN = 1000 # 이보다 앞에서는 줄바꿈/공백을 찾지 않고 그냥 자름
+_METRIC_WINDOW = 200 # 최근 몇 건으로 평균/p95를 계산할지
+
+
+def chunk_text(chunk) -> str:
+    """스트리밍 조각의 텍스트. 안전 필터 종료 조각처럼 텍스트가 없는 조각은 빈 문자열."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def split_point(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> int:
+    """limit 이하에서 자를 위치. 줄바꿈 > 공백 순으로 찾고, 없으면 limit에서 자릅니다."""
+    if len(text) <= limit:
+        return len(text)
+    for separator in ("\n", " "):
+        index = text.rfind(separator, _SPLIT_MIN, limit)
+        if index > 0:
+            return index + 1
+    return limit
+
+
+class ReplyMetrics:
+    """Gemini 응답의 첫 조각까지 시간(TTFB), 첫 디스코드 메시지까지 시간, 전체 생성 시간을 따로 모읍니다."""
+    def __init__(self, window: int = _METRIC_WINDOW):
+        self.ttfb = deque(maxlen=window)
+        self.first_post = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.replies = 0
+        self.streamed = 0
+        self.edits = 0
+        self.splits = 0
+
+    def record(self, ttfb: float, total: float, first_post: float = None, streamed: bool = False):
+        self.replies += 1
+        self.ttfb.append(ttfb)
+        self.total.append(total)
+        if first_post is not None:
+            self.first_post.append(first_post)
+        if streamed:
+            self.streamed += 1
+
+    @staticmethod
+    def _summary(samples) -> tuple:
+        if not samples:
+            return 0.0, 0.0
+        ordered = sorted(samples)
+        return sum(ordered) / len(ordered), ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+    def stats(self) -> dict:
+        ttfb_avg, ttfb_p95 = self._summary(self.ttfb)
+        post_avg, post_p95 = self._summary(self.first_post)
+        total_avg, total_p95 = self._summary(self.total)
+        return {
+            'replies': self.replies,
+            'streamed': self.streamed,
+            'edits': self.edits,
+            'splits': self.splits,
+            'ttfb_avg': ttfb_avg, 'ttfb_p95': ttfb_p95,
+            'first_post_avg': post_avg, 'first_post_p95': post_p95,
+            'total_avg': total_avg, 'total_p95': total_p95,
+        }
+
+
+reply_metrics = ReplyMetrics()
+
+
+class StreamingReply:
+    """
+    message에 대한 답장을 조각 단위로 채웁니다. push(text)로 조각을 넣고, 끝나면 finish()를 부릅니다.
+    편집은 edit_interval에 한 번만 하고, 그 사이에 온 조각은 모아 두었다가 예약된 편집에서 한 번에 반영합니다.
+    """
+    def __init__(self, message, edit_interval: float = STREAM_EDIT_INTERVAL, metrics: ReplyMetrics = reply_metrics,
+                 limit: int = DISCORD_MESSAGE_LIMIT):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.metrics = metrics
+        self.limit = limit
+        self.text = ""          # 지금까지 받은 전체 텍스트
+        self.sent = False       # 디스코드에 하나라도 올렸는지
+        self.finished = False   # finish()까지 정상적으로 끝났는지
+        self._messages = []     # 올린 디스코드 메시지들
+        self._offset = 0        # 현재(마지막) 메시지가 self.text의 어디부터인지
+        self._shown = None      # 현재 메시지에 마지막으로 반영한 내용 (None이면 아직 현재 메시지가 없음)
+        self._last_edit = 0.0
+        self._lock = asyncio.Lock()
+        self._pending: asyncio.Task = None
+        self._started = time.monotonic()
+        self._first_chunk = None
+        self._last_chunk = None
+        self._first_post = None
+
+    def start_timer(self):
+        """Gemini에 요청을 보내기 직전에 불러 TTFB 기준 시각을 잡습니다."""
+        self._started = time.monotonic()
+
+    async def push(self, chunk: str):
+        if not chunk:
+            return
+        now = time.monotonic()
+        if self._first_chunk is None:
+            self._first_chunk = now
+        self._last_chunk = now
+        self.text += chunk
+        if not self.sent:
+            await self._flush() # 첫 조각은 기다리지 않고 바로
+        elif self._pending is None or self._pending.done():
+            delay = self._last_edit + self.edit_interval - time.monotonic()
+            self._pending = asyncio.create_task(self._flush_later(max(0.0, delay)))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            current = self.text[self._offset:]
+            while len(current) > self.limit: # 넘친 만큼 현재 메시지를 마무리하고 다음 메시지로 이어 씀
+                cut = split_point(current, self.limit)
+                await self._show(current[:cut])
+                self._offset += cut
+                self._shown = None
+                self.metrics.splits += 1
+                current = self.text[self._offset:]
+            if current.strip() and current != self._shown:
+                await self._show(current)
+
+    async def _show(self, content: str):
+        if self._shown is None: # 새 메시지: 첫 메시지는 답장으로, 이어지는 메시지는 같은 채널에
+            if self._messages:
+                posted = await self._messages[-1].channel.send(content)
+            else:
+                posted = await self.message.reply(content, mention_author=False)
+                self._first_post = time.monotonic()
+                self.sent = True
+            self._messages.append(posted)
+        elif content != self._shown:
+            await self._messages[-1].edit(content=content)
+            self.metrics.edits += 1
+        self._shown = content
+        self._last_edit = time.monotonic()
+
+    async def finish(self):
+        """남은 내용을 반영하고 지표를 기록합니다. 받은 전체 텍스트를 돌려줍니다."""
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+            await asyncio.gather(self._pending, return_exceptions=True)
+        await self._flush()
+        self.finished = True
+        now = time.monotonic()
+        first_chunk, last_chunk = self._first_chunk or now, self._last_chunk or now
+        self.metrics.record(first_chunk - self._started, last_chunk - self._started,
+                            (self._first_post - self._started) if self._first_post else None, streamed=True)
+        return self.text
+
+    async def fail(self, notice: str):
+        """스트리밍 도중 오류가 나면 이미 보인 내용 뒤에 안내 문구를 붙입니다."""
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+            await asyncio.gather(self._pending, return_exceptions=True)
+        self.text += f"\n\n{notice}"
+        await self._flush()
@@ -0,0 +1,59 @@
+# test_gemini_dispatch.py
+# UserDispatcher가 사용자별로 하나씩 보내고 후속 메시지를 합치며, 보내다 취소되면 기다리던 호출자에게
+# SchedulerBusy를 돌려주는지 확인합니다. (generate_response가 '바쁨' 안내를 보낼 수 있게)
+# 실행: python -m pytest -q test_gemini_dispatch.py
+
+import asyncio
+
+import pytest
+
+from gemini_dispatch import UserDispatcher
+from gemini_scheduler import SchedulerBusy
+
+
+def test_followups_are_coalesced_into_one_send():
+    async def scenario():
+        dispatcher = UserDispatcher(coalesce=True)
+        sent = []
+        gate = asyncio.Event()
+
+        async def send(text):
+            sent.append(text)
+            await gate.wait()
+            return f"답: {text}"
+
+        first = asyncio.create_task(dispatcher.submit('u', "하나", send))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(dispatcher.submit('u', "둘", send))
+        third = asyncio.create_task(dispatcher.submit('u', "셋", send))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await first == "답: 하나"
+        assert await second == "답: 둘\n셋"
+        assert await third is None # 합쳐진 메시지에는 따로 답하지 않음
+        assert sent == ["하나", "둘\n셋"]
+    asyncio.run(scenario())
+
+
+def test_cancelled_send_resolves_waiting_callers_with_scheduler_busy():
+    async def scenario():
+        dispatcher = UserDispatcher(coalesce=False)
+        started = asyncio.Event()
+
+        async def cancelled_send(text):
+            started.set()
+            await asyncio.sleep(0)
+            raise asyncio.CancelledError() # 스케줄러 작업 안에서 난 취소
+
+        first = asyncio.create_task(dispatcher.submit('u', "하나", cancelled_send))
+        await started.wait()
+        queued = asyncio.create_task(dispatcher.submit('u', "둘", cancelled_send))
+        for task in (first, queued):
+            with pytest.raises(SchedulerBusy):
+                await task
+        assert dispatcher.queue_depth('u') == 0
+
+        async def send(text):
+            return f"답: {text}"
+        assert await dispatcher.submit('u', "셋", send) == "답: 셋" # 다음 요청은 새 작업자로 정상 처리
+    asyncio.run(scenario())
@@ -0,0 +1,55 @@
+# test_gemini_scheduler.py
+# GeminiScheduler 작업자가 작업 안에서 난 취소에도 살아남고, close()로는 제대로 멈추는지 확인합니다.
+# (Task.cancelling()이 없는 3.9/3.10처럼 _task_cancelling이 늘 False인 경우도 같이 봅니다)
+# 실행: python -m pytest -q test_gemini_scheduler.py
+
+import asyncio
+
+import pytest
+
+import gemini_scheduler
+from gemini_scheduler import GeminiScheduler
+
+
+@pytest.fixture(params=['native', 'no_cancelling'])
+def scheduler_factory(request, monkeypatch):
+    if request.param == 'no_cancelling':
+        monkeypatch.setattr(gemini_scheduler, '_task_cancelling', lambda task: False)
+    return lambda: GeminiScheduler(1, max_queue=10, deadline=5)
+
+
+async def _cancelled_inside():
+    raise asyncio.CancelledError()
+
+
+async def _answer():
+    return "으헤~"
+
+
+def test_worker_survives_a_job_cancelled_from_inside(scheduler_factory):
+    async def scenario():
+        scheduler = scheduler_factory()
+        with pytest.raises(asyncio.CancelledError):
+            await scheduler.run(_cancelled_inside)
+        assert await asyncio.wait_for(scheduler.run(_answer), 1) == "으헤~"
+        assert (scheduler.failed, scheduler.completed) == (1, 1)
+        await scheduler.close()
+    asyncio.run(scenario())
+
+
+def test_close_stops_a_worker_in_the_middle_of_a_job(scheduler_factory):
+    async def scenario():
+        scheduler = scheduler_factory()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        caller = asyncio.create_task(scheduler.run(slow))
+        await started.wait()
+        await asyncio.wait_for(scheduler.close(), 1)
+        assert scheduler._tasks == []
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+# test_geocoding.py
+# GeocodeCache(LRU 삭제, 없는 도시 기록, 재시작 후 유지)와 StaticGeocoder, 지오코딩 전에 거르는 조건을 확인합니다.
+# 실행: python -m pytest -q test_geocoding.py
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import geocoding
+from geocoding import GeocodeCache, GeoPlace, NOT_FOUND, StaticGeocoder
+from city_resolver import extract_city_query, is_city_candidate, is_explicit_weather_request
+
+BOSTON = GeoPlace("Boston", 42.3601, -71.0589, "US")
+PARIS = GeoPlace("Paris", 48.8566, 2.3522, "FR")
+LYON = GeoPlace("Lyon", 45.7640, 4.8357, "FR")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """last_used가 호출 순서대로 늘어나도록 geocoding 모듈의 시계를 바꿈 (같은 시각으로 겹치지 않게)."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(geocoding, 'time', SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = GeocodeCache(path=str(tmp_path / 'geocode.sqlite3'), max_entries=2, touch_interval=0) # 적중마다 사용 시각 갱신
+    yield cache
+    cache.close()
+
+
+def test_miss_then_hit_with_normalized_query(cache):
+    assert cache.get("보스턴") is None
+    cache.put("  보스턴 ", BOSTON)
+    assert cache.get("보스턴") == BOSTON
+    assert cache.get("BOSTON") is None # 다른 질의
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 2)
+
+
+def test_not_found_is_cached(cache):
+    cache.put("없는도시", None)
+    assert cache.get("없는도시") is NOT_FOUND
+    assert cache.stats()['entries'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.put("보스턴", BOSTON)
+    cache.put("파리", PARIS)
+    assert cache.get("보스턴") == BOSTON # 보스턴을 최근에 씀 -> 파리가 가장 오래 안 씀
+    cache.put("리옹", LYON)
+    assert cache.stats()['entries'] == 2
+    assert cache.get("파리") is None
+    assert cache.get("보스턴") == BOSTON
+    assert cache.get("리옹") == LYON
+
+
+def test_hits_within_touch_interval_do_not_write(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocoding, 'time', SimpleNamespace(time=lambda: now[0]))
+    cache = GeocodeCache(path=str(tmp_path / 'geocode.sqlite3'), touch_interval=60)
+    try:
+        cache.put("보스턴", BOSTON)
+        last_used = lambda: cache._conn.execute("SELECT last_used FROM places").fetchone()[0]
+        now[0] = 1030.0
+        assert cache.get("보스턴") == BOSTON
+        assert last_used() == 1000.0
+        now[0] = 1061.0
+        assert cache.get("보스턴") == BOSTON
+        assert last_used() == 1061.0
+    finally:
+        cache.close()
+
+
+def test_not_found_expires_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocoding, 'time', SimpleNamespace(time=lambda: now[0]))
+    cache = GeocodeCache(path=str(tmp_path / 'geocode.sqlite3'), not_found_ttl=600, touch_interval=0)
+    try:
+        cache.put("보스턴", None) # 일시적인 오류로 못 찾음
+        now[0] = 1500.0
+        assert cache.get("보스턴") is NOT_FOUND # 조회해도 기한이 늘어나지 않음
+        now[0] = 1601.0
+        assert cache.get("보스턴") is None # 기한이 지나 다시 찾게 함
+        assert cache.stats()['entries'] == 0
+        cache.put("보스턴", BOSTON)
+        assert cache.get("보스턴") == BOSTON
+    finally:
+        cache.close()
+
+
+def test_replacing_an_entry_does_not_count_twice(cache):
+    cache.put("보스턴", None)
+    cache.put("보스턴", BOSTON)
+    cache.put("파리", PARIS)
+    assert cache.stats()['entries'] == 2
+    assert cache.get("보스턴") == BOSTON
+    assert cache.get("파리") == PARIS
+
+
+def test_entries_survive_reopen(tmp_path, clock):
+    path = str(tmp_path / 'geocode.sqlite3')
+    first = GeocodeCache(path=path)
+    first.put("보스턴", BOSTON)
+    first.put("없는도시", None)
+    first.close()
+    second = GeocodeCache(path=path)
+    try:
+        assert second.get("보스턴") == BOSTON
+        assert second.get("없는도시") is NOT_FOUND
+        assert second.stats()['entries'] == 2
+    finally:
+        second.close()
+
+
+def test_static_geocoder_answers_from_table():
+    geocoder = StaticGeocoder({"Boston": BOSTON})
+    assert asyncio.run(geocoder.geocode(" boston ")) == BOSTON
+    assert asyncio.run(geocoder.geocode("atlantis")) is None
+    assert geocoder.calls == 2
+
+
+@pytest.mark.parametrize("message, query", [
+    ("보스턴 날씨", "보스턴"),
+    ("?보스턴 날씨", "보스턴"),
+    ("파리의 날씨", "파리"),
+    ("보스턴 날씨 어때?", "보스턴"),
+])
+def test_explicit_requests_are_geocoded(message, query):
+    assert extract_city_query(message) == query
+    assert is_city_candidate(query) and is_explicit_weather_request(message)
+
+
+@pytest.mark.parametrize("message", [
+    "이런 날씨에 뭐해", "무슨 날씨야", "좋은 날씨네", "맑은 날씨", "비오는 날씨", "?좋은 날씨",
+])
+def test_casual_chat_never_yields_a_geocodable_query(message):
+    query = extract_city_query(message)
+    assert not (query and is_city_candidate(query) and is_explicit_weather_request(message))
+
+
+def test_one_syllable_and_embedded_requests_are_not_geocoded():
+    assert not is_city_candidate("호")
+    assert not is_explicit_weather_request("보스턴 날씨가 궁금하네") # 대화 속 문장
@@ -0,0 +1,84 @@
+# test_history_window.py
+# HistoryWindow가 백그라운드 요약을 진행 중인 요청과 겹치지 않게 다음 fit()에서만 기록에 넣는지 확인합니다.
+# 실행: python -m pytest -q test_history_window.py
+
+import asyncio
+
+from history_window import HistoryWindow, SUMMARY_ACK, SUMMARY_PREFIX
+
+
+class FakeChatSession:
+    """history를 바꾸면 보내는 중인 주고받기를 잊는 ChatSession처럼, 대입 횟수를 셉니다."""
+    def __init__(self, turns: int):
+        self._history = []
+        for i in range(turns):
+            self._history.append({'role': 'user', 'parts': [f"질문 {i} " + "가" * 50]})
+            self._history.append({'role': 'model', 'parts': [f"대답 {i} " + "나" * 50]})
+        self.assignments = 0
+
+    @property
+    def history(self):
+        return list(self._history)
+
+    @history.setter
+    def history(self, value):
+        self.assignments += 1
+        self._history = list(value)
+
+    def exchange(self, text: str):
+        self._history += [{'role': 'user', 'parts': [text]}, {'role': 'model', 'parts': ["으헤~"]}]
+
+
+async def fake_summarize(text: str) -> str:
+    await asyncio.sleep(0)
+    return "선생은 고양이를 좋아함"
+
+
+def make_window() -> HistoryWindow:
+    return HistoryWindow(fake_summarize, budget=300, limit=100000)
+
+
+def test_summary_waits_for_next_fit():
+    async def scenario():
+        window = make_window()
+        session = FakeChatSession(6)
+        window.after_reply('u', session)
+        await window._state(session).summarizing
+        assert session.assignments == 0 # 요약이 끝나도 기록은 그대로 (다른 요청이 스트리밍 중일 수 있음)
+        session.exchange("스트리밍 중이던 질문") # 그 사이 끝난 주고받기
+        window.fit('u', session, "다음 질문")
+        history = session.history
+        assert session.assignments == 1
+        assert history[0]['parts'][0] == SUMMARY_PREFIX + "선생은 고양이를 좋아함"
+        assert history[1]['parts'][0] == SUMMARY_ACK
+        assert history[-2]['parts'][0] == "스트리밍 중이던 질문"
+        assert window.stats()['summaries_made'] == 1
+        assert window.stats()['turns_folded'] > 0
+    asyncio.run(scenario())
+
+
+def test_no_second_fold_while_summary_is_pending():
+    async def scenario():
+        window = make_window()
+        session = FakeChatSession(6)
+        window.after_reply('u', session)
+        first = window._state(session).summarizing
+        await first
+        session.exchange("하나 더")
+        window.after_reply('u', session)
+        assert window._state(session).summarizing is first
+    asyncio.run(scenario())
+
+
+def test_pending_summary_is_dropped_when_history_was_reset():
+    async def scenario():
+        window = make_window()
+        session = FakeChatSession(6)
+        window.after_reply('u', session)
+        await window._state(session).summarizing
+        session.history = [] # 세션 초기화
+        window.fit('u', session, "새로 시작")
+        assert session.history == []
+        assert window._state(session).pending is None
+        assert window.stats()['turns_folded'] == 0
+    asyncio.run(scenario())
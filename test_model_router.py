@@ -0,0 +1,142 @@
+# test_model_router.py
+# 지연과 실패를 정해 둔 가짜 모델 백엔드로 ModelRouter의 헤지, 장애 전환, 쉬게 한 모델의 복귀를 확인합니다.
+# 실행: python -m pytest -q test_model_router.py
+
+import asyncio
+
+import pytest
+
+from model_router import AllModelsFailed, ModelRouter
+
+
+class Blocked(Exception):
+    """안전 필터처럼 모델을 바꿔도 같은 오류 (다시 보내지 않음)."""
+
+
+class ScriptedBackend:
+    """모델별 (지연 초, 낼 예외 또는 None). 부른 순서와 끝까지 간/취소된 요청을 기록합니다."""
+    def __init__(self, script: dict):
+        self.script = script
+        self.calls = []
+        self.finished = []
+        self.cancelled = []
+
+    async def send(self, model_name: str) -> str:
+        self.calls.append(model_name)
+        delay, error = self.script[model_name]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(model_name)
+            raise
+        self.finished.append(model_name)
+        if error is not None:
+            raise error
+        return f"{model_name} 응답"
+
+
+def make_router(**kwargs) -> ModelRouter:
+    return ModelRouter(['a', 'b', 'c'], retryable=lambda e: not isinstance(e, Blocked), **kwargs)
+
+
+def warm_up(router: ModelRouter, name: str, latency: float = 0.01, samples: int = 30):
+    """p95를 믿을 만큼 성공 표본을 채움 (헤지가 켜지게)."""
+    for _ in range(samples):
+        router.record_success(name, latency)
+
+
+def test_hedge_wins_over_slow_primary():
+    async def scenario():
+        router = make_router(hedge=True)
+        warm_up(router, 'a')
+        backend = ScriptedBackend({'a': (1.0, None), 'b': (0.01, None), 'c': (0.01, None)})
+        result, name = await router.run(backend.send, 'a')
+        assert (result, name) == ("b 응답", 'b')
+        assert backend.calls == ['a', 'b']
+        assert backend.cancelled == ['a'] # 진 쪽은 취소
+        assert router.hedges == 1
+        assert router.health['b'].hedges_won == 1
+    asyncio.run(scenario())
+
+
+def test_no_hedge_without_enough_samples():
+    async def scenario():
+        router = make_router(hedge=True)
+        backend = ScriptedBackend({'a': (0.05, None), 'b': (0.01, None), 'c': (0.01, None)})
+        assert await router.run(backend.send, 'a') == ("a 응답", 'a')
+        assert backend.calls == ['a']
+        assert router.hedges == 0
+    asyncio.run(scenario())
+
+
+def test_failover_after_primary_error():
+    async def scenario():
+        router = make_router(hedge=False)
+        backend = ScriptedBackend({'a': (0.01, RuntimeError("500 Internal error")), 'b': (0.01, None), 'c': (0.01, None)})
+        assert await router.run(backend.send, 'a') == ("b 응답", 'b')
+        assert backend.calls == ['a', 'b']
+        assert router.failovers == 1
+        assert router.health['a'].failures == 1
+        assert router.health['a'].error_ewma > 0
+    asyncio.run(scenario())
+
+
+def test_all_models_failed_lists_every_error():
+    async def scenario():
+        router = make_router(hedge=False)
+        backend = ScriptedBackend({name: (0.0, RuntimeError(f"{name} 고장")) for name in 'abc'})
+        with pytest.raises(AllModelsFailed) as info:
+            await router.run(backend.send, 'a')
+        assert [name for name, _ in info.value.errors] == ['a', 'b', 'c']
+    asyncio.run(scenario())
+
+
+def test_quota_error_cools_model_down_until_it_recovers():
+    async def scenario():
+        router = make_router(hedge=False, cooldown=0.05)
+        backend = ScriptedBackend({'a': (0.0, RuntimeError("429 quota exceeded")), 'b': (0.0, None), 'c': (0.0, None)})
+        assert await router.run(backend.send, 'a') == ("b 응답", 'b')
+        assert not router.available('a')
+        assert 'a' not in router.ranked()
+        assert router.choose('a') != 'a' # 쉬는 모델은 주 모델로 두지 않음
+
+        backend.calls.clear()
+        await router.run(backend.send) # 쉬는 동안에는 a로 보내지 않음
+        assert 'a' not in backend.calls
+
+        await asyncio.sleep(0.06)
+        assert router.available('a')
+        backend.script['a'] = (0.0, None)
+        for _ in range(20): # 성공이 쌓이면 오류율이 다시 내려감
+            assert await router.run(backend.send, 'a') == ("a 응답", 'a')
+        assert router.health['a'].error_ewma < 0.05
+        assert router.choose('a') == 'a'
+    asyncio.run(scenario())
+
+
+def test_primary_still_finishes_when_hedge_hits_non_retryable_error():
+    async def scenario():
+        router = make_router(hedge=True)
+        warm_up(router, 'a')
+        backend = ScriptedBackend({'a': (0.1, None), 'b': (0.0, Blocked("안전 필터")), 'c': (0.0, None)})
+        assert await router.run(backend.send, 'a') == ("a 응답", 'a')
+        assert backend.calls == ['a', 'b'] # c로 넘기지 않음
+        assert backend.cancelled == []
+    asyncio.run(scenario())
+
+
+def test_non_retryable_error_raised_when_nothing_else_can_answer():
+    async def scenario():
+        router = make_router(hedge=True)
+        warm_up(router, 'a')
+        backend = ScriptedBackend({'a': (0.1, RuntimeError("500 Internal error")), 'b': (0.0, Blocked("안전 필터")),
+                                   'c': (0.0, None)})
+        with pytest.raises(Blocked):
+            await router.run(backend.send, 'a')
+        assert backend.calls == ['a', 'b']
+
+        backend = ScriptedBackend({'a': (0.0, Blocked("안전 필터")), 'b': (0.0, None), 'c': (0.0, None)})
+        with pytest.raises(Blocked):
+            await router.run(backend.send, 'a')
+        assert backend.calls == ['a']
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+# test_prompt_cache.py
+# FakeCacheBackend로 PromptCache의 생성/연장/404 후 재생성/종료 흐름을 네트워크 없이 확인합니다.
+# 실행: python -m pytest -q test_prompt_cache.py
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from prompt_cache import FakeCacheBackend, PromptCache
+
+PROMPT = "호시노" * 100
+CACHED_MODEL = 'gemini-1.5-flash-002'
+PLAIN_MODEL = 'gemma-3-27b-it'
+
+
+def make_cache(**backend_kwargs):
+    backend = FakeCacheBackend(supported={CACHED_MODEL}, **backend_kwargs)
+    invalidated = []
+    cache = PromptCache(PROMPT, backend=backend, ttl=600, refresh_margin=60, enabled=True,
+                        on_invalidate=invalidated.append)
+    return cache, backend, invalidated
+
+
+def expire_soon(cache, model_name):
+    cache._entries[model_name].expires_at = time.monotonic() + 1 # 연장 시점이 지난 것처럼
+
+
+def test_prepare_creates_cache_and_falls_back_for_unsupported_models():
+    async def scenario():
+        cache, backend, _ = make_cache()
+        await cache.prepare([CACHED_MODEL, PLAIN_MODEL])
+        try:
+            assert [entry['model'] for entry in backend.created] == [CACHED_MODEL]
+            assert cache.is_cached(CACHED_MODEL)
+            assert not cache.is_cached(PLAIN_MODEL)
+            assert cache.model(CACHED_MODEL) == (CACHED_MODEL, True)
+            assert cache.model(PLAIN_MODEL) == (PLAIN_MODEL, False)
+            assert cache.stats()['fallback_models'] == [PLAIN_MODEL]
+        finally:
+            await cache.close()
+    asyncio.run(scenario())
+
+
+def test_refresh_extends_cache_before_expiry():
+    async def scenario():
+        cache, backend, invalidated = make_cache()
+        await cache.prepare([CACHED_MODEL])
+        try:
+            expire_soon(cache, CACHED_MODEL)
+            await cache._refresh_due()
+            assert backend.extended == 1
+            assert len(backend.created) == 1
+            assert cache._entries[CACHED_MODEL].expires_at > time.monotonic() + 500
+            assert invalidated == []
+        finally:
+            await cache.close()
+    asyncio.run(scenario())
+
+
+def test_failed_extend_recreates_cache_and_invalidates_sessions():
+    async def scenario():
+        cache, backend, invalidated = make_cache(fail_extend=True) # 연장하면 404
+        await cache.prepare([CACHED_MODEL])
+        try:
+            first = cache._entries[CACHED_MODEL].handle
+            expire_soon(cache, CACHED_MODEL)
+            await cache._refresh_due()
+            assert len(backend.created) == 2
+            assert cache._entries[CACHED_MODEL].handle is not first
+            assert cache.is_cached(CACHED_MODEL)
+            assert invalidated == [CACHED_MODEL]
+        finally:
+            await cache.close()
+    asyncio.run(scenario())
+
+
+def test_close_deletes_caches_and_stops_refresher():
+    async def scenario():
+        cache, backend, _ = make_cache()
+        await cache.prepare([CACHED_MODEL])
+        refresher = cache._refresher
+        await cache.close()
+        assert backend.deleted == 1
+        assert refresher.cancelled()
+        assert not cache.is_cached(CACHED_MODEL)
+        assert cache.model(CACHED_MODEL) == (CACHED_MODEL, False)
+    asyncio.run(scenario())
+
+
+def test_latest_alias_is_never_retried():
+    async def scenario():
+        backend = FakeCacheBackend(supported={'gemini-1.5-flash-latest'}) # 백엔드가 받아줘도 별칭은 만들지 않음
+        cache = PromptCache(PROMPT, backend=backend, enabled=True)
+        await cache.prepare(['gemini-1.5-flash-latest'])
+        try:
+            assert backend.created == []
+            assert cache._retry_after == {}
+            assert cache.stats()['fallback_models'] == ['gemini-1.5-flash-latest']
+        finally:
+            await cache.close()
+    asyncio.run(scenario())
+
+
+def test_disabled_cache_uses_plain_models():
+    async def scenario():
+        backend = FakeCacheBackend(supported={CACHED_MODEL})
+        cache = PromptCache(PROMPT, backend=backend, enabled=False)
+        await cache.prepare([CACHED_MODEL])
+        assert backend.created == []
+        assert cache.model(CACHED_MODEL) == (CACHED_MODEL, False)
+    asyncio.run(scenario())
+
+
+def test_record_usage_accumulates_saved_tokens():
+    cache = PromptCache(PROMPT, backend=FakeCacheBackend(), enabled=False)
+    assert cache.record_usage(SimpleNamespace(usage_metadata=SimpleNamespace(cached_content_token_count=120))) == 120
+    assert cache.record_usage(SimpleNamespace(usage_metadata=None)) == 0
+    stats = cache.stats()
+    assert (stats['requests'], stats['cached_requests'], stats['tokens_saved']) == (2, 1, 120)
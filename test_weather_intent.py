@@ -0,0 +1,30 @@
+# test_weather_intent.py
+# detect_forecast_intent가 긴 말부터 단어 단위로 맞추고('이번 주말'이 '이번 주'로 잡히지 않게) 도시 이름만 남기는지 확인합니다.
+# 실행: python -m pytest -q test_weather_intent.py (weather.py가 requests/aiohttp를 불러오므로 requirements.txt 설치 필요)
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('aiohttp')
+
+from weather import detect_forecast_intent
+
+
+@pytest.mark.parametrize("message, intent, rest", [
+    ("서울 날씨", "today", "서울 날씨"),
+    ("오늘 서울 날씨", "today", "서울 날씨"),
+    ("내일 부산 날씨", "tomorrow", "부산 날씨"),
+    ("서울 내일의 날씨", "tomorrow", "서울 날씨"),
+    ("?내일 날씨", "tomorrow", "? 날씨"),
+    ("내일모레 서울 날씨", "day_after", "서울 날씨"),
+    ("내일 모레 대구 날씨", "day_after", "대구 날씨"),
+    ("서울 모레 날씨", "day_after", "서울 날씨"),
+    ("이번 주말 서울 날씨", "weekend", "서울 날씨"),
+    ("서울 이번주말 날씨", "weekend", "서울 날씨"),
+    ("주말에 부산 날씨 어때?", "weekend", "부산 날씨 어때?"),
+    ("이번 주 서울 날씨", "week", "서울 날씨"),
+    ("서울 주간 날씨", "week", "서울 날씨"),
+    ("주간지 날씨", "today", "주간지 날씨"), # 단어 일부는 맞추지 않음
+])
+def test_detect_forecast_intent(message, intent, rest):
+    assert detect_forecast_intent(message) == (intent, rest)
@@ -1,12 +1,46 @@
 # weather.py
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import OrderedDict
 import requests
-from datetime import datetime
+import aiohttp
 from dotenv import load_dotenv
 import os
 
+from city_matcher import get_city_matcher
+from city_resolver import get_city_resolver, extract_city_query, is_city_candidate, is_explicit_weather_request
+from geocoding import GeocodeCache, GeoPlace, NOT_FOUND
+from forecast_engine import ForecastColumns
+
+logger = logging.getLogger('HoshinoBot.weather')
+
 load_dotenv() # .env 파일에서 환경 변수 로드
 API_KEY = os.getenv('API_KEY')  # OpenWeatherMap API Key
 BASE_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+GEOCODE_URL = 'https://api.openweathermap.org/geo/1.0/direct' # city_map에 없는 도시의 좌표 조회용
+
+REQUEST_TIMEOUT = 10 # 동기 요청(forecast_today) 타임아웃 (초)
+REQUEST_DEADLINE = float(os.getenv('WEATHER_REQUEST_DEADLINE', '5')) # 비동기 요청 1건당 전체 마감 시간 (초)
+POOL_LIMIT = int(os.getenv('WEATHER_POOL_LIMIT', '20')) # 공유 세션의 최대 동시 연결 수
+CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '1800')) # 예보 캐시가 신선하다고 보는 시간 (초)
+CACHE_MAX_STALE = float(os.getenv('WEATHER_CACHE_MAX_STALE', '21600')) # 이 시간이 지나면 오래된 값도 쓰지 않음 (초)
+CACHE_FILE = os.getenv('WEATHER_CACHE_FILE', 'weather_cache.json') # 재시작 후에도 캐시를 유지하기 위한 파일
+CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '200')) # city_map 밖(지오코딩한 위치) 예보를 최대 몇 곳까지 보관할지
+CACHE_SAVE_INTERVAL = 60 # 디스크 저장 최소 간격 (초)
+RETRY_MAX_ATTEMPTS = int(os.getenv('WEATHER_RETRY_MAX_ATTEMPTS', '3')) # 마감 시간 안에서 시도할 최대 횟수
+RETRY_BACKOFF_BASE = float(os.getenv('WEATHER_RETRY_BACKOFF_BASE', '0.3')) # 재시도 대기 시간의 기준 (초, 2배씩 증가)
+RETRY_BACKOFF_CAP = float(os.getenv('WEATHER_RETRY_BACKOFF_CAP', '2.0')) # 재시도 대기 시간 상한 (초)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('WEATHER_BREAKER_THRESHOLD', '5')) # 연속 실패가 이만큼이면 차단기 열림
+BREAKER_RESET_TIMEOUT = float(os.getenv('WEATHER_BREAKER_RESET', '30')) # 열린 뒤 이 시간이 지나면 시험 요청 1건 허용 (초)
+PREFETCH_ENABLED = os.getenv('WEATHER_PREFETCH', '0') == '1' # city_map 전체를 주기적으로 미리 받아둘지 여부
+PREFETCH_INTERVAL = float(os.getenv('WEATHER_PREFETCH_INTERVAL', '1200')) # 한 바퀴(모든 도시) 갱신 주기 (초)
+PREFETCH_JITTER = float(os.getenv('WEATHER_PREFETCH_JITTER', '5')) # 도시 간 간격에 더하는 무작위 흔들림 (초)
+PREFETCH_CONCURRENCY = int(os.getenv('WEATHER_PREFETCH_CONCURRENCY', '2')) # 동시에 진행할 미리 받기 요청 수
+PREFETCH_MIN_SPACING = float(os.getenv('WEATHER_PREFETCH_MIN_SPACING', '1.0')) # 요청 사이 최소 간격 (API 분당 호출 제한 대비, 초)
 
 city_map = {
     "서울": "Seoul",
@@ -23,82 +57,713 @@ city_map = {
     "도쿄": "Tokyo",
     # 필요한 도시를 계속 추가할 수 있어요
 }
+city_map_version = 0 # city_map이 바뀔 때마다 증가 (도시 매처 재생성 판단용)
 
-def forecast_today(city_kr: str) -> str:
-    if not API_KEY:
-        print("OpenWeatherMap API_KEY가 .env 파일에 설정되지 않았습니다.")
-        return "이런, 날씨 정보를 가져오기 위한 중요한 설정이 빠진 것 같아. 관리자에게 슬쩍 알려줘, 선생."
+# 별칭/구 이름 -> city_map의 한글 도시 이름
+city_aliases = {
+    "서울시": "서울", "한양": "서울", "강남": "서울", "홍대": "서울", "잠실": "서울", "여의도": "서울",
+    "부산시": "부산", "해운대": "부산", "서면": "부산",
+    "인천시": "인천", "송도": "인천", "부평": "인천",
+    "대구시": "대구", "광주시": "광주", "대전시": "대전", "울산시": "울산", "수원시": "수원",
+    "제주도": "제주", "제주시": "제주", "서귀포": "제주",
+    "파주시": "파주", "운정": "파주", "동경": "도쿄", "토쿄": "도쿄",
+}
+
+
+def register_city(city_kr: str, city_en: str):
+    """실행 중에 도시를 추가/변경합니다. 다음 메시지부터 도시 매처가 새로 만들어집니다."""
+    global city_map_version
+    city_map[city_kr] = city_en
+    city_map_version += 1
+
+
+def find_weather_city(message: str):
+    """메시지에서 '도시 날씨' 요청을 찾아 한글 도시 이름을 돌려줍니다. 없으면 None."""
+    return get_city_matcher(city_map, city_map_version).find_weather_city(message)
+
+
+def resolve_weather_city(message: str):
+    """
+    find_weather_city가 못 찾은 '서을 날씨' 같은 요청을 오타/별칭까지 고려해 찾습니다.
+    (질의한 이름, 후보 도시 목록)을 반환합니다. 후보가 1개면 확정, 여러 개면 되물어봐야 합니다.
+    """
+    query = extract_city_query(message)
+    if not query:
+        return None, []
+    return query, get_city_resolver(city_map, city_aliases, city_map_version).resolve(query)
+
+
+def should_geocode(message: str, query: str) -> bool:
+    """
+    city_map과 별칭으로 못 찾은 이름을 지오코딩해도 되는지. 잡담 속 '이런 날씨'의 '이런'처럼
+    우연히 뽑힌 말을 지오코딩 API로 보내 엉뚱한 곳의 날씨를 답하지 않도록, 직접 묻는 요청만 허용합니다.
+    """
+    return is_city_candidate(query) and is_explicit_weather_request(message)
 
-    city_en = city_map.get(city_kr)
-    if not city_en:
-        # 이 경우는 보통 generate_response에서 처리되지만, 만약을 위해 남겨둡니다.
-        return f"음... {city_kr}는 아직 지도에 없는 도시인가봐. 내가 아는 도시인지 다시 한번 확인해줄래?"
 
-    params = {
-        'q': city_en,
+def _build_params(city_en: str) -> dict:
+    if city_en.startswith("geo:"): # 지오코딩으로 찾은 위치 (GeoPlace.key)
+        lat, lon = city_en[4:].split(",")
+        location = {'lat': lat, 'lon': lon}
+    else:
+        location = {'q': city_en}
+    return {
+        **location,
         'appid': API_KEY,
         'units': 'metric', # 섭씨 온도
         'lang': 'kr'      # 한국어 설명
     }
 
+
+FORECAST_INTENTS = ("today", "tomorrow", "day_after", "weekend", "week")
+# 긴 말부터 (이번 주말 > 이번 주, 내일모레 > 내일). 띄어쓰기는 있든 없든 같게 봄
+_INTENT_WORDS = (
+    (r"이번\s*주말", "weekend"), (r"주말", "weekend"),
+    (r"내일\s*모레", "day_after"), (r"모레", "day_after"),
+    (r"내일", "tomorrow"), (r"오늘", "today"),
+    (r"이번\s*주", "week"), (r"주간", "week"), (r"일주일", "week"),
+)
+# 단어 전체(앞의 '?'와 뒤의 조사는 허용)만 맞춤: '주말'이 '이번 주'로, '주간지'가 '주간'으로 잡히지 않게
+_INTENT_RE = re.compile(
+    r"(?<!\S)(\??)(" + "|".join(f"(?:{word})" for word, _ in _INTENT_WORDS) + r")(?:에는|에|의|은|는|도|엔)?(?=\s|날씨|[?!.~]|$)"
+)
+_INTENT_PATTERNS = [(re.compile(word), intent) for word, intent in _INTENT_WORDS]
+_WEEKDAYS_KR = "월화수목금토일"
+
+
+def detect_forecast_intent(message: str):
+    """
+    '내일 날씨', '모레 날씨', '이번 주말 날씨', '주간 날씨' 같은 요청 종류를 찾습니다.
+    (intent, 요청 단어를 뺀 메시지)를 반환하며, 뺀 메시지로 도시를 찾으면 됩니다.
+    """
+    match = _INTENT_RE.search(message)
+    if match is None:
+        return "today", message
+    word = match.group(2)
+    intent = next(intent for pattern, intent in _INTENT_PATTERNS if pattern.fullmatch(word))
+    rest = message[:match.start()] + match.group(1) + " " + message[match.end():]
+    return intent, " ".join(rest.split())
+
+
+def _format_forecast(city_kr: str, city_en: str, data: dict, intent: str = "today") -> str:
+    """API 응답(JSON)에서 오늘/내일/주간 예보를 뽑아 호시노 말투의 문장으로 만듭니다. (도시 현지 날짜 기준)"""
+    if data.get("cod") != "200":
+        error_message = data.get("message", "알 수 없는 API 오류")
+        logger.warning(f"날씨 API 응답 오류 (도시: {city_en}, 코드: {data.get('cod')}): {error_message}")
+        return f"'{city_kr}' 날씨 정보를 가져오는데 실패했어. 도시 이름이 정확한지 확인하거나, 나중에 다시 시도해줘. (서버 메시지: {error_message})"
+
+    columns = forecast_cache.columns(city_en, data) # 캐시에 든 응답이면 한 번만 파싱
+    summaries = columns.daily_summaries()
+    today = columns.local_today(time.time())
+
+    if intent == "week":
+        days = [summaries[day] for day in sorted(summaries) if day >= today]
+        if not days:
+            logger.info(f"{city_kr}({city_en})에 대한 주간 예보 데이터가 API 응답에 없습니다.")
+            return f"흠… {city_kr} 주간 날씨 정보를 찾을 수가 없었어. 잠시 후에 다시 물어봐줄래?"
+        lines = [f"• {d.date.month}/{d.date.day}({_WEEKDAYS_KR[d.date.weekday()]}): {d.main_desc or '날씨 정보 없음'}, {d.min_temp:.1f}~{d.max_temp:.1f}도"
+                 for d in days]
+        return f"선생, 앞으로 {len(days)}일 동안 {city_kr} 날씨는 이렇대~ 📅\n" + "\n".join(lines)
+
+    if intent == "weekend":
+        # 다가오는 토/일 (오늘이 주말이면 오늘부터). 5일 예보라 일요일까지 닿지 않을 수 있음
+        days = [summaries[day] for day in sorted(summaries) if today <= day < today + 7 and summaries[day].date.weekday() >= 5]
+        if not days:
+            logger.info(f"{city_kr}({city_en})에 대한 주말 예보 데이터가 API 응답에 없습니다.")
+            return f"흠… 이번 주말 {city_kr} 날씨는 아직 예보가 안 나왔나 봐. 주말이 가까워지면 다시 물어봐줄래?"
+        lines = [f"• {d.date.month}/{d.date.day}({_WEEKDAYS_KR[d.date.weekday()]}): {d.main_desc or '날씨 정보 없음'}, {d.min_temp:.1f}~{d.max_temp:.1f}도"
+                 for d in days]
+        return f"선생, 이번 주말 {city_kr} 날씨는 이렇대~ 놀러 갈 거야? 🏖️\n" + "\n".join(lines)
+
+    offset, label = {"tomorrow": (1, "내일"), "day_after": (2, "모레")}.get(intent, (0, "오늘"))
+    target = today + offset
+    summary = summaries.get(target)
+    if summary is None:
+        logger.info(f"{label}({target}) {city_kr}({city_en})에 대한 예보 데이터가 API 응답에 없습니다.")
+        return f"흠… {label} {city_kr} 날씨 정보를 찾을 수가 없었어. 혹시 너무 이른 시간이거나 늦은 시간일까? 내일 다시 확인해볼게!"
+
+    main_desc = summary.main_desc or "날씨 정보 없음" # 드문 경우
+    return f"선생, {label} {city_kr}은(는) {main_desc}이(가) 예상된대. 기온은 최저 {summary.min_temp:.1f}도에서 최고 {summary.max_temp:.1f}도 사이니까 옷차림에 참고하라구~ ☁️🌂"
+
+
+def _http_error_reply(city_kr: str, city_en: str, status_code: int) -> str:
+    if status_code == 401:
+        return "이런, 날씨 정보를 가져올 권한이 없나 봐. API 키가 문제일지도? 관리자에게 알려줘야겠어."
+    elif status_code == 404:
+        return f"음... '{city_kr}'({city_en})라는 도시를 찾을 수 없다고 나와. 도시 이름이 정확한지 다시 한번 확인해줄래?"
+    return f"우웅… {city_kr} 날씨 정보를 가져오는 중 네트워크 문제가 생겼나봐 (오류 코드: {status_code}). 조금 있다가 다시 시도해줄래, 선생?"
+
+
+def _precheck(city_kr: str):
+    """API 키와 도시 이름을 확인합니다. (city_en, 오류 메시지) 튜플을 반환합니다."""
+    if not API_KEY:
+        logger.error("OpenWeatherMap API_KEY가 .env 파일에 설정되지 않았습니다.")
+        return None, "이런, 날씨 정보를 가져오기 위한 중요한 설정이 빠진 것 같아. 관리자에게 슬쩍 알려줘, 선생."
+
+    city_en = city_map.get(city_kr)
+    if not city_en:
+        # 이 경우는 보통 generate_response에서 처리되지만, 만약을 위해 남겨둡니다.
+        return None, f"음... {city_kr}는 아직 지도에 없는 도시인가봐. 내가 아는 도시인지 다시 한번 확인해줄래?"
+    return city_en, None
+
+
+def forecast_today(city_kr: str) -> str:
+    """동기 버전. 이벤트 루프 안에서는 forecast_today_async를 사용하세요."""
+    city_en, precheck_error = _precheck(city_kr)
+    if precheck_error:
+        return precheck_error
+
     try:
-        response = requests.get(BASE_URL, params=params, timeout=10) # 타임아웃 설정
+        response = requests.get(BASE_URL, params=_build_params(city_en), timeout=REQUEST_TIMEOUT) # 타임아웃 설정
         response.raise_for_status()  # 200 OK가 아니면 HTTPError 발생
-        data = response.json()
-
-        if data.get("cod") != "200":
-            error_message = data.get("message", "알 수 없는 API 오류")
-            print(f"날씨 API 응답 오류 (도시: {city_en}, 코드: {data.get('cod')}): {error_message}")
-            return f"'{city_kr}' 날씨 정보를 가져오는데 실패했어. 도시 이름이 정확한지 확인하거나, 나중에 다시 시도해줘. (서버 메시지: {error_message})"
-
-        today = datetime.now().date()
-        temps = []
-        descriptions = []
-        found_today_data = False
-
-        for entry in data.get('list', []):
-            dt_object = datetime.fromtimestamp(entry['dt'])
-            if dt_object.date() == today:
-                found_today_data = True
-                temps.append(entry['main']['temp'])
-                if entry.get('weather') and len(entry['weather']) > 0:
-                    descriptions.append(entry['weather'][0]['description'])
-
-        if not found_today_data:
-            print(f"오늘({today}) {city_kr}({city_en})에 대한 예보 데이터가 API 응답에 없습니다.")
-            return f"흠… 오늘 {city_kr} 날씨 정보를 찾을 수가 없었어. 혹시 너무 이른 시간이거나 늦은 시간일까? 내일 다시 확인해볼게!"
-
-        if temps:
-            min_temp = min(temps)
-            max_temp = max(temps)
-            if descriptions:
-                # 가장 자주 등장하는 날씨 설명을 대표로 사용
-                main_desc = max(set(descriptions), key=descriptions.count)
-            else:
-                main_desc = "날씨 정보 없음" # 드문 경우
-            return f"선생, 오늘 {city_kr}은(는) {main_desc}이(가) 예상된대. 기온은 최저 {min_temp:.1f}도에서 최고 {max_temp:.1f}도 사이니까 옷차림에 참고하라구~ ☁️🌂"
-        else:
-            # found_today_data는 True인데 temps가 비어있는 경우 (데이터 구조 문제)
-            print(f"오늘({today}) {city_kr}({city_en}) 날씨 데이터는 있었으나 온도 정보를 추출하지 못했습니다.")
-            return f"이상하다... 오늘 {city_kr} 날씨 정보는 있는데, 자세한 내용을 모르겠어. 잠시 후에 다시 물어봐줄래?"
+        return _format_forecast(city_kr, city_en, response.json())
 
     except requests.exceptions.HTTPError as http_err:
         status_code = http_err.response.status_code
-        print(f"날씨 API HTTP 오류 (도시: {city_en}, 상태 코드: {status_code}): {http_err}")
-        if status_code == 401:
-            return "이런, 날씨 정보를 가져올 권한이 없나 봐. API 키가 문제일지도? 관리자에게 알려줘야겠어."
-        elif status_code == 404:
-            return f"음... '{city_kr}'({city_en})라는 도시를 찾을 수 없다고 나와. 도시 이름이 정확한지 다시 한번 확인해줄래?"
-        return f"우웅… {city_kr} 날씨 정보를 가져오는 중 네트워크 문제가 생겼나봐 (오류 코드: {status_code}). 조금 있다가 다시 시도해줄래, 선생?"
+        logger.error(f"날씨 API HTTP 오류 (도시: {city_en}, 상태 코드: {status_code}): {http_err}")
+        return _http_error_reply(city_kr, city_en, status_code)
     except requests.exceptions.Timeout:
-        print(f"날씨 API 요청 시간 초과 (도시: {city_en})")
+        logger.warning(f"날씨 API 요청 시간 초과 (도시: {city_en})")
         return f"끙... {city_kr} 날씨 정보를 가져오는데 너무 오래 걸리네. 서버가 느린가? 잠시 후에 다시 물어봐줘."
     except requests.exceptions.RequestException as req_err:
-        print(f"날씨 API 요청 오류 (도시: {city_en}): {req_err}")
+        logger.error(f"날씨 API 요청 오류 (도시: {city_en}): {req_err}")
         return f"우웅… {city_kr} 날씨 정보를 요청하는 데 문제가 생겼어. 인터넷 연결을 확인하고 다시 시도해줄래?"
     except KeyError as key_err:
-        print(f"날씨 API 응답 데이터 형식 오류 (도시: {city_en}): {key_err}")
+        logger.error(f"날씨 API 응답 데이터 형식 오류 (도시: {city_en}): {key_err}")
         return f"날씨 정보를 받았는데... 내가 모르는 말로 되어있네. {city_kr} 날씨는 나중에 다시 알려줄게, 선생."
     except Exception as e:
-        print(f"날씨 API 처리 중 알 수 없는 오류 (도시: {city_en}): {e}")
-        return "우웅… 날씨 정보를 가져오는 데 예상치 못한 문제가 생겼어. 조금 있다가 다시 시도해줄래, 선생?"
\ No newline at end of file
+        logger.error(f"날씨 API 처리 중 알 수 없는 오류 (도시: {city_en}): {e}", exc_info=True)
+        return "우웅… 날씨 정보를 가져오는 데 예상치 못한 문제가 생겼어. 조금 있다가 다시 시도해줄래, 선생?"
+
+
+# --- 차단기 (circuit breaker) ---
+class CircuitOpenError(Exception):
+    """차단기가 열려 있어 요청을 보내지 않고 바로 실패했을 때 발생합니다."""
+
+
+class CircuitBreaker:
+    """
+    연속 실패가 failure_threshold번이면 열려서(open) 요청을 즉시 실패시킵니다.
+    reset_timeout이 지나면 반열림(half-open) 상태로 시험 요청 1건만 보내고,
+    성공하면 닫히고(closed) 실패하면 다시 열립니다. 상태 변화는 HoshinoBot 로거로 남깁니다.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at = None
+        self.rejected = 0 # 열려 있어서 바로 실패시킨 요청 수
+
+    def _transition(self, new_state: str, reason: str):
+        if new_state == self.state:
+            return
+        log = logger.warning if new_state == self.OPEN else logger.info
+        log(f"차단기 '{self.name}': {self.state} -> {new_state} ({reason})")
+        self.state = new_state
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN, f"{self.reset_timeout:.0f}초 경과, 시험 요청 허용")
+        if self.state == self.HALF_OPEN:
+            # 시험 요청은 한 번에 하나만. 시험 요청이 취소되어 결과가 안 돌아온 경우를 대비해 시간이 지나면 다시 허용
+            if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                self._probe_started_at = now
+                return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_started_at = None
+        self._transition(self.CLOSED, "요청 성공")
+
+    def record_failure(self, error: Exception):
+        self.consecutive_failures += 1
+        self._probe_started_at = None
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN, f"연속 실패 {self.consecutive_failures}회, 마지막 오류: {type(error).__name__}: {error}")
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'consecutive_failures': self.consecutive_failures, 'rejected': self.rejected}
+
+
+def _is_retryable(error: Exception) -> bool:
+    """일시적인 문제(시간 초과, 연결 오류, 429/5xx)만 재시도합니다. 401/404 같은 오류는 다시 해도 같습니다."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+# --- 비동기 날씨 클라이언트 ---
+class WeatherClient:
+    """
+    봇 전체가 공유하는 aiohttp 세션(커넥션 풀)으로 OpenWeatherMap을 호출합니다.
+    setup_hook에서 start(), 봇 종료 시 close()를 호출하세요.
+    start() 없이 호출되면 첫 요청 때 세션을 만듭니다 (이전 버전 봇 호환용).
+    """
+    def __init__(self, base_url: str = BASE_URL, deadline: float = REQUEST_DEADLINE, pool_limit: int = POOL_LIMIT,
+                 geocode_url: str = GEOCODE_URL):
+        self.base_url = base_url
+        self.geocode_url = geocode_url
+        self.deadline = deadline
+        self.pool_limit = pool_limit
+        self.max_attempts = RETRY_MAX_ATTEMPTS
+        self.backoff_base = RETRY_BACKOFF_BASE
+        self.backoff_cap = RETRY_BACKOFF_CAP
+        self.breaker = CircuitBreaker("OpenWeatherMap")
+        self._session: aiohttp.ClientSession = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_limit, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            logger.info(f"날씨 클라이언트 세션 생성 (동시 연결 최대 {self.pool_limit}개, 요청 마감 {self.deadline}초)")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("날씨 클라이언트 세션 종료")
+        self._session = None
+
+    async def _get_json(self, url: str, params: dict, deadline: float = None):
+        """
+        차단기를 거쳐 GET 요청을 보냅니다. 일시적인 오류는 지터가 섞인 지수 백오프로 재시도하되,
+        모든 시도가 요청 1건의 마감 시간(deadline) 안에서 끝나도록 합니다.
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"차단기 '{self.breaker.name}'가 열려 있습니다.")
+            remaining = deadline_at - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                async with self._session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=remaining)) as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+                self.breaker.record_success()
+                return data
+            except Exception as e:
+                if not _is_retryable(e):
+                    self.breaker.record_success() # 서버는 살아 있음 (요청 자체의 문제)
+                    raise
+                self.breaker.record_failure(e)
+                attempt += 1
+                backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))) # full jitter
+                if attempt >= self.max_attempts or loop.time() + backoff >= deadline_at or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                logger.info(f"날씨 API 재시도 {attempt}/{self.max_attempts - 1} ({backoff:.2f}초 후, 오류: {type(e).__name__})")
+                await asyncio.sleep(backoff)
+
+    async def fetch_forecast(self, city_en: str, deadline: float = None) -> dict:
+        """5일/3시간 예보 JSON을 가져옵니다. 마감 시간을 넘기면 asyncio.TimeoutError가 발생합니다."""
+        return await self._get_json(self.base_url, _build_params(city_en), deadline)
+
+    async def fetch_geocode(self, query: str, deadline: float = None) -> list:
+        """OpenWeatherMap 지오코딩 API로 도시 이름의 후보 위치 목록을 가져옵니다."""
+        return await self._get_json(self.geocode_url, {'q': query, 'limit': 1, 'appid': API_KEY}, deadline)
+
+
+class OpenWeatherGeocoder:
+    """WeatherClient의 공유 세션으로 지오코딩하는 기본 지오코더. (오프라인에선 geocoding.StaticGeocoder 사용)"""
+    def __init__(self, client: WeatherClient):
+        self.client = client
+
+    async def geocode(self, query: str):
+        results = await self.client.fetch_geocode(query)
+        if not results:
+            return None
+        top = results[0]
+        name = top.get('local_names', {}).get('ko') or top.get('name') or query
+        return GeoPlace(name, float(top['lat']), float(top['lon']), top.get('country'))
+
+
+# --- 예보 캐시 (stale-while-revalidate) ---
+class _CachedForecast:
+    __slots__ = ('fetched_at', 'data', 'columns')
+
+    def __init__(self, fetched_at: float, data: dict):
+        self.fetched_at = fetched_at # 저장 시각 (epoch)
+        self.data = data
+        self.columns = None # 처음 쓸 때 파싱한 ForecastColumns
+
+
+def _is_city_map_key(city_en: str) -> bool:
+    return city_en in city_map.values()
+
+
+class ForecastCache:
+    """
+    city_en을 키로 API 응답(JSON)을 보관합니다.
+    ttl 안이면 신선한 값, ttl ~ max_stale 사이면 오래된 값(즉시 반환 + 백그라운드 갱신),
+    max_stale을 넘으면 없는 것으로 취급합니다. 내용은 JSON 파일로 저장되어 재시작 후에도 유지됩니다.
+    pinned(city_en)가 False인 키(지오코딩한 'geo:위도,경도' 등)는 max_stale이 지나면 버리고, max_entries개까지만 LRU로 둡니다.
+    (city_map 도시는 수가 정해져 있고, API 장애 때 peek()로 쓰도록 남겨 둠)
+    """
+    def __init__(self, ttl: float = CACHE_TTL, max_stale: float = CACHE_MAX_STALE, path: str = CACHE_FILE,
+                 max_entries: int = CACHE_MAX_ENTRIES, pinned=_is_city_map_key):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.path = path
+        self.max_entries = max_entries
+        self.pinned = pinned
+        self._entries = OrderedDict() # city_en -> _CachedForecast (오래 안 쓴 것부터)
+        self._last_saved = 0.0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, city_en: str):
+        """(data, 신선 여부)를 반환합니다. 쓸 수 있는 값이 없으면 (None, False)."""
+        entry = self._entries.get(city_en)
+        if entry is None:
+            return None, False
+        self._entries.move_to_end(city_en)
+        age = time.time() - entry.fetched_at
+        if age <= self.ttl:
+            return entry.data, True
+        if age <= self.max_stale:
+            return entry.data, False
+        return None, False
+
+    def put(self, city_en: str, data: dict):
+        self._entries[city_en] = _CachedForecast(time.time(), data)
+        self._entries.move_to_end(city_en)
+        self._prune()
+
+    def _prune(self):
+        """고정되지 않은 키 중 max_stale이 지난 것을 버리고, 남은 것이 max_entries를 넘으면 오래 안 쓴 것부터 버립니다."""
+        expires = time.time() - self.max_stale
+        unpinned = [city for city in self._entries if not self.pinned(city)]
+        overflow = len(unpinned) - self.max_entries
+        for city in unpinned: # 오래 안 쓴 것부터
+            if overflow > 0 or self._entries[city].fetched_at < expires:
+                del self._entries[city]
+                self.evictions += 1
+                overflow -= 1
+
+    def columns(self, city_en: str, data: dict) -> ForecastColumns:
+        """data가 캐시에 든 응답이면 파싱 결과를 그 항목에 같이 보관해 다시 쓰고, 아니면 매번 파싱합니다."""
+        entry = self._entries.get(city_en)
+        if entry is None or entry.data is not data:
+            return ForecastColumns.from_payload(data)
+        if entry.columns is None:
+            entry.columns = ForecastColumns.from_payload(data)
+        return entry.columns
+
+    def peek(self, city_en: str):
+        """나이와 상관없이 남아 있는 값을 돌려줍니다. (API 장애 시 비상용)"""
+        entry = self._entries.get(city_en)
+        return entry.data if entry else None
+
+    def fetched_at(self, city_en: str):
+        entry = self._entries.get(city_en)
+        return entry.fetched_at if entry else None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            entries = sorted(raw.items(), key=lambda item: item[1]['fetched_at']) # 오래된 것부터 (LRU 순서 대신)
+            self._entries = OrderedDict((city, _CachedForecast(entry['fetched_at'], entry['data'])) for city, entry in entries)
+            self._prune()
+            logger.info(f"날씨 캐시 {len(self._entries)}건을 '{self.path}'에서 불러왔습니다.")
+        except Exception as e:
+            logger.warning(f"날씨 캐시 파일 '{self.path}'를 읽지 못했습니다. 빈 캐시로 시작합니다: {e}")
+            self._entries = OrderedDict()
+
+    def _snapshot(self) -> dict:
+        """이벤트 루프에서 만들어야 합니다. (스레드에서 순회하면 put()과 겹쳐 딕셔너리 크기가 바뀔 수 있음)"""
+        self._prune() # 만료된 위치는 파일에도 남기지 않음
+        return {city: {'fetched_at': entry.fetched_at, 'data': entry.data} for city, entry in self._entries.items()}
+
+    def save(self):
+        if self.path:
+            self._write(self._snapshot())
+
+    def _write(self, snapshot: dict):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path) # 저장 도중 죽어도 기존 파일은 온전하게
+            self._last_saved = time.time()
+        except Exception as e:
+            logger.error(f"날씨 캐시 파일 '{self.path}' 저장 실패: {e}")
+
+    async def save_soon(self):
+        """마지막 저장 후 CACHE_SAVE_INTERVAL이 지났다면 스레드 풀에서 저장합니다."""
+        if not self.path or time.time() - self._last_saved < CACHE_SAVE_INTERVAL:
+            return
+        self._last_saved = time.time()
+        snapshot = self._snapshot() # 루프에서 복사하고 파일 쓰기만 스레드로
+        await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+
+
+# --- 동시 요청 합치기 (single-flight) ---
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 요청은 진행 중인 하나의 작업 결과를 함께 기다립니다.
+    먼저 온 호출자가 취소되어도 작업은 계속되어 나머지 호출자에게 결과가 전달됩니다.
+    """
+    def __init__(self):
+        self._inflight = {} # key -> asyncio.Task
+        self.leaders = 0    # 실제로 작업을 시작한 호출 수
+        self.coalesced = 0  # 진행 중인 작업에 합쳐진 호출 수
+
+    async def do(self, key, coro_factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.leaders += 1
+        task = asyncio.create_task(coro_factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # 기다리던 호출자가 모두 취소된 경우에도 경고가 남지 않도록 결과를 소비
+
+    def stats(self) -> dict:
+        return {'in_flight': len(self._inflight), 'leaders': self.leaders, 'coalesced': self.coalesced}
+
+
+weather_client = WeatherClient()
+forecast_cache = ForecastCache()
+forecast_flights = SingleFlight()
+geocode_cache = GeocodeCache()
+geocoder = OpenWeatherGeocoder(weather_client)
+geocode_flights = SingleFlight()
+_background_refreshes = {} # city_en -> 진행 중인 백그라운드 갱신 Task
+
+
+async def start_weather_client():
+    forecast_cache.load()
+    await weather_client.start()
+
+
+async def close_weather_client():
+    await weather_prefetcher.stop()
+    for task in list(_background_refreshes.values()):
+        task.cancel()
+    forecast_cache.save()
+    geocode_cache.close()
+    await weather_client.close()
+
+
+async def _fetch_and_store(city_en: str) -> dict:
+    """같은 도시에 대한 동시 호출은 한 번의 API 요청으로 합칩니다."""
+    return await forecast_flights.do(city_en, lambda: _fetch_and_store_once(city_en))
+
+
+async def _fetch_and_store_once(city_en: str) -> dict:
+    data = await weather_client.fetch_forecast(city_en)
+    if data.get("cod") == "200": # 오류 응답은 캐시하지 않음
+        forecast_cache.put(city_en, data)
+        await forecast_cache.save_soon()
+    return data
+
+
+async def _refresh_in_background(city_en: str):
+    try:
+        await _fetch_and_store(city_en)
+        logger.info(f"날씨 캐시 백그라운드 갱신 완료 (도시: {city_en})")
+    except Exception as e:
+        logger.warning(f"날씨 캐시 백그라운드 갱신 실패 (도시: {city_en}): {e}")
+    finally:
+        _background_refreshes.pop(city_en, None)
+
+
+async def get_forecast_data(city_en: str) -> dict:
+    """캐시를 먼저 보고, 필요할 때만 API를 호출해 예보 JSON을 돌려줍니다."""
+    data, fresh = forecast_cache.lookup(city_en)
+    if data is not None and fresh:
+        forecast_cache.hits += 1
+        return data
+    if data is not None:
+        forecast_cache.stale_hits += 1
+        if city_en not in _background_refreshes:
+            _background_refreshes[city_en] = asyncio.create_task(_refresh_in_background(city_en))
+        return data
+    forecast_cache.misses += 1
+    try:
+        return await _fetch_and_store(city_en)
+    except Exception as e:
+        fallback = forecast_cache.peek(city_en)
+        if fallback is None:
+            raise
+        logger.warning(f"날씨 API 실패로 아주 오래된 캐시 값을 대신 사용합니다 (도시: {city_en}, 오류: {type(e).__name__})")
+        return fallback
+
+
+async def _geocode_once(query: str):
+    loop = asyncio.get_running_loop()
+    cached = await loop.run_in_executor(None, geocode_cache.get, query)
+    if cached is NOT_FOUND:
+        return None
+    if cached is not None:
+        return cached
+    place = await geocoder.geocode(query)
+    await loop.run_in_executor(None, geocode_cache.put, query, place)
+    if place is not None:
+        logger.info(f"지오코딩 완료: '{query}' -> {place.name} ({place.lat:.4f}, {place.lon:.4f}, {place.country})")
+    return place
+
+
+async def geocode_city(query: str):
+    """
+    city_map에 없는 도시 이름을 좌표(GeoPlace)로 바꿉니다. 결과는 geocode_cache에 저장되어
+    이후에는 네트워크 없이 바로 돌려줍니다. 찾지 못하거나 오류가 나면 None.
+    """
+    try:
+        return await geocode_flights.do(query.strip().lower(), lambda: _geocode_once(query))
+    except Exception as e:
+        logger.warning(f"지오코딩 실패 ('{query}'): {e}")
+        return None
+
+
+async def forecast_today_async(city_kr: str) -> str:
+    """forecast_today의 비동기 버전. 이벤트 루프를 막지 않습니다."""
+    return await forecast_async(city_kr, "today")
+
+
+async def forecast_async(city_kr: str, intent: str = "today") -> str:
+    """오늘/내일/주간(intent) 예보 문장을 만듭니다. city_map에 없는 도시는 지오코딩합니다."""
+    city_en, precheck_error = _precheck(city_kr)
+    if precheck_error and API_KEY:
+        place = await geocode_city(city_kr)
+        if place is not None:
+            city_en, precheck_error = place.key, None
+    if precheck_error:
+        return precheck_error
+
+    try:
+        data = await get_forecast_data(city_en)
+        return _format_forecast(city_kr, city_en, data, intent)
+
+    except aiohttp.ClientResponseError as http_err:
+        logger.error(f"날씨 API HTTP 오류 (도시: {city_en}, 상태 코드: {http_err.status}): {http_err.message}")
+        return _http_error_reply(city_kr, city_en, http_err.status)
+    except CircuitOpenError:
+        logger.info(f"날씨 API 차단기가 열려 있어 바로 응답합니다 (도시: {city_en})")
+        return f"으음... 날씨 서버가 지금 많이 아픈가 봐. {city_kr} 날씨는 조금 있다가 다시 물어봐줄래, 선생?"
+    except asyncio.TimeoutError:
+        logger.warning(f"날씨 API 요청 시간 초과 (도시: {city_en}, 마감: {weather_client.deadline}초)")
+        return f"끙... {city_kr} 날씨 정보를 가져오는데 너무 오래 걸리네. 서버가 느린가? 잠시 후에 다시 물어봐줘."
+    except aiohttp.ClientError as req_err:
+        logger.error(f"날씨 API 요청 오류 (도시: {city_en}): {req_err}")
+        return f"우웅… {city_kr} 날씨 정보를 요청하는 데 문제가 생겼어. 인터넷 연결을 확인하고 다시 시도해줄래?"
+    except KeyError as key_err:
+        logger.error(f"날씨 API 응답 데이터 형식 오류 (도시: {city_en}): {key_err}")
+        return f"날씨 정보를 받았는데... 내가 모르는 말로 되어있네. {city_kr} 날씨는 나중에 다시 알려줄게, 선생."
+    except Exception as e:
+        logger.error(f"날씨 API 처리 중 알 수 없는 오류 (도시: {city_en}): {e}", exc_info=True)
+        return "우웅… 날씨 정보를 가져오는 데 예상치 못한 문제가 생겼어. 조금 있다가 다시 시도해줄래, 선생?"
+
+
+# --- city_map 전체 미리 받기 (백그라운드 스케줄러) ---
+class WeatherPrefetcher:
+    """
+    city_map의 모든 도시를 interval 동안 고르게 나눠 갱신해서, 사용자 응답이 네트워크를 기다리지 않게 합니다.
+    요청 사이에는 min_spacing 이상 간격을 두고, 동시에 concurrency개까지만 진행합니다.
+    """
+    def __init__(self, interval: float = PREFETCH_INTERVAL, jitter: float = PREFETCH_JITTER,
+                 concurrency: int = PREFETCH_CONCURRENCY, min_spacing: float = PREFETCH_MIN_SPACING):
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.min_spacing = min_spacing
+        self.last_refresh = {} # city_en -> 마지막 성공 시각 (epoch)
+        self.last_error = {}   # city_en -> 마지막 실패 메시지
+        self._task: asyncio.Task = None
+        self._workers = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"날씨 미리 받기 시작 (주기 {self.interval:.0f}초, 흔들림 ±{self.jitter:.0f}초, 동시 {self.concurrency}개)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            for worker in list(self._workers):
+                worker.cancel()
+            await asyncio.gather(self._task, *self._workers, return_exceptions=True)
+            self._task = None
+            logger.info("날씨 미리 받기 중지")
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            cities = list(dict.fromkeys(city_map.values())) # 한 바퀴마다 city_map 변경 반영 (중복 제거)
+            slot = self.interval / max(len(cities), 1)
+            for city_en in cities:
+                worker = asyncio.create_task(self._refresh(city_en, semaphore))
+                self._workers.add(worker)
+                worker.add_done_callback(self._workers.discard)
+                delay = slot + random.uniform(-self.jitter, self.jitter)
+                await asyncio.sleep(max(delay, self.min_spacing))
+
+    async def _refresh(self, city_en: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            fetched_at = forecast_cache.fetched_at(city_en)
+            if fetched_at and time.time() - fetched_at < self.interval / 2:
+                self.last_refresh[city_en] = fetched_at # 최근에 사용자 요청으로 받아둔 값이면 건너뜀
+                return
+            try:
+                data = await _fetch_and_store(city_en)
+                if data.get("cod") == "200":
+                    self.last_refresh[city_en] = time.time()
+                    self.last_error.pop(city_en, None)
+                else:
+                    self.last_error[city_en] = str(data.get("message", data.get("cod")))
+            except Exception as e:
+                self.last_error[city_en] = f"{type(e).__name__}: {e}"
+                logger.warning(f"날씨 미리 받기 실패 (도시: {city_en}): {e}")
+
+    def status(self) -> list:
+        """관리자 명령어용: (한글 도시명, 영문 도시명, 마지막 갱신 시각, 마지막 오류) 목록."""
+        rows = []
+        for city_kr, city_en in city_map.items():
+            refreshed = self.last_refresh.get(city_en) or forecast_cache.fetched_at(city_en)
+            rows.append((city_kr, city_en, refreshed, self.last_error.get(city_en)))
+        return rows
+
+
+weather_prefetcher = WeatherPrefetcher()
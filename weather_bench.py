@@ -0,0 +1,111 @@
+# weather_bench.py
+# 로컬 스텁 서버로 날씨 클라이언트의 지연 시간과 동시 처리량을 오프라인에서 측정합니다.
+# 사용법: python weather_bench.py [--requests 200] [--concurrency 50] [--latency 0.2]
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import web
+
+import weather
+
+
+def make_stub_payload(city_en: str, now: float = None) -> dict:
+    """OpenWeatherMap 5일/3시간 예보 응답과 같은 모양의 가짜 데이터를 만듭니다."""
+    now = int(now or time.time())
+    start = now - now % 10800
+    entries = []
+    for i in range(40): # 5일 * 8개 (3시간 간격)
+        entries.append({
+            'dt': start + i * 10800,
+            'main': {'temp': 10.0 + (i % 8) * 1.5},
+            'weather': [{'description': '맑음' if i % 3 else '구름 조금'}],
+        })
+    return {'cod': '200', 'message': 0, 'cnt': len(entries), 'list': entries,
+            'city': {'name': city_en, 'timezone': 32400}}
+
+
+class StubWeatherServer:
+    """OpenWeatherMap 대신 응답하는 로컬 aiohttp 서버. latency 만큼 기다렸다가 응답합니다."""
+    def __init__(self, latency: float = 0.2, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.hits = 0
+        self._runner = None
+
+    async def _handle(self, request: web.Request):
+        self.hits += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(make_stub_payload(request.query.get('q', 'Seoul')))
+
+    async def _handle_geocode(self, request: web.Request):
+        self.hits += 1
+        await asyncio.sleep(self.latency)
+        query = request.query.get('q', '')
+        return web.json_response([{'name': query, 'local_names': {'ko': query}, 'lat': 37.5, 'lon': 127.0, 'country': 'KR'}])
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/data/2.5/forecast', self._handle)
+        app.router.add_get('/geo/1.0/direct', self._handle_geocode)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/data/2.5/forecast"
+
+    @property
+    def geocode_url(self) -> str:
+        return f"http://{self.host}:{self.port}/geo/1.0/direct"
+
+
+async def run_bench(total: int, concurrency: int, latency: float):
+    async with StubWeatherServer(latency=latency) as server:
+        weather.API_KEY = weather.API_KEY or 'stub-key'
+        weather.weather_client.base_url = server.url
+        weather.weather_client.geocode_url = server.geocode_url
+        weather.forecast_cache.path = None # 벤치마크 결과가 실제 캐시 파일을 덮어쓰지 않도록
+        await weather.start_weather_client()
+
+        cities = list(weather.city_map.keys())
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(i: int):
+            async with semaphore:
+                t0 = time.perf_counter()
+                await weather.forecast_today_async(cities[i % len(cities)])
+                latencies.append(time.perf_counter() - t0)
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - t_start
+        await weather.close_weather_client()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"요청 {total}건 / 동시성 {concurrency} / 스텁 지연 {latency * 1000:.0f}ms")
+    print(f"  총 소요: {elapsed:.2f}s, 처리량: {total / elapsed:.1f} req/s, 서버 도달: {server.hits}건")
+    print(f"  캐시: {weather.forecast_cache.stats()}")
+    print(f"  요청 합치기: {weather.forecast_flights.stats()}")
+    print(f"  지연(ms) 평균 {statistics.mean(latencies) * 1000:.1f} / p50 {statistics.median(latencies) * 1000:.1f} / p95 {p95 * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="날씨 클라이언트 오프라인 벤치마크")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run_bench(args.requests, args.concurrency, args.latency))